@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from importer.models import CachedObject, ExternalList
+from importer.models import CachedObject, ExternalList, FileDownloadState
 
 admin.site.register(CachedObject)
 admin.site.register(ExternalList)
+admin.site.register(FileDownloadState)
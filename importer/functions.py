@@ -144,6 +144,7 @@ def import_update(
     body_id: Optional[str] = None,
     ignore_modified: bool = False,
     download_files: bool = True,
+    time_budget: Optional[datetime.timedelta] = None,
 ) -> None:
     from importer.importer import Importer
     from importer.loader import get_loader_from_body
@@ -159,7 +160,7 @@ def import_update(
         importer.update(body.oparl_id)
         importer.force_singlethread = True
         if download_files:
-            importer.load_files(body.short_name)
+            importer.load_files(body.short_name, time_budget=time_budget)
 
 
 def fix_sort_date(import_date: datetime.datetime):
@@ -13,7 +13,9 @@ from tqdm import tqdm
 from importer import json_datatypes
 from importer.json_datatypes import RisData
 from mainapp import models
+from mainapp.functions.autocomplete_index import update_autocomplete_index
 from mainapp.functions.search import search_bulk_index
+from mainapp.functions.search_cache import bump_search_generation
 from mainapp.models import DefaultFields
 from mainapp.models.file import fallback_date
 from mainapp.models.helper import SoftDeleteModelManager
@@ -414,6 +416,8 @@ def import_data(body: models.Body, ris_data: RisData):
     # flush_model(models.AgendaItem) # It's incremental!
     import_agenda_items(ris_data, consultation_map, meeting_id_map, paper_id_map)
     import_memberships(ris_data)
+    bump_search_generation()
+    update_autocomplete_index()
 
 
 def import_memberships(ris_data: RisData):
@@ -1,7 +1,12 @@
 import logging
 import sys
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from itertools import repeat
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    TimeoutError,
+    as_completed,
+)
+from datetime import timedelta
 from tempfile import NamedTemporaryFile
 from typing import Optional, List, Type, Tuple
 from typing import TypeVar, Any, Set
@@ -12,6 +17,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db import IntegrityError, transaction, DatabaseError
+from django.db.models import Q
 from django.template.defaultfilters import filesizeformat
 from django.utils import timezone
 from django.utils.translation import gettext as _
@@ -23,15 +29,20 @@ from importer import JSON
 from importer.functions import externalize
 from importer.json_to_db import JsonToDb
 from importer.loader import BaseLoader
-from importer.models import CachedObject, ExternalList
+from importer.models import CachedObject, ExternalList, FileDownloadState
+from mainapp.functions.autocomplete_index import update_autocomplete_index
 from mainapp.functions.document_parsing import (
     extract_from_file,
     extract_locations,
     extract_persons,
-    AddressPipeline,
-    create_geoextract_data,
+    get_address_pipeline,
+    get_person_matcher,
+    geocode_new_locations,
 )
-from mainapp.functions.minio import minio_client, minio_file_bucket
+from mainapp.functions.file_previews import create_previews
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.search_cache import bump_search_generation
+from mainapp.functions.storage import get_storage
 from mainapp.models import (
     LegislativeTerm,
     Location,
@@ -50,6 +61,22 @@ from mainapp.models import (
 logger = logging.getLogger(__name__)
 
 
+def get_retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff for failed file downloads"""
+    delay = settings.FILE_DOWNLOAD_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.FILE_DOWNLOAD_MAX_RETRY_DELAY))
+
+
+def record_download_failure(file_id: int, error: str) -> None:
+    state = FileDownloadState.objects.filter(file_id=file_id).first()
+    if not state:
+        state = FileDownloadState(file_id=file_id)
+    state.attempts += 1
+    state.last_error = error
+    state.next_attempt = timezone.now() + get_retry_delay(state.attempts)
+    state.save()
+
+
 class Importer:
     lists = ["paper", "person", "meeting", "organization"]
 
@@ -178,6 +205,9 @@ class Importer:
         for type_class in import_plan:
             self.import_type(type_class, update)
 
+        bump_search_generation()
+        update_autocomplete_index()
+
     def load_bodies(self, single_body_id: Optional[str] = None) -> List[CachedObject]:
         self.fetch_list_initial(self.loader.system["body"])
         if single_body_id:
@@ -351,14 +381,18 @@ class Importer:
         self.import_objects(update=True)
 
     def download_and_analyze_file(
-        self, file_id: int, address_pipeline: AddressPipeline, fallback_city: str
+        self,
+        file_id: int,
+        fallback_city: str,
+        address_pipeline_checksum: Optional[str] = None,
     ) -> bool:
         """
         Downloads and analyses a single file, i.e. extracting text, locations and persons.
 
-        Returns False for http errors on downloading and True otherwise.
+        Returns False for http errors on downloading and True otherwise. Failures are recorded in the
+        download state of the file, so that it is retried only after a backoff.
         """
-        file = File.objects.get(id=file_id)
+        file = File.objects.defer(None).get(id=file_id)
         url = file.get_oparl_url()
 
         with NamedTemporaryFile() as tmp_file:
@@ -374,13 +408,15 @@ class Importer:
                     logger.error(
                         f"File {file.id}: Content type was {content_type}, this seems to be a silent error"
                     )
+                    record_download_failure(file.id, f"Content type was {content_type}")
                     return False
                 file.mime_type = content_type or file.mime_type
                 tmp_file.write(content)
                 tmp_file.file.seek(0)
                 file.filesize = len(content)
-            except RequestException:
+            except RequestException as e:
                 logger.exception(f"File {file.id}: Failed to download {url}")
+                record_download_failure(file.id, f"Failed to download {url}: {e}")
                 return False
 
             logger.debug(
@@ -390,13 +426,15 @@ class Importer:
             )
 
             if not settings.PROXY_ONLY_TEMPLATE:
-                minio_client().put_object(
+                get_storage().put_object(
                     minio_file_bucket,
                     str(file.id),
                     tmp_file.file,
                     file.filesize,
                     content_type=file.mime_type,
                 )
+                if file.mime_type.split(";")[0] == "application/pdf":
+                    file.preview_available = create_previews(file.id, tmp_file.name)
 
             # If the api has text, keep that
             if self.download_files and not file.parsed_text:
@@ -406,7 +444,9 @@ class Importer:
 
         if file.parsed_text:
             locations = extract_locations(
-                file.parsed_text, pipeline=address_pipeline, fallback_city=fallback_city
+                file.parsed_text,
+                pipeline=get_address_pipeline(address_pipeline_checksum),
+                fallback_city=fallback_city,
             )
             file.locations.set(locations)
             persons = extract_persons(
@@ -426,31 +466,92 @@ class Importer:
             file.save()
         except (ElasticsearchException, DatabaseError) as e:
             logger.exception(f"File {file.id}: Failed to save: {e}")
+            record_download_failure(file.id, f"Failed to save: {e}")
             return False
 
+        FileDownloadState.objects.filter(file_id=file.id).delete()
         return True
 
+    def get_files_to_download(self) -> List[int]:
+        """
+        Returns the ids of the files that still need to be downloaded and whose next attempt is due.
+
+        Files of upcoming meetings come first, then files of recent papers, then the rest. Within these groups,
+        files that never failed come before the retries, and newer files before older ones.
+        """
+        now = timezone.now()
+        files = File.objects.filter(
+            filesize__isnull=True, oparl_access_url__isnull=False
+        ).exclude(download_state__next_attempt__gt=now)
+
+        days = timedelta(days=settings.FILE_DOWNLOAD_PRIORITY_DAYS)
+        upcoming_meetings = Meeting.objects.filter(
+            start__gte=now - timedelta(days=1), start__lte=now + days
+        )
+        recent_papers = Paper.objects.filter(sort_date__gte=now - days)
+        papers_of_upcoming_meetings = Paper.objects.filter(
+            consultation__meeting__in=upcoming_meetings
+        )
+
+        # Separate queries are much cheaper than a single query joining all these tables
+        meeting_conditions = [
+            Q(meeting_invitation__in=upcoming_meetings),
+            Q(meeting_auxiliary_files__in=upcoming_meetings),
+            Q(resolution_file__meeting__in=upcoming_meetings),
+            Q(auxiliary_file__meeting__in=upcoming_meetings),
+            Q(paper_main_file__in=papers_of_upcoming_meetings),
+            Q(paper__in=papers_of_upcoming_meetings),
+        ]
+        paper_conditions = [
+            Q(paper_main_file__in=recent_papers),
+            Q(paper__in=recent_papers),
+        ]
+        meeting_files = set()
+        for condition in meeting_conditions:
+            meeting_files.update(files.filter(condition).values_list("id", flat=True))
+        paper_files = set()
+        for condition in paper_conditions:
+            paper_files.update(files.filter(condition).values_list("id", flat=True))
+
+        def priority(file: Tuple[int, Optional[int]]) -> Tuple[int, int, int]:
+            file_id, attempts = file
+            if file_id in meeting_files:
+                group = 0
+            elif file_id in paper_files:
+                group = 1
+            else:
+                group = 2
+            return group, attempts or 0, -file_id
+
+        candidates = files.values_list("id", "download_state__attempts")
+        return [file_id for file_id, _ in sorted(candidates, key=priority)]
+
     def load_files(
-        self, fallback_city: str, max_workers: Optional[int] = None
+        self,
+        fallback_city: str,
+        max_workers: Optional[int] = None,
+        time_budget: Optional[timedelta] = None,
     ) -> Tuple[int, int]:
         """Downloads and analyses the actual file for the file entries in the database.
 
-        Returns the number of successful and failed files"""
+        With a time budget, no new files are started once it is used up; the remaining files are left for the next
+        run. Returns the number of successful and failed files"""
+        start = timezone.now()
         # This is partially bound by waiting on external resources, but mostly very cpu intensive,
         # so we can spawn a bunch of processes to make this a lot faster.
         # We need to build a list because mysql connections and process pools don't pair well.
-        files = list(
-            File.objects.filter(filesize__isnull=True, oparl_access_url__isnull=False)
-            .order_by("-id")
-            .values_list("id", flat=True)
-        )
+        files = self.get_files_to_download()
         logger.info("Downloading and analysing {} files".format(len(files)))
-        address_pipeline = AddressPipeline(create_geoextract_data())
+        # This builds and persists the address pipeline snapshot, which the workers load on startup
+        address_pipeline = get_address_pipeline()
+        # Build the person matcher before forking so that the workers inherit it
+        get_person_matcher()
         pbar = None
         if sys.stdout.isatty() and not settings.TESTING:
             pbar = tqdm(total=len(files))
         failed = 0
         successful = 0
+        skipped = 0
 
         if not self.force_singlethread:
             # We need to close the database connections, which will be automatically reopen for
@@ -459,22 +560,55 @@ class Importer:
             # and https://brobin.me/blog/2017/05/mutiprocessing-in-python-django-management-commands/
             db.connections.close_all()
 
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                for succeeded in executor.map(
-                    self.download_and_analyze_file,
-                    files,
-                    repeat(address_pipeline),
-                    repeat(fallback_city),
-                ):
-                    if not succeeded:
-                        failed += 1
-                    if pbar:
-                        pbar.update()
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=get_address_pipeline,
+                initargs=(address_pipeline.checksum,),
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        self.download_and_analyze_file,
+                        file,
+                        fallback_city,
+                        address_pipeline.checksum,
+                    )
+                    for file in files
+                ]
+                timeout = None
+                if time_budget:
+                    timeout = max(
+                        (start + time_budget - timezone.now()).total_seconds(), 0
+                    )
+                finished = set()
+                try:
+                    for future in as_completed(futures, timeout=timeout):
+                        finished.add(future)
+                        if future.result():
+                            successful += 1
+                        else:
+                            failed += 1
+                        if pbar:
+                            pbar.update()
+                except TimeoutError:
+                    # Files that are already being processed are finished
+                    for future in futures:
+                        if future in finished:
+                            continue
+                        if future.cancel():
+                            skipped += 1
+                        elif future.result():
+                            successful += 1
+                        else:
+                            failed += 1
 
         else:
             for file in files:
+                if time_budget is not None and timezone.now() >= start + time_budget:
+                    skipped = len(files) - successful - failed
+                    break
+
                 succeeded = self.download_and_analyze_file(
-                    file, address_pipeline, fallback_city
+                    file, fallback_city, address_pipeline.checksum
                 )
 
                 if not succeeded:
@@ -489,5 +623,14 @@ class Importer:
 
         if failed > 0:
             logger.error("{} files failed to download".format(failed))
+        if skipped > 0:
+            logger.info(
+                "The time budget was used up, {} files are left for the next run".format(
+                    skipped
+                )
+            )
+
+        geocode_new_locations(start)
+        bump_search_generation()
 
         return successful, failed
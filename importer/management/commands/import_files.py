@@ -1,7 +1,13 @@
 import logging
+from datetime import timedelta
+
+from django.utils import timezone
 
 from importer.management.commands._import_base_command import ImportBaseCommand
-from mainapp.functions.document_parsing import AddressPipeline, create_geoextract_data
+from mainapp.functions.document_parsing import (
+    get_address_pipeline,
+    geocode_new_locations,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,16 +23,22 @@ class Command(ImportBaseCommand):
             type=int,
             help="Use only that many processes for the import",
         )
+        parser.add_argument(
+            "--time-budget",
+            type=int,
+            help="Stop starting new downloads after that many minutes. The remaining files are left for the next run",
+        )
 
     def handle(self, *args, **options):
         importer, body = self.get_importer(options)
         logger.info(f"Using '{body.short_name}' as geotagging city")
         if options["ids"]:
-            address_pipeline = AddressPipeline(create_geoextract_data())
+            start = timezone.now()
+            address_pipeline = get_address_pipeline()
             failed = 0
             for file in options["ids"]:
                 succeeded = importer.download_and_analyze_file(
-                    file, address_pipeline, body.short_name
+                    file, body.short_name, address_pipeline.checksum
                 )
 
                 if not succeeded:
@@ -34,7 +46,14 @@ class Command(ImportBaseCommand):
 
             if failed > 0:
                 logger.error("{} files failed to download".format(failed))
+
+            geocode_new_locations(start)
         else:
+            time_budget = None
+            if options["time_budget"]:
+                time_budget = timedelta(minutes=options["time_budget"])
             importer.load_files(
-                max_workers=options["max_workers"], fallback_city=body.short_name
+                max_workers=options["max_workers"],
+                fallback_city=body.short_name,
+                time_budget=time_budget,
             )
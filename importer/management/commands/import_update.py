@@ -1,4 +1,5 @@
 import logging
+from datetime import timedelta
 
 from importer.functions import import_update
 from importer.management.commands._import_base_command import ImportBaseCommand
@@ -12,9 +13,21 @@ class Command(ImportBaseCommand):
     Uses all imported bodies with an oparl id unless `--body` is specified.
     """
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--time-budget",
+            type=int,
+            help="Stop starting new file downloads after that many minutes. The remaining files are left for the next run",
+        )
+
     def handle(self, *args, **options):
+        time_budget = None
+        if options["time_budget"]:
+            time_budget = timedelta(minutes=options["time_budget"])
         import_update(
             options["body"],
             ignore_modified=options["ignore_modified"],
             download_files=not options["skip_download"],
+            time_budget=time_budget,
         )
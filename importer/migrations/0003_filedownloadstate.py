@@ -0,0 +1,25 @@
+# Generated by Django 3.1.12 on 2026-10-19 03:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0033_file_preview_available'),
+        ('importer', '0002_auto_20190108_2242'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileDownloadState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('next_attempt', models.DateTimeField(db_index=True)),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='download_state', to='mainapp.file')),
+            ],
+        ),
+    ]
@@ -26,3 +26,22 @@ class CachedObject(models.Model):
 
     def __str__(self):
         return "{}: {} ({})".format(self.oparl_type, self.url, self.to_import)
+
+
+class FileDownloadState(models.Model):
+    """
+    Tracks the failed downloads of a file, so that broken files are retried with exponential backoff
+    instead of on every run. Deleted once the download succeeded.
+    """
+
+    file = models.OneToOneField(
+        File, on_delete=models.CASCADE, related_name="download_state"
+    )
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    next_attempt = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return "File {}: {} failed attempts, next at {}".format(
+            self.file_id, self.attempts, self.next_attempt
+        )
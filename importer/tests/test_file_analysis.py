@@ -1,5 +1,5 @@
 # In[]
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from unittest import mock
 
 from django.test import TestCase
@@ -22,10 +22,14 @@ def geocode(search_str: str) -> Optional[Dict[str, Any]]:
     raise AssertionError(search_str)
 
 
+def query_geocoders(search_str: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    return geocode(search_str), "mock"
+
+
 class TestFileAnalysis(TestCase):
     fixtures = ["file-analysis"]
 
-    @mock.patch("mainapp.functions.document_parsing.geocode", new=geocode)
+    @mock.patch("mainapp.functions.geo_functions.query_geocoders", new=query_geocoders)
     @mock.patch("mainapp.functions.minio._minio_singleton", new=MinioMock())
     def test_file_analysis(self):
         loader = MockLoader()
@@ -0,0 +1,92 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from importer.importer import Importer
+from importer.models import FileDownloadState
+from importer.tests.test_file_analysis import download_url
+from importer.tests.utils import MockLoader
+from mainapp.models import Body, File, Meeting, Paper
+from mainapp.tests.utils import MinioMock
+
+
+@mock.patch("mainapp.functions.minio._minio_singleton", new=MinioMock())
+class TestFileDownloads(TestCase):
+    fixtures = ["file-analysis"]
+
+    def test_backoff(self):
+        [body] = Body.objects.all()
+        [file] = File.objects.all()
+        loader = MockLoader()
+        loader.files[download_url] = (b"<html></html>", "text/html")
+        importer = Importer(loader, force_singlethread=True)
+
+        self.assertEqual(importer.load_files(body.short_name), (0, 1))
+        state = FileDownloadState.objects.get(file=file)
+        self.assertEqual(state.attempts, 1)
+        self.assertEqual(state.last_error, "Content type was text/html")
+        delay = state.next_attempt - timezone.now()
+        self.assertTrue(timedelta(minutes=59) < delay <= timedelta(hours=1))
+
+        # The next attempt isn't due yet
+        self.assertEqual(importer.get_files_to_download(), [])
+        self.assertEqual(importer.load_files(body.short_name), (0, 0))
+
+        state.next_attempt = timezone.now()
+        state.save()
+        self.assertEqual(importer.load_files(body.short_name), (0, 1))
+        state = FileDownloadState.objects.get(file=file)
+        self.assertEqual(state.attempts, 2)
+        delay = state.next_attempt - timezone.now()
+        self.assertTrue(timedelta(minutes=119) < delay <= timedelta(hours=2))
+
+        state.next_attempt = timezone.now()
+        state.save()
+        loader.files[download_url] = (b"The text", "text/plain")
+        self.assertEqual(importer.load_files(body.short_name), (1, 0))
+        self.assertFalse(FileDownloadState.objects.exists())
+        self.assertEqual(File.objects.get(id=file.id).filesize, 8)
+
+    def test_priority(self):
+        [old_file] = File.objects.all()
+        now = timezone.now()
+
+        def make_file(name: str) -> File:
+            return File.objects.create(
+                name=name, filename=name, oparl_access_url=download_url
+            )
+
+        invitation = make_file("invitation.pdf")
+        Meeting.objects.create(
+            name="Meeting",
+            short_name="Meeting",
+            start=now + timedelta(days=2),
+            invitation=invitation,
+        )
+        paper_file = make_file("paper.pdf")
+        paper = Paper.objects.create(
+            name="Paper", short_name="Paper", sort_date=now - timedelta(days=3)
+        )
+        paper.files.add(paper_file)
+        new_file = make_file("new.pdf")
+        failed_file = make_file("failed.pdf")
+        FileDownloadState.objects.create(file=failed_file, attempts=1, next_attempt=now)
+
+        importer = Importer(MockLoader(), force_singlethread=True)
+        self.assertEqual(
+            importer.get_files_to_download(),
+            [invitation.id, paper_file.id, new_file.id, old_file.id, failed_file.id],
+        )
+
+    def test_time_budget(self):
+        [body] = Body.objects.all()
+        loader = MockLoader()
+        loader.files[download_url] = (b"The text", "text/plain")
+        importer = Importer(loader, force_singlethread=True)
+
+        self.assertEqual(
+            importer.load_files(body.short_name, time_budget=timedelta(0)), (0, 0)
+        )
+        self.assertEqual(len(importer.get_files_to_download()), 1)
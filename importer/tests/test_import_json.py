@@ -126,7 +126,8 @@ def test_import_json(send_mail_function):
     # Check that the notification was sent
     elasticsearch_mock = ElasticsearchMock(
         {
-            "importer/test-data/notification_request.json": "importer/test-data/notification_response.json"
+            "importer/test-data/notification_request.json": "importer/test-data/notification_response.json",
+            "importer/test-data/notification_file_text_request.json": "importer/test-data/notification_file_text_response.json",
         }
     )
     if is_es_online():
@@ -72,7 +72,7 @@ class TestImporter(TestCase):
         self.assertEqual(paper.short_name, "RflEttÜAÜG")
         self.assertTrue(paper.deleted)
 
-    @mock.patch("mainapp.functions.document_parsing.geocode", new=geocode)
+    @mock.patch("importer.json_to_db.geocode", new=geocode)
     def test_location(self):
         location = Location()
         libobject = self.api_data["https://oparl.example.org/location/0"]
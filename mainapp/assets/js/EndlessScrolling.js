@@ -1,3 +1,5 @@
+import {renderResults} from "./SearchResults";
+
 /**
  * Endless scrolling for search results
  * https://stackoverflow.com/a/4842226/3549270
@@ -6,14 +8,34 @@ export default class EndlessScrolling {
     constructor($button) {
         this.loadFurtherHeight = 500;
         this.$button = $button;
+        this.cursor = $button.data("cursor");
+        this.typeNames = $("#detailed-searchform").data("type-names");
         this.reset();
         this.$target = $("#endless-scroll-target");
         this.$button.click(this.activate.bind(this));
     }
 
-    retarget($newBtn) {
-        this.$button = $newBtn;
-        this.$button.click(this.activate.bind(this));
+    // Called from FacettedSearch.js with the first page of a new search
+    update(url, data) {
+        this.reset();
+        this.$button.data("url", url);
+        this.cursor = data["next_cursor"];
+
+        this.$target.empty().append(renderResults(data["results"], this.typeNames));
+        let total = data["total_results"];
+        let totalText = (total["relation"] === "eq" ? "" : this.$button.data("over-text")) + total["value"];
+        this.$button.find(".total-hits").text(totalText);
+        if (total["value"] === data["results"].length) {
+            this.$button.attr("hidden", "hidden");
+        } else {
+            this.$button.removeAttr("hidden");
+        }
+        let $nothingFound = $("#results-section .nothing-found");
+        if (data["results"].length > 0) {
+            $nothingFound.attr("hidden", "hidden");
+        } else {
+            $nothingFound.removeAttr("hidden");
+        }
     }
 
     activate() {
@@ -27,15 +49,21 @@ export default class EndlessScrolling {
         if (this.isLoading || !this.isActive) {
             return;
         }
+        if (!this.cursor) {
+            this.isActive = false;
+            return;
+        }
 
         if ($(window).scrollTop() >= $(document).height() - $(window).height() - this.loadFurtherHeight) {
             this.isLoading = true;
-            let url = this.$button.data("url") + "?after=" + this.$target.find("> li").length;
+            // The cursor is an opaque token from the server that marks the end of the previous page
+            let url = this.$button.data("url") + "?cursor=" + encodeURIComponent(this.cursor);
             $.get(url, (data) => {
-                let $data = $(data["results"]);
-                if ($data.length > 0) {
-                    $("#endless-scroll-target").append($data.find("> li"));
-                } else {
+                this.cursor = data["next_cursor"];
+                if (data["results"].length > 0) {
+                    this.$target.append(renderResults(data["results"], this.typeNames));
+                }
+                if (data["results"].length === 0 || !this.cursor) {
                     this.isActive = false;
                 }
                 this.isLoading = false;
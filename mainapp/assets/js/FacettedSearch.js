@@ -72,27 +72,15 @@ export default class FacettedSearch {
         return params;
     }
 
-    static updateEndlessScroll(data) {
-        // noinspection JSJQueryEfficiency
-        let endlessScroll = $("#start-endless-scroll").data('widget');
-        let $data = $(data['results']);
-        // Replace the complete search results section with the new content
-        $("#results-section").html($data);
-        // noinspection JSJQueryEfficiency
-        let $newBtn = $("#start-endless-scroll");
-        endlessScroll.reset();
-        endlessScroll.retarget($newBtn);
-        $newBtn.data("widget", endlessScroll);
-    }
-
     updateSearchResults(querystring) {
-        let url = this.$form.data("results-only-url").slice(0, -1) + querystring + "/";
+        let url = this.$form.data("api-url").slice(0, -1) + querystring + "/";
         $.get(url, (data) => {
             if (querystring !== this.currentQueryString) {
                 // This request probably had too much latency and there is another request going on (or completed) already
                 return;
             }
-            FacettedSearch.updateEndlessScroll(data);
+            // The results are rendered from the json by the endless scrolling, which then loads the next pages
+            $("#start-endless-scroll").data("widget").update(url, data);
 
             // Outside of the form to prevent nested forms
             $(".subscribe-widget").html(data['subscribe_widget']);
@@ -70,6 +70,13 @@ export default class IndexView {
         let paperName = IndexView.escapeHtml(paper.name);
         let paperHtml = '<a href="' + paper.url + '" title="' + paperName + '">' + paperName + '</a>';
 
+        let thumbnail = '';
+        let fileWithThumbnail = paper.files.find((file) => file.thumbnail_url);
+        if (fileWithThumbnail) {
+            thumbnail = '<a href="' + fileWithThumbnail.url + '" class="thumbnail"><img src="' +
+                fileWithThumbnail.thumbnail_url + '" alt=""></a>';
+        }
+
         let files = '';
         for (let i = 0; i < paper.files.length && i < 2; i++) {
             let fileUrl = paper.files[i].url + '?pdfjs_search=' + encodeURIComponent(location.name) + '&pdfjs_phrase=true';
@@ -84,7 +91,7 @@ export default class IndexView {
 
         let contentHtml = '<div class="type-address"><div class="type">' + IndexView.escapeHtml(paper.type) + '</div>' +
             '<div class="address">' + IndexView.escapeHtml(location.name) + '</div></div>' +
-            '<div class="paper-title">' + paperHtml + '</div>' +
+            '<div class="paper-title">' + paperHtml + '</div>' + thumbnail +
             '<ul class="files">' + files + '</ul>';
         marker.bindPopup(contentHtml, {className: 'file-location', minWidth: 200});
         clusterGroup.addLayer(marker);
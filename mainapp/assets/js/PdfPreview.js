@@ -0,0 +1,25 @@
+/**
+ * Shows the image of the first page instead of the pdf viewer on small screens, so that the pdf is only downloaded
+ * when the user asks for it. Larger screens get the pdf viewer right away.
+ */
+export default class PdfPreview {
+    constructor($widget) {
+        this.$widget = $widget;
+
+        if (window.matchMedia("(min-width: 768px)").matches) {
+            this.showViewer();
+        } else {
+            this.$widget.click((event) => {
+                event.preventDefault();
+                this.showViewer();
+            });
+        }
+    }
+
+    showViewer() {
+        let $iframe = $("<iframe class='embed-responsive-item' aria-describedby='pdf_parsed_text'></iframe>");
+        $iframe.attr("src", this.$widget.attr("href"));
+        $iframe.attr("aria-label", this.$widget.data("iframe-label"));
+        this.$widget.replaceWith($iframe);
+    }
+}
@@ -0,0 +1,55 @@
+/**
+ * Renders the results of the search api like partials/mixed_results.html
+ */
+
+// Keep in sync with: partials/type_to_fa_icon.html
+const TYPE_ICONS = {
+    "committee": "fa-users",
+    "department": "fa-users",
+    "organization": "fa-users",
+    "file": "fa-file-text-o",
+    "meeting": "fa-calendar-o",
+    "paper": "fa-file-o",
+    "person": "fa-user-o",
+};
+
+export function renderResult(result, typeNames) {
+    // name, reference_number and highlight are already escaped by the server
+    let $li = $("<li>").addClass("clearfix result result-type-" + result["type"]);
+    let $container = $("<div>").addClass("py-2 container");
+    $li.append($("<a>").attr("href", result["url"]).addClass("no-link-color").append($container));
+
+    if (result["thumbnail_url"]) {
+        $container.append($("<img>").addClass("result-thumbnail")
+            .attr({"src": result["thumbnail_url"], "alt": "", "loading": "lazy"}));
+    }
+
+    let $name = $("<div>").addClass("lead font-weight-normal").html(result["name"].replace(/\n/g, "<br>"));
+    $name.attr("title", $name.text());
+    $container.append($name);
+
+    let $small = $("<div>").addClass("text-truncate results-small");
+    $small.append($("<span>").addClass("fa fa-fw fa-1x result-icon")
+        .addClass(TYPE_ICONS[result["type"]] || "fa-question-o").attr("aria-hidden", "true"));
+    // The spaces separate the spans like the whitespace in the template
+    $small.append(" ", $("<span>").text(typeNames[result["type"]]));
+    if (result["reference_number"]) {
+        $small.append(" ", $("<span>").text("|"), " ", $("<span>").html(result["reference_number"]));
+    }
+    if (result["legal_date"]) {
+        $small.append(" ", $("<span>").text("|"), " ", $("<span>").text(result["legal_date"]));
+    } else if (result["display_date"]) {
+        let $date = $("<span>").text(" " + result["display_date"]).prepend($("<i>").addClass("fa fa-calendar"));
+        $small.append(" ", $("<span>").text("|"), " ", $date);
+    }
+    $container.append($small);
+
+    if (result["highlight"]) {
+        $container.append($("<div>").addClass("results-small").html(result["highlight"]));
+    }
+    return $li;
+}
+
+export function renderResults(results, typeNames) {
+    return results.map((result) => renderResult(result, typeNames));
+}
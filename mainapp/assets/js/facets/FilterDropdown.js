@@ -75,17 +75,39 @@ export default class FacetFilterDropdown {
         $button.prop("disabled", false);
         $filter_list.find(".filter-item").attr("hidden", "hidden");
 
-        if (data['facets'][this.key].length === 0) {
+        if (data['new_facets'][this.key]['count'] === 0) {
             if (!this.$input.val()) {
                 $button.prop("disabled", true);
             }
             return;
         }
-        for (let bucket_entry of data['facets'][this.key]) {
-            let $obj = $filter_list.find("[data-id=" + bucket_entry[0] + "]");
-            $obj.find(".facet-item-count").text(bucket_entry[1]);
-            $obj.removeAttr("hidden");
+        // Only the items with results are rendered, so items for new results need to be added
+        for (let item of data['new_facets'][this.key]['list']) {
+            let $obj = $filter_list.find("[data-id=" + item['id'] + "]");
+            if ($obj.length === 0) {
+                this.addItem($filter_list, item);
+                continue;
+            }
+            $obj.find(".facet-item-count").text(item['doc_count']);
+            if (item['doc_count'] > 0) {
+                $obj.removeAttr("hidden");
+            }
+        }
+        this.filterlist.reIndex();
+        this.filterlist.sort('name', {order: "asc"});
+    }
+
+    addItem($filter_list, item) {
+        let $item = $("<a class='dropdown-item filter-item' href='#' role='button'></a>");
+        $item.attr("data-id", item['id']);
+        $item.append($("<span class='name sort'></span>").text(item['name']));
+        $item.append($("<span class='facet-item-count badge badge-secondary'></span>").text(" " + item['doc_count']));
+        if (item['doc_count'] === 0) {
+            $item.attr("hidden", "hidden");
         }
+        $item.click(this.itemSelected.bind(this));
+        $filter_list.append($item);
+        this.$items = this.$items.add($item);
     }
 
     setFromQueryString(params) {
@@ -10,6 +10,7 @@ import EndlessScrolling from "./EndlessScrolling";
 import MultiListFilter from "./MultiListFilter";
 import LocationDropdown from "./LocationDropdown";
 import PgpUi from "./pgp-ui";
+import PdfPreview from "./PdfPreview";
 
 import trapMice from "./mousetrap";
 // Force loading these images, as they are not referenced in the stylesheet but required by the JS library
@@ -34,7 +35,8 @@ let REGISTERED_CLASSES = {
     "#start-endless-scroll": EndlessScrolling,
     ".multi-list-filter": MultiListFilter,
     ".location-dropdown": LocationDropdown,
-    "#select-pgp-key-box": PgpUi
+    "#select-pgp-key-box": PgpUi,
+    ".js-pdf-preview": PdfPreview
 };
 
 // initialize everything
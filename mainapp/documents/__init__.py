@@ -1,4 +1,5 @@
 from .file import FileDocument
+from .file_text import FileTextDocument
 from .meeting import MeetingDocument
 from .organization import OrganizationDocument
 from .paper import PaperDocument
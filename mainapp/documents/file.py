@@ -12,10 +12,7 @@ class FileDocument(Document):
     coordinates = GeoPointField(attr="coordinates")
     person_ids = IntegerField(attr="person_ids")
     description = TextField(attr="description", analyzer=text_analyzer)
-    # Elasticsearch wants `index_options: "offsets"` for the highlighter for large texts
-    parsed_text = TextField(
-        attr="parsed_text", analyzer=text_analyzer, index_options="offsets"
-    )
+    # The parsed text is in its own index, see FileTextDocument
 
     def get_queryset(self):
         return (
@@ -39,4 +36,5 @@ class FileDocument(Document):
             "created",
             "modified",
             "sort_date",
+            "preview_available",
         ]
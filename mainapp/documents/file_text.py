@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db.models import QuerySet
+from django_elasticsearch_dsl import Document, TextField
+from django_elasticsearch_dsl.registries import registry
+
+from mainapp.documents.index import text_analyzer
+from mainapp.models import File
+
+
+@registry.register_document
+class FileTextDocument(Document):
+    """
+    The parsed text of the files, which is much larger than all other fields together.
+
+    It has its own index, so that changing the metadata of a file doesn't reindex the text and searches that don't
+    look at the text don't have to go through it. The documents have the same ids as the files, and the search
+    joins them with the files by id (see MainappSearch.search_file_texts). `modified` is File.modified, so the
+    notifications can filter the texts like the other documents, and `sort_date` is for sorting the text matches
+    by date.
+    """
+
+    # Elasticsearch wants `index_options: "offsets"` for the highlighter for large texts,
+    # and the term vectors for the fast vector highlighter
+    parsed_text = TextField(
+        attr="parsed_text",
+        analyzer=text_analyzer,
+        index_options="offsets",
+        term_vector="with_positions_offsets",
+    )
+
+    def get_queryset(self):
+        return File.objects.only("id", "modified", "sort_date", "parsed_text").order_by(
+            "id"
+        )
+
+    def update(self, thing, refresh=None, action="index", **kwargs):
+        if action == "index":
+            if isinstance(thing, QuerySet):
+                # The parsed text is deferred by default
+                thing = thing.only("id", "modified", "sort_date", "parsed_text")
+            elif (
+                isinstance(thing, File) and "parsed_text" in thing.get_deferred_fields()
+            ):
+                # The text wasn't loaded, so it can't have changed, but the dates may have
+                return self.update_dates(thing, refresh)
+        return super().update(thing, refresh=refresh, action=action, **kwargs)
+
+    def update_dates(self, file: File, refresh=None):
+        """A partial update that doesn't need the text. Files that aren't indexed yet are skipped"""
+        params = {} if refresh is None else {"refresh": refresh}
+        return self._get_connection().update(
+            index=self._index._name,
+            id=file.pk,
+            body={"doc": {"modified": file.modified, "sort_date": file.sort_date}},
+            ignore=404,
+            **params,
+        )
+
+    class Index:
+        name = settings.ELASTICSEARCH_PREFIX + "-file-text"
+
+    class Django:
+        model = File
+        queryset_pagination = settings.ELASTICSEARCH_QUERYSET_PAGINATION
+
+        fields = ["modified", "sort_date"]
@@ -0,0 +1,162 @@
+"""
+Local prefix index for the autocomplete of persons, organizations and the reference numbers of papers.
+
+Those make up most of the suggestions, so instead of asking elasticsearch on every keystroke, they are looked up in
+sorted lists of keys, where all keys starting with the entered text are a contiguous range that's found with a binary
+search. The index is built after every import (or by the first request after the search generation changed) and
+stored in the django cache, so that all web workers share it. Elasticsearch is only queried for the document titles.
+"""
+
+import logging
+import re
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from mainapp.functions.search_cache import get_search_generation
+
+logger = logging.getLogger(__name__)
+
+index_key = "autocomplete-index"
+
+# The generation the index was built for and the index
+_index: Tuple[Optional[float], Optional["AutocompleteIndex"]] = (None, None)
+
+
+def normalize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.casefold())
+
+
+def normalize_reference_number(text: str) -> str:
+    return re.sub(r"\s+", "", text.casefold())
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        # (document type, name, url)
+        self.suggestions: List[Tuple[str, str, str]] = []
+        # (word, position in suggestions) for the names of persons and organizations
+        self.words: List[Tuple[str, int]] = []
+        # (reference number, position in suggestions) for the papers
+        self.reference_numbers: List[Tuple[str, int]] = []
+
+    def add_name(self, doc_type: str, name: str, url: str, words_of: str):
+        position = len(self.suggestions)
+        self.suggestions.append((doc_type, name, url))
+        for word in set(normalize(words_of)):
+            self.words.append((word, position))
+
+    def add_reference_number(self, name: str, url: str, reference_number: str):
+        position = len(self.suggestions)
+        self.suggestions.append(("paper", name, url))
+        self.reference_numbers.append(
+            (normalize_reference_number(reference_number), position)
+        )
+
+    def finish(self):
+        self.words.sort()
+        self.reference_numbers.sort()
+
+    @staticmethod
+    def prefix_range(
+        keys: List[Tuple[str, int]], prefix: str, limit: Optional[int]
+    ) -> Iterator[int]:
+        """Yields the positions of all keys starting with prefix"""
+        index = bisect_left(keys, (prefix,))
+        found = 0
+        while index < len(keys) and keys[index][0].startswith(prefix):
+            yield keys[index][1]
+            index += 1
+            found += 1
+            if limit and found >= limit:
+                break
+
+    def suggest(self, query: str, limit_per_type: int = 5) -> List[Dict[str, str]]:
+        """
+        Persons and organizations match if every entered word is the beginning of a word in their name,
+        papers match if their reference number starts with the query.
+        """
+        words = normalize(query)
+        if not words:
+            return []
+
+        positions: Optional[Set[int]] = None
+        for word in words:
+            matches = set(self.prefix_range(self.words, word, None))
+            positions = matches if positions is None else positions & matches
+
+        reference_number = normalize_reference_number(query)
+        paper_positions = self.prefix_range(
+            self.reference_numbers, reference_number, limit_per_type
+        )
+
+        results = []
+        counts = {"person": 0, "organization": 0}
+        for position in sorted(positions):
+            doc_type, name, url = self.suggestions[position]
+            if counts[doc_type] < limit_per_type:
+                results.append({"name": name, "url": url, "type": doc_type})
+                counts[doc_type] += 1
+        for position in paper_positions:
+            doc_type, name, url = self.suggestions[position]
+            results.append({"name": name, "url": url, "type": doc_type})
+        return results
+
+
+def build_autocomplete_index() -> AutocompleteIndex:
+    from mainapp.models import Body, Organization, Paper, Person
+
+    index = AutocompleteIndex()
+    for person in Person.objects.order_by("name").only("id", "name"):
+        if person.name:
+            url = reverse("person", args=[person.id])
+            index.add_name("person", person.name, url, person.name)
+
+    multibody = Body.objects.count() > 1
+    organizations = Organization.objects.order_by("name").select_related("body")
+    for organization in organizations:
+        if not organization.name:
+            continue
+        if multibody and organization.body:
+            name = organization.name + " (" + organization.body.name + ")"
+        else:
+            name = organization.name
+        url = reverse("organization", args=[organization.id])
+        index.add_name("organization", name, url, organization.name)
+
+    papers = Paper.objects.exclude(reference_number__isnull=True).exclude(
+        reference_number=""
+    )
+    for paper in papers.only("id", "name", "reference_number"):
+        name = paper.name + " (" + paper.reference_number + ")"
+        url = reverse("paper", args=[paper.id])
+        index.add_reference_number(name, url, paper.reference_number)
+
+    index.finish()
+    return index
+
+
+def update_autocomplete_index():
+    """Called after an import, so that the web workers don't have to build the index themselves"""
+    generation = get_search_generation()
+    index = build_autocomplete_index()
+    cache.set(index_key, (generation, index), None)
+    logger.info(f"Built the autocomplete index with {len(index.suggestions)} entries")
+
+
+def get_autocomplete_index() -> AutocompleteIndex:
+    global _index
+    generation = get_search_generation()
+    if _index[0] == generation:
+        return _index[1]
+
+    cached = cache.get(index_key)
+    if cached and cached[0] == generation:
+        index = cached[1]
+    else:
+        index = build_autocomplete_index()
+        cache.set(index_key, (generation, index), None)
+    _index = (generation, index)
+    return index
@@ -0,0 +1,500 @@
+"""
+Search on the database for installations without elasticsearch (ELASTICSEARCH_ENABLED=False).
+
+DatabaseSearch has the interface of MainappSearch and returns responses in the format of elasticsearch, so that the
+views, the feeds and the notifications work unchanged. On MySQL/MariaDB, the search terms are matched with
+MATCH ... AGAINST on the FULLTEXT indexes that `./manage.py setup` creates. On other databases, e.g. SQLite for tiny
+installations, every word must be contained in one of the fields. The results are ranked, filtered and counted for
+the facets like elasticsearch does it, except that searching by location isn't supported.
+"""
+
+import re
+from datetime import date, datetime, time, timezone
+from functools import reduce
+from operator import or_
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, FloatField, Func, Model, Q, QuerySet, Value
+from django.utils.translation import gettext
+
+from mainapp.functions.search import (
+    DOCUMENT_TYPES,
+    MainappSearch,
+    get_document_indices,
+)
+from mainapp.functions.search_cache import cached_search
+from mainapp.models import File, Meeting, Organization, Paper, Person
+
+
+class SearchedModel(NamedTuple):
+    model: Type[Model]
+    # The text fields that are searched, which are also the columns of the FULLTEXT index
+    fields: List[str]
+    # The date filters look at these fields
+    date_fields: List[str]
+    sort_field: str
+    # The relations for the person and the organization facet, which can match an object more than once
+    person_field: Optional[str]
+    organization_field: Optional[str]
+    # The fields that are returned like the _source of elasticsearch
+    source: List[str]
+
+
+# Mirrors the fields of the elasticsearch documents
+SEARCHED_MODELS = {
+    "file": SearchedModel(
+        File,
+        ["name", "filename", "description", "parsed_text"],
+        [],
+        "sort_date",
+        "mentioned_persons",
+        None,
+        ["id", "name", "preview_available"],
+    ),
+    "meeting": SearchedModel(
+        Meeting, ["name", "short_name"], ["start"], "start", None, None, ["id", "name"]
+    ),
+    "paper": SearchedModel(
+        Paper,
+        ["name", "short_name", "reference_number"],
+        ["legal_date"],
+        "sort_date",
+        "persons",
+        "organizations",
+        ["id", "name", "legal_date", "reference_number", "display_date"],
+    ),
+    "organization": SearchedModel(
+        Organization,
+        ["name", "short_name"],
+        ["start"],
+        "start",
+        None,
+        None,
+        ["id", "name"],
+    ),
+    "person": SearchedModel(
+        Person,
+        ["name", "given_name", "family_name"],
+        [],
+        "created",
+        None,
+        "membership__organization",
+        ["id", "name"],
+    ),
+}
+
+# The same as the indices_boost of MainappSearch
+SCORE_BOOSTS = {"person": 4, "organization": 4, "paper": 2}
+
+# The sort value and the id of the last result of a type on the previous pages
+Keyset = Tuple[Any, int]
+
+# MySQL ignores shorter words in the FULLTEXT index (innodb_ft_min_token_size)
+MIN_FULLTEXT_WORD_LENGTH = 3
+
+
+class MatchAgainst(Func):
+    """MATCH ... AGAINST of MySQL/MariaDB, which needs a FULLTEXT index over exactly these columns"""
+
+    output_field = FloatField()
+
+    def __init__(self, *fields: str, query: str):
+        super().__init__(*fields)
+        self.query = query
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(
+            compiler, connection, template="MATCH (%(expressions)s)", **extra_context
+        )
+        return sql + " AGAINST (%s IN BOOLEAN MODE)", params + [self.query]
+
+
+def split_words(searchterm: str) -> List[str]:
+    return re.findall(r"\w+", searchterm)
+
+
+def uses_fulltext_index(words: List[str]) -> bool:
+    return connection.vendor == "mysql" and all(
+        len(word) >= MIN_FULLTEXT_WORD_LENGTH for word in words
+    )
+
+
+def text_filter(queryset: QuerySet, fields: List[str], words: List[str]) -> QuerySet:
+    """Keeps the objects that contain all words and annotates them with a relevance score"""
+    if uses_fulltext_index(words):
+        query = " ".join("+" + word for word in words)
+        score = MatchAgainst(*fields, query=query)
+        return queryset.annotate(score=score).filter(score__gt=0)
+
+    for word in words:
+        contains = [Q(**{field + "__icontains": word}) for field in fields]
+        queryset = queryset.filter(reduce(or_, contains))
+    return queryset.annotate(score=Value(1.0, output_field=FloatField()))
+
+
+def create_fulltext_indexes() -> List[str]:
+    """Creates the FULLTEXT indexes on MySQL/MariaDB if they don't exist yet. Returns the names of the new indexes"""
+    if connection.vendor != "mysql":
+        return []
+
+    quote_name = connection.ops.quote_name
+    created = []
+    with connection.cursor() as cursor:
+        for searched in SEARCHED_MODELS.values():
+            table = searched.model._meta.db_table
+            name = table + "_fulltext"
+            cursor.execute(
+                f"SHOW INDEX FROM {quote_name(table)} WHERE Key_name = %s", [name]
+            )
+            if cursor.fetchone():
+                continue
+            columns = ", ".join(
+                quote_name(searched.model._meta.get_field(field).column)
+                for field in searched.fields
+            )
+            cursor.execute(
+                f"CREATE FULLTEXT INDEX {quote_name(name)} ON {quote_name(table)} ({columns})"
+            )
+            created.append(name)
+    return created
+
+
+def highlight_text(
+    text: Optional[str], words: List[str], fragment_size: Optional[int] = None
+) -> Optional[str]:
+    """Marks the words like the highlighter of elasticsearch, optionally only in a fragment around the first match"""
+    if not text or not words:
+        return None
+    pattern = re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+    match = pattern.search(text)
+    if not match:
+        return None
+    if fragment_size and len(text) > fragment_size:
+        start = max(0, match.start() - fragment_size // 2)
+        text = text[start : start + fragment_size]
+    return pattern.sub(lambda word: "<mark>" + word.group(0) + "</mark>", text)
+
+
+def to_json_value(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class DatabaseSearch(MainappSearch):
+    def __init__(
+        self,
+        params: Dict[str, str],
+        offset: Optional[int] = None,
+        limit: Optional[int] = None,
+        cache: bool = False,
+        search_after: Optional[List[Any]] = None,
+        modified_since: Optional[datetime] = None,
+        **kwargs,
+    ):
+        """
+        Takes the same arguments as MainappSearch. The cursors of the endless scrolling contain the sort value and
+        the id of the last result of each type so far, so that every page loads only the following rows of each
+        type. There's no fuzzy query.
+        """
+        super().__init__(
+            params,
+            offset=offset,
+            limit=limit,
+            cache=cache,
+            search_after=search_after,
+            modified_since=modified_since,
+            **kwargs,
+        )
+        self.modified_since = modified_since
+        self.fuzzy = False
+        if "lat" in self.options:
+            self.errors.append(
+                gettext("Searching by location is only possible with elasticsearch.")
+            )
+
+    def filtered(self, doc_type: str) -> Optional[QuerySet]:
+        """The objects of that type matching the search term and the dates, or None if the filters exclude the type"""
+        searched = SEARCHED_MODELS[doc_type]
+        queryset = searched.model.objects.all()
+        if self.modified_since:
+            queryset = queryset.filter(modified__gte=self.modified_since)
+
+        for option, lookup in [("after", "gte"), ("before", "lte")]:
+            if option not in self.options:
+                continue
+            if not searched.date_fields:
+                return None
+            dates = [
+                Q(**{field + "__" + lookup: self.options[option]})
+                for field in searched.date_fields
+            ]
+            queryset = queryset.filter(reduce(or_, dates))
+
+        words = split_words(self._query or "")
+        if words:
+            return text_filter(queryset, searched.fields, words)
+        return queryset.annotate(score=Value(1.0, output_field=FloatField()))
+
+    def facet_filtered(
+        self, doc_type: str, queryset: Optional[QuerySet], skip: str
+    ) -> Optional[QuerySet]:
+        """
+        Applies the filters of the facets except `skip`, like elasticsearch filters each facet
+        with the other facets
+        """
+        if queryset is None:
+            return None
+        searched = SEARCHED_MODELS[doc_type]
+        if skip != "document_type" and doc_type not in self.options.get(
+            "document_type", DOCUMENT_TYPES
+        ):
+            return None
+        for facet, field in [
+            ("person", searched.person_field),
+            ("organization", searched.organization_field),
+        ]:
+            if skip == facet or facet not in self.options:
+                continue
+            if not field:
+                return None
+            # Joining the relation repeats the objects that have it more than once, e.g. two memberships
+            queryset = queryset.filter(**{field: self.options[facet]}).distinct()
+        return queryset
+
+    def sort_key(self, hit: Dict[str, Any], sort_date: Optional[date]):
+        """The ordering of MainappSearch: score or date, then index name, then id"""
+        sort = self.options.get("sort")
+        if sort in ["date_newest", "date_oldest"]:
+            # Like in elasticsearch, the objects without date are last in both directions
+            if sort_date is None:
+                primary = (1, 0.0)
+            else:
+                if not isinstance(sort_date, datetime):
+                    sort_date = datetime.combine(sort_date, time(), timezone.utc)
+                timestamp = sort_date.timestamp()
+                primary = (0, -timestamp if sort == "date_newest" else timestamp)
+        else:
+            primary = (0, -hit["_score"])
+        return primary, hit["_index"], int(hit["_id"])
+
+    def ordered(self, doc_type: str, queryset: QuerySet) -> QuerySet:
+        searched = SEARCHED_MODELS[doc_type]
+        sort = self.options.get("sort")
+        if sort == "date_newest":
+            return queryset.order_by(F(searched.sort_field).desc(nulls_last=True), "id")
+        elif sort == "date_oldest":
+            return queryset.order_by(F(searched.sort_field).asc(nulls_last=True), "id")
+        else:
+            return queryset.order_by("-score", "id")
+
+    def after_keyset(
+        self, doc_type: str, queryset: QuerySet, keyset: Keyset
+    ) -> QuerySet:
+        """The objects that come after the last result of that type in the order of `ordered`"""
+        value, last_id = keyset
+        sort_field = SEARCHED_MODELS[doc_type].sort_field
+        sort = self.options.get("sort")
+        same_id_after = Q(id__gt=last_id)
+        if sort in ["date_newest", "date_oldest"]:
+            without_date = Q(**{sort_field + "__isnull": True})
+            if value is None:
+                return queryset.filter(without_date & same_id_after)
+            lookup = "__lt" if sort == "date_newest" else "__gt"
+            return queryset.filter(
+                Q(**{sort_field + lookup: value})
+                | Q(**{sort_field: value}) & same_id_after
+                | without_date
+            )
+        return queryset.filter(Q(score__lt=value) | Q(score=value) & same_id_after)
+
+    def get_hits(
+        self, querysets: Dict[str, QuerySet], start: int, keysets: Dict[str, Keyset]
+    ) -> List[dict]:
+        """
+        Takes the next results of each type after its keyset and merges them in the order of elasticsearch.
+        Only an offset makes it load the skipped rows, too
+        """
+        end = start + (self.limit or settings.SEARCH_PAGINATION_LENGTH)
+        indices = get_document_indices()
+        candidates = []
+        for doc_type, queryset in querysets.items():
+            searched = SEARCHED_MODELS[doc_type]
+            if doc_type in keysets:
+                queryset = self.after_keyset(doc_type, queryset, keysets[doc_type])
+            fields = searched.source + ["score", searched.sort_field]
+            rows = self.ordered(doc_type, queryset).values(*fields)[:end]
+            for row in rows:
+                hit = {
+                    "_index": indices[doc_type],
+                    "_id": str(row["id"]),
+                    "_score": row["score"] * SCORE_BOOSTS.get(doc_type, 1),
+                    "_source": {
+                        key: to_json_value(row[key]) for key in searched.source
+                    },
+                }
+                if self.options.get("sort") in ["date_newest", "date_oldest"]:
+                    sort_value = to_json_value(row[searched.sort_field])
+                else:
+                    sort_value = row["score"]
+                keyset = (sort_value, row["id"])
+                sort_key = self.sort_key(hit, row[searched.sort_field])
+                candidates.append((sort_key, doc_type, keyset, hit))
+        candidates.sort(key=lambda candidate: candidate[0])
+        hits = []
+        keysets = dict(keysets)
+        for _, doc_type, keyset, hit in candidates[start:end]:
+            keysets[doc_type] = keyset
+            # Flat, because the cursor is built from the sort values of the last hit
+            hit["sort"] = [
+                item
+                for keyset_type, (value, object_id) in keysets.items()
+                for item in [keyset_type, value, object_id]
+            ]
+            hits.append(hit)
+        return hits
+
+    def add_highlights(self, hits: List[dict]):
+        """Highlights only the results on the page, with the text of the files loaded for them"""
+        words = split_words(self._query or "")
+        if not words:
+            return
+        highlight_fields = settings.SEARCH_HIGHLIGHT_FIELDS
+        file_index = get_document_indices()["file"]
+        file_ids = [hit["_id"] for hit in hits if hit["_index"] == file_index]
+        texts = {}
+        if file_ids:
+            files = File.objects.filter(id__in=file_ids)
+            for file in files.values("id", "description", "parsed_text"):
+                texts[str(file["id"])] = file
+
+        for hit in hits:
+            highlight = {}
+            for field in ["name", "reference_number"]:
+                marked = highlight_text(hit["_source"].get(field), words)
+                if field in highlight_fields and marked:
+                    highlight[field] = [marked]
+            for field in ["description", "parsed_text"]:
+                text = texts.get(hit["_id"], {}).get(field)
+                marked = highlight_text(text, words, fragment_size=150)
+                if hit["_index"] == file_index and field in highlight_fields and marked:
+                    highlight[field] = [marked]
+            if highlight:
+                hit["highlight"] = highlight
+
+    def get_aggregations(self, querysets: Dict[str, QuerySet]) -> Dict[str, Any]:
+        """The facets in the format of the aggregations of elasticsearch"""
+        indices = get_document_indices()
+        document_type_buckets = []
+        for doc_type in DOCUMENT_TYPES:
+            queryset = self.facet_filtered(
+                doc_type, querysets[doc_type], "document_type"
+            )
+            count = queryset.count() if queryset is not None else 0
+            if count:
+                document_type_buckets.append(
+                    {"key": indices[doc_type], "doc_count": count}
+                )
+        document_type_buckets.sort(key=lambda bucket: -bucket["doc_count"])
+
+        aggregations = {
+            "_filter_document_type": {
+                "document_type": {"buckets": document_type_buckets}
+            }
+        }
+        for facet in ["person", "organization"]:
+            doc_counts: Dict[int, int] = {}
+            for doc_type in DOCUMENT_TYPES:
+                field = getattr(SEARCHED_MODELS[doc_type], facet + "_field")
+                queryset = self.facet_filtered(doc_type, querysets[doc_type], facet)
+                if not field or queryset is None:
+                    continue
+                model = SEARCHED_MODELS[doc_type].model
+                counts = (
+                    model.objects.filter(pk__in=queryset.values("pk"))
+                    .exclude(**{field + "__isnull": True})
+                    .values(field)
+                    .annotate(doc_count=Count("pk", distinct=True))
+                )
+                for count in counts:
+                    object_id = count[field]
+                    doc_counts[object_id] = (
+                        doc_counts.get(object_id, 0) + count["doc_count"]
+                    )
+            # Elasticsearch returns the 10 biggest buckets by default
+            top = sorted(doc_counts.items(), key=lambda item: (-item[1], item[0]))[:10]
+            buckets = [
+                {"key": object_id, "doc_count": doc_count}
+                for object_id, doc_count in top
+            ]
+            aggregations["_filter_" + facet] = {facet: {"buckets": buckets}}
+        return aggregations
+
+    def run(self) -> Dict[str, Any]:
+        keysets = {}
+        if self.search_after is not None:
+            start = 0
+            for index in range(0, len(self.search_after), 3):
+                doc_type, value, object_id = self.search_after[index : index + 3]
+                keysets[doc_type] = (value, object_id)
+        else:
+            start = self.offset or 0
+
+        querysets = {doc_type: self.filtered(doc_type) for doc_type in DOCUMENT_TYPES}
+        hit_querysets = {}
+        total = 0
+        for doc_type, queryset in querysets.items():
+            queryset = self.facet_filtered(doc_type, queryset, "")
+            if queryset is not None:
+                hit_querysets[doc_type] = queryset
+                total += queryset.count()
+
+        hits = self.get_hits(hit_querysets, start, keysets)
+        self.add_highlights(hits)
+        raw = {"hits": {"total": {"value": total, "relation": "eq"}, "hits": hits}}
+        # The facets are the same for all pages, so only the first page computes them
+        if self.search_after is None:
+            raw["aggregations"] = self.get_aggregations(querysets)
+        return raw
+
+    def execute(self):
+        if self.cache:
+            request = {
+                "database": self.params,
+                "offset": self.offset,
+                "limit": self.limit,
+                "search_after": self.search_after,
+                "modified_since": self.modified_since,
+            }
+            raw = cached_search(request, self.run)
+        else:
+            raw = self.run()
+        response = self._s._response_class(self._s, raw)
+        response._faceted_search = self
+        return response
+
+
+def autocomplete_titles(query: str, limit: int = 10) -> Dict[str, Any]:
+    """The database version of the title search of `autocomplete`, with the papers first"""
+    words = split_words(query)
+    indices = get_document_indices()
+    hits = []
+    for doc_type in ["paper", "meeting", "file"]:
+        if not words or len(hits) >= limit:
+            break
+        queryset = SEARCHED_MODELS[doc_type].model.objects.all()
+        for word in words:
+            queryset = queryset.filter(name__icontains=word)
+        for object_id, name in queryset.order_by("id").values_list("id", "name")[
+            : limit - len(hits)
+        ]:
+            hits.append(
+                {
+                    "_index": indices[doc_type],
+                    "_id": str(object_id),
+                    "_source": {"id": object_id, "name": name},
+                }
+            )
+    return {"hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
@@ -1,22 +1,29 @@
+import hashlib
 import logging
+import multiprocessing
+import os
+import pickle
 import re
 import string
 import subprocess
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
 from subprocess import CalledProcessError
-from typing import Dict, List, Optional, Tuple, IO
+from typing import Any, Dict, List, Optional, Tuple, IO, Iterable
 
+import ahocorasick
 import geoextract
-import requests
 from PyPDF2.pdf import PdfFileReader
 from PyPDF2.utils import PdfReadError
 from django import db
 from django.conf import settings
-from wand.color import Color
-from wand.image import Image
+from django.db.models import Count, Max
 
-from mainapp.functions.geo_functions import geocode
-from mainapp.models import SearchStreet, Body, Location, Person
+from mainapp.documents import FileDocument
+from mainapp.functions.geo_functions import geocode_many
+from mainapp.functions.search import search_bulk_index
+from mainapp.models import SearchStreet, Body, Location, Person, File
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +70,9 @@ class AddressPipeline(geoextract.Pipeline):
             postprocessors=postprocessors,
         )
 
+        # Identifies the street set of persisted snapshots, see get_address_pipeline
+        self.checksum: Optional[str] = None
+
 
 def extract_from_file(
     file: IO[bytes], filename: str, mime_type: str, file_id: int
@@ -104,73 +114,94 @@ def cleanup_extracted_text(text: str) -> str:
     return re.sub(r"([a-z])-\s*\n([a-z])", r"\1\2", text)
 
 
-def perform_ocr_on_image(imgdata):
-    headers = {
-        "Ocp-Apim-Subscription-Key": settings.OCR_AZURE_KEY,
-        "Content-Type": "application/octet-stream",
-    }
-    params = {"language": settings.OCR_AZURE_LANGUAGE, "detectOrientation ": "true"}
-    ocr_url = settings.OCR_AZURE_API + "/vision/v1.0/ocr"
-    response = requests.post(ocr_url, headers=headers, params=params, data=imgdata)
-    response.raise_for_status()
-
-    analysis = response.json()
-    plain_text = ""
-    for region in analysis["regions"]:
-        for line in region["lines"]:
-            for word in line["words"]:
-                plain_text += word["text"] + " "
-            plain_text += "\n"
-        plain_text += "\n"
-
-    return plain_text
-
-
-def get_ocr_text_from_pdf(file):
-    img = Image(blob=file, resolution=500)
-    recognized_text = ""
-    for single_image in img.sequence:
-        with Image(single_image) as i:
-            i.resolution = 100
-            i.format = "png"
-            i.background_color = Color("white")
-            i.alpha_channel = "remove"
-
-            tmpfile = tempfile.TemporaryFile()
-            i.save(file=tmpfile)
-            tmpfile.seek(0)
-            imgdata = tmpfile.read()
-            tmpfile.close()
-
-            # Workaround: Shrink image until the size is below Azure's upload limit of 4MB
-            while len(imgdata) > 4000000:
-                i.resize(round(i.width * 0.75), round(i.height * 0.75))
-
-                tmpfile = tempfile.TemporaryFile()
-                i.save(file=tmpfile)
-                tmpfile.seek(0)
-                imgdata = tmpfile.read()
-                tmpfile.close()
-
-            recognized_text += perform_ocr_on_image(imgdata)
-
-    return recognized_text
-
-
 def create_geoextract_data(bodies: Optional[List[Body]] = None) -> List[Dict[str, str]]:
-    street_names = []
     if bodies:
         streets = SearchStreet.objects.filter(body__in=bodies)
     else:
         streets = SearchStreet.objects.all()
 
-    locations = []
-    for street in streets:
-        if street.displayed_name not in street_names:
-            street_names.append(street.displayed_name)
-            locations.append({"type": "street", "name": street.displayed_name})
+    # Sorted so that the same streets always give the same snapshot checksum
+    street_names = sorted(set(streets.values_list("displayed_name", flat=True)))
+    return [{"type": "street", "name": street_name} for street_name in street_names]
+
+
+# Bump this when changing AddressPipeline to invalidate the old snapshots
+ADDRESS_PIPELINE_VERSION = 1
+
+_address_pipeline: Optional[AddressPipeline] = None
+
+
+def get_geoextract_data_checksum(locations: List[Dict[str, str]]) -> str:
+    data = "\n".join(location["name"] for location in locations)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get_address_pipeline_snapshot_path(checksum: str) -> Path:
+    return Path(settings.GEOEXTRACT_CACHE_DIRECTORY).joinpath(
+        f"address-pipeline-v{ADDRESS_PIPELINE_VERSION}-{checksum}.pickle"
+    )
 
-    return locations
+
+def load_address_pipeline_snapshot(checksum: str) -> Optional[AddressPipeline]:
+    path = get_address_pipeline_snapshot_path(checksum)
+    try:
+        with path.open("rb") as fp:
+            return pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.warning(f"Failed to load the address pipeline snapshot {path}: {e}")
+        return None
+
+
+def save_address_pipeline_snapshot(pipeline: AddressPipeline):
+    path = get_address_pipeline_snapshot_path(pipeline.checksum)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that other processes never read a partial snapshot
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("wb") as fp:
+            pickle.dump(pipeline, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to save the address pipeline snapshot {path}: {e}")
+        return
+
+    # Snapshots for older street sets won't be used again
+    for old_snapshot in path.parent.glob("address-pipeline-*.pickle"):
+        if old_snapshot != path:
+            old_snapshot.unlink(missing_ok=True)
+
+
+def get_address_pipeline(checksum: Optional[str] = None) -> AddressPipeline:
+    """
+    Returns the address pipeline for the current search streets.
+
+    Building the pipeline normalizes and stems every street name, which is slow for big cities, so the built pipeline
+    is persisted as a snapshot keyed by a checksum of the street names and reused by other processes and later runs.
+
+    Workers that got the checksum from their parent can pass it to skip querying the streets.
+    """
+    global _address_pipeline
+    locations = None
+    if not checksum:
+        locations = create_geoextract_data()
+        checksum = get_geoextract_data_checksum(locations)
+
+    if _address_pipeline and _address_pipeline.checksum == checksum:
+        return _address_pipeline
+
+    pipeline = load_address_pipeline_snapshot(checksum)
+    if not pipeline:
+        if locations is None:
+            locations = create_geoextract_data()
+        logger.debug(f"Building the address pipeline for {len(locations)} streets")
+        pipeline = AddressPipeline(locations)
+        pipeline.checksum = get_geoextract_data_checksum(locations)
+        save_address_pipeline_snapshot(pipeline)
+
+    _address_pipeline = pipeline
+    return pipeline
 
 
 def get_search_string(location: Dict[str, str], fallback_city: Optional[str]) -> str:
@@ -207,6 +238,75 @@ def format_location_name(location: Dict[str, str]) -> str:
     return name
 
 
+def split_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """
+    Splits the text into chunks of chunk_size characters that are extended by overlap characters,
+    so that an address shorter than the overlap is found completely in at least one chunk.
+
+    The chunks are widened to the surrounding whitespace where possible to avoid cutting words.
+    """
+    chunks = []
+    for start in range(0, len(text), chunk_size):
+        end = start + chunk_size + overlap
+        if start > 0:
+            whitespace = max(
+                text.rfind(" ", start - overlap, start),
+                text.rfind("\n", start - overlap, start),
+            )
+            if whitespace != -1:
+                start = whitespace
+        if end < len(text):
+            whitespace = [text.find(char, end, end + overlap) for char in " \n"]
+            end = min([i for i in whitespace if i != -1], default=end)
+        chunks.append(text[start:end])
+    return chunks
+
+
+_chunk_pipeline: Optional[AddressPipeline] = None
+
+
+def _init_chunk_worker(pipeline: AddressPipeline):
+    global _chunk_pipeline
+    _chunk_pipeline = pipeline
+
+
+def _extract_chunk(chunk: str) -> List[Dict[str, str]]:
+    return _chunk_pipeline.extract(chunk)
+
+
+def extract_raw_locations(text: str, pipeline: AddressPipeline) -> List[Dict[str, str]]:
+    """
+    Runs geoextract over the text and returns the distinct locations in the order they were found.
+
+    geoextract fails with big inputs (https://github.com/stadt-karlsruhe/geoextract/issues/7), so long texts are
+    split into overlapping chunks, which are processed in parallel unless we're already in a worker process.
+    """
+    if len(text) < settings.TEXT_CHUNK_SIZE:
+        return pipeline.extract(text)
+
+    chunks = split_text(text, settings.TEXT_CHUNK_SIZE, settings.TEXT_CHUNK_OVERLAP)
+    if multiprocessing.parent_process() is None:
+        # Forked processes mustn't share the database connections
+        db.connections.close_all()
+        max_workers = min(len(chunks), os.cpu_count() or 1)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_chunk_worker,
+            initargs=(pipeline,),
+        ) as executor:
+            results = list(executor.map(_extract_chunk, chunks))
+    else:
+        results = [pipeline.extract(chunk) for chunk in chunks]
+
+    # The dicts returned by geoextract are unhashable, so we merge them by their items.
+    # Locations in the overlaps are found twice.
+    found_locations = {}
+    for result in results:
+        for location in result:
+            found_locations.setdefault(tuple(sorted(location.items())), location)
+    return list(found_locations.values())
+
+
 def extract_locations(
     text: str, fallback_city: Optional[str], pipeline: Optional[AddressPipeline] = None
 ) -> List[Location]:
@@ -217,79 +317,182 @@ def extract_locations(
         fallback_city = Body.objects.get(id=settings.SITE_DEFAULT_BODY).short_name
 
     if not pipeline:
-        pipeline = AddressPipeline(create_geoextract_data())
+        pipeline = get_address_pipeline()
 
-    if len(text) < settings.TEXT_CHUNK_SIZE:
-        found_locations = pipeline.extract(text)
-    else:
-        # Workaround for https://github.com/stadt-karlsruhe/geoextract/issues/7
-        found_locations = []
-        for i in range(0, len(text), settings.TEXT_CHUNK_SIZE):
-            # We can't use set because the dicts in the returned list are unhashable
-            for location in pipeline.extract(text[i : i + settings.TEXT_CHUNK_SIZE]):
-                if location not in found_locations:
-                    found_locations.append(location)
-
-    locations = []
+    found_locations = extract_raw_locations(text, pipeline)
+
+    # The same address is often mentioned many times in one document
+    location_names: Dict[str, str] = {}
     for found_location in found_locations:
         if "name" in found_location and len(found_location["name"]) < 5:
             continue
 
-        location_name = format_location_name(found_location)
-
-        search_str = get_search_string(found_location, fallback_city)
-        defaults = {
-            "description": location_name,
-            "is_official": False,
-            # This cutoff comes from a limitation of InnoDB
-            "search_str": search_str[:767],
-        }
-        # Avoid "MySQL server has gone away" errors due to timeouts
-        # https://stackoverflow.com/a/32720475/3549270
-        db.close_old_connections()
-        location, created = Location.objects_with_deleted.get_or_create(
-            search_str=search_str, defaults=defaults
+        # This cutoff comes from a limitation of InnoDB
+        search_str = get_search_string(found_location, fallback_city)[:767]
+        if search_str not in location_names:
+            location_names[search_str] = format_location_name(found_location)
+
+    if not location_names:
+        return []
+
+    return get_or_create_locations(location_names)
+
+
+def get_or_create_locations(location_names: Dict[str, str]) -> List[Location]:
+    """
+    Takes a mapping from search string to description and returns the matching locations,
+    creating the missing ones in bulk.
+
+    New locations are created without geometry and are geocoded later by geocode_new_locations,
+    so that the file analysis doesn't wait on the geocoder.
+    """
+    # Avoid "MySQL server has gone away" errors due to timeouts
+    # https://stackoverflow.com/a/32720475/3549270
+    db.close_old_connections()
+    locations = {
+        location.search_str: location
+        for location in Location.objects_with_deleted.filter(
+            search_str__in=location_names.keys()
+        )
+    }
+
+    missing = [
+        Location(description=description, is_official=False, search_str=search_str)
+        for search_str, description in location_names.items()
+        if search_str not in locations
+    ]
+    if missing:
+        # Another process might have created the same location in the meantime
+        Location.objects_with_deleted.bulk_create(missing, ignore_conflicts=True)
+        # mysql doesn't set the ids with bulk_create, so we need to query them
+        created = list(
+            Location.objects_with_deleted.filter(
+                search_str__in=[location.search_str for location in missing]
+            )
         )
+        Location.history.bulk_history_create(created)
+        for location in created:
+            locations[location.search_str] = location
 
-        if created:
-            location.geometry = geocode(search_str)
+    return [
+        locations[search_str]
+        for search_str in location_names.keys()
+        if search_str in locations
+    ]
+
+
+def geocode_new_locations(since: datetime) -> int:
+    """
+    Geocodes the locations that were found in files since the given time and don't have coordinates yet.
+    Files mentioning those locations are reindexed so that the location search finds them.
+
+    Returns the number of successfully geocoded locations.
+    """
+    pending = list(
+        Location.objects_with_deleted.filter(
+            geometry=None,
+            is_official=False,
+            search_str__isnull=False,
+            created__gte=since,
+        )
+    )
+    geometries = geocode_many(location.search_str for location in pending)
+    geocoded = []
+    for location in pending:
+        location.geometry = geometries[location.search_str]
+        if location.geometry:
             location.save()
+            geocoded.append(location.id)
+
+    if geocoded and settings.ELASTICSEARCH_ENABLED:
+        # Only the coordinates changed, so the text index is left alone
+        search_bulk_index(
+            File,
+            File.objects.filter(locations__in=geocoded).distinct(),
+            documents=[FileDocument],
+        )
+
+    logger.info(f"Geocoded {len(geocoded)} of {len(pending)} new locations")
+    return len(geocoded)
+
+
+def get_person_matchables(person: Person) -> List[str]:
+    """All the variants of a person's name we're looking for, lowercased"""
+    matchables = [
+        person.name,
+        person.given_name + " " + person.family_name,
+        person.family_name + " " + person.given_name,
+        person.family_name + ", " + person.given_name,
+        person.family_name + "," + person.given_name,
+    ]
+    # Empty names (e.g. a missing given name) would otherwise match everywhere
+    return [matchable.strip().lower() for matchable in matchables if matchable.strip()]
+
+
+class PersonMatcher:
+    """
+    Finds mentions of persons with an aho-corasick automaton over all name variants,
+    so that a text is scanned once instead of once per person and name variant.
+    """
+
+    def __init__(self, persons: Iterable[Person]):
+        self.persons: Dict[int, Person] = {}
+        self.automaton = ahocorasick.Automaton()
+        for person in persons:
+            self.persons[person.id] = person
+            for matchable in get_person_matchables(person):
+                if matchable not in self.automaton:
+                    self.automaton.add_word(matchable, (len(matchable), set()))
+                # Different persons can share a name variant
+                self.automaton.get(matchable)[1].add(person.id)
+
+        if len(self.automaton) > 0:
+            self.automaton.make_automaton()
 
-        locations.append(location)
+    def find(self, text: str) -> List[Person]:
+        if self.automaton.kind != ahocorasick.AHOCORASICK:
+            return []
 
-    return locations
+        text = re.sub(r"\s\s+", " ", text).lower()
+        # For finding names at the very beginning and end
+        text = " " + text + " "
+
+        is_w = string.ascii_lowercase + string.digits
+        found_ids = set()
+        for end, (length, person_ids) in self.automaton.iter(text):
+            start = end - length + 1
+            # Make sure that there's whitespace or punction before and after name
+            if text[start - 1] not in is_w and text[end + 1] not in is_w:
+                found_ids.update(person_ids)
+
+        return [self.persons[person_id] for person_id in sorted(found_ids)]
+
+
+_person_matcher: Optional[PersonMatcher] = None
+_person_matcher_version: Optional[Dict[str, Any]] = None
+
+
+def get_person_matcher() -> PersonMatcher:
+    """
+    The matcher is built once per process and only rebuilt when persons were added, changed or removed.
+
+    Checking the version is a single cheap aggregate query, which makes this safe to call for every file.
+    """
+    global _person_matcher, _person_matcher_version
+    version = Person.objects.aggregate(
+        count=Count("id"), max_id=Max("id"), modified=Max("modified")
+    )
+    if not _person_matcher or version != _person_matcher_version:
+        logger.debug(f"Building the person matcher for {version['count']} persons")
+        _person_matcher = PersonMatcher(Person.objects.all())
+        _person_matcher_version = version
+    return _person_matcher
 
 
 def extract_persons(text: str) -> List[Person]:
     """
-    Avoids matching every person with a regex for performance reasons
-    (Where performance means that the files analyses shouldn't take hours for 10k files).
-    This could likely be made much faster using an aho-corasick automaton over multiple files.
+    Returns all persons whose name is mentioned in the text.
+
+    Uses the cached PersonMatcher because the files analyses shouldn't take hours for 10k files.
     """
-    persons = Person.objects.all()
-    text = re.sub(r"\s\s+", " ", text).lower()
-    # For finding names at the very beginning and end
-    text = " " + text + " "
-
-    found_persons = []
-    for person in persons:
-        matchables = [
-            person.name,
-            person.given_name + " " + person.family_name,
-            person.family_name + " " + person.given_name,
-            person.family_name + ", " + person.given_name,
-            person.family_name + "," + person.given_name,
-        ]
-
-        for matchable in matchables:
-            matchable = matchable.lower()
-            if matchable in text:
-                start = text.index(matchable)
-                end = start + len(matchable)
-                # Make sure that there's whitespace or punction before and after name
-                is_w = string.ascii_lowercase + string.digits
-                if text[start - 1] not in is_w and text[end] not in is_w:
-                    found_persons.append(person)
-                    break
-
-    return found_persons
+    return get_person_matcher().find(text)
@@ -0,0 +1,77 @@
+"""
+Small images of the first page of pdfs, so that pages and search results can show a file without downloading the
+whole pdf. They are rendered when the file is analysed and stored in the (private) cache bucket.
+"""
+
+import logging
+from io import BytesIO
+from typing import Dict
+
+from django.conf import settings
+
+from mainapp.functions.minio import minio_cache_bucket
+from mainapp.functions.storage import StorageException, get_storage
+
+logger = logging.getLogger(__name__)
+
+preview_kinds = ["thumbnail", "preview"]
+
+
+def get_preview_widths() -> Dict[str, int]:
+    return {
+        "thumbnail": settings.FILE_THUMBNAIL_WIDTH,
+        "preview": settings.FILE_PREVIEW_WIDTH,
+    }
+
+
+def get_preview_object_name(file_id: int, kind: str) -> str:
+    return f"file-previews/{file_id}-{kind}.jpg"
+
+
+def render_previews(pdf_path: str) -> Dict[str, bytes]:
+    """Renders only the first page, once, and scales it down to the different widths"""
+    # wand needs the ImageMagick library, which only the importer and the commands should need, not the web process
+    from wand.color import Color
+    from wand.image import Image
+
+    widths = get_preview_widths()
+    # 100 dpi is about 830 pixels wide for A4, enough for the biggest default width
+    with Image(filename=f"{pdf_path}[0]", resolution=100) as page:
+        page.background_color = Color("white")
+        page.alpha_channel = "remove"
+        previews = {}
+        for kind, width in widths.items():
+            with page.clone() as image:
+                if image.width > width:
+                    image.transform(resize=f"{width}x")
+                image.format = "jpeg"
+                image.compression_quality = 75
+                previews[kind] = image.make_blob()
+    return previews
+
+
+def create_previews(file_id: int, pdf_path: str) -> bool:
+    """Returns whether the previews could be rendered and stored"""
+    from wand.exceptions import WandException
+
+    try:
+        previews = render_previews(pdf_path)
+        for kind, data in previews.items():
+            get_storage().put_object(
+                minio_cache_bucket,
+                get_preview_object_name(file_id, kind),
+                BytesIO(data),
+                len(data),
+                content_type="image/jpeg",
+            )
+    except (WandException, StorageException) as e:
+        logger.warning(f"File {file_id}: Failed to create the previews: {e}")
+        return False
+    return True
+
+
+def delete_previews(file_id: int):
+    for kind in preview_kinds:
+        get_storage().remove_object(
+            minio_cache_bucket, get_preview_object_name(file_id, kind)
+        )
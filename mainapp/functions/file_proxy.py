@@ -0,0 +1,149 @@
+"""
+Fetch-through cache for the file proxy that is used with PROXY_ONLY_TEMPLATE instead of importing all files.
+
+The first request for a file is streamed from the RIS, while the file is downloaded into the cache bucket in the
+background, together with the validators the RIS sent. Later requests, including the range requests of pdf.js, are
+served from the cache. Once a cached file is older than PROXY_ONLY_CACHE_REVALIDATE, it's still served, but
+revalidated with a conditional request in the background. There's at most one background download per file.
+"""
+
+import json
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional, Dict, Any, Set
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from requests import HTTPError, RequestException
+
+from importer.functions import requests_get
+from mainapp.functions.minio import minio_cache_bucket
+from mainapp.functions.storage import StorageException, StoredObject, get_storage
+
+logger = logging.getLogger(__name__)
+
+_fetch_executor = ThreadPoolExecutor(max_workers=2)
+_fetching: Set[str] = set()
+_fetching_lock = threading.Lock()
+
+
+def get_object_name(original_file_id: str) -> str:
+    return "file-proxy/" + quote(original_file_id, safe="")
+
+
+def get_meta_name(original_file_id: str) -> str:
+    return "file-proxy-meta/" + quote(original_file_id, safe="") + ".json"
+
+
+def load_meta(original_file_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with get_storage().get_object(
+            minio_cache_bucket, get_meta_name(original_file_id)
+        ) as stored:
+            return json.loads(stored.read())
+    except (StorageException, ValueError):
+        return None
+
+
+def fetch_into_cache(
+    original_file_id: str, meta: Optional[Dict[str, Any]] = None
+) -> requests.Response:
+    """
+    Downloads the file from the RIS into the cache, with a conditional request if there is a cached version.
+
+    Returns the response of the RIS. Its body is only left unread if the status code is neither 200 nor 304.
+    """
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    url = settings.PROXY_ONLY_TEMPLATE.format(original_file_id)
+    try:
+        response = requests_get(url, stream=True, headers=headers)
+    except HTTPError as e:
+        response = e.response
+
+    storage = get_storage()
+    if response.status_code == 200:
+        with tempfile.TemporaryFile() as tmp_file:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                tmp_file.write(chunk)
+            size = tmp_file.tell()
+            tmp_file.seek(0)
+            storage.put_object(
+                minio_cache_bucket,
+                get_object_name(original_file_id),
+                tmp_file,
+                size,
+                content_type=response.headers.get("Content-Type"),
+            )
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+    elif response.status_code == 304 and meta:
+        pass
+    else:
+        return response
+
+    # The object is written before the metadata, so an object without metadata is just revalidated
+    meta["fetched"] = time.time()
+    data = json.dumps(meta).encode()
+    storage.put_object(
+        minio_cache_bucket,
+        get_meta_name(original_file_id),
+        BytesIO(data),
+        len(data),
+        content_type="application/json",
+    )
+    return response
+
+
+def refresh(original_file_id: str):
+    """Downloads a file that isn't cached yet or revalidates the cached one"""
+    try:
+        response = fetch_into_cache(original_file_id, load_meta(original_file_id))
+        if response.status_code in [404, 410]:
+            logger.info(f"Removing {original_file_id} from the proxy cache")
+            storage = get_storage()
+            storage.remove_object(minio_cache_bucket, get_object_name(original_file_id))
+            storage.remove_object(minio_cache_bucket, get_meta_name(original_file_id))
+        response.close()
+    except (RequestException, StorageException) as e:
+        logger.warning(f"Failed to refresh {original_file_id}: {e}")
+    finally:
+        with _fetching_lock:
+            _fetching.discard(original_file_id)
+
+
+def schedule_refresh(original_file_id: str) -> Optional[Future]:
+    """Returns None if the file is already being downloaded or revalidated"""
+    with _fetching_lock:
+        if original_file_id in _fetching:
+            return None
+        _fetching.add(original_file_id)
+    return _fetch_executor.submit(refresh, original_file_id)
+
+
+def get_cached_file(original_file_id: str) -> Optional[StoredObject]:
+    """Returns the cached file, if any, and schedules the download of missing and the revalidation of stale files"""
+    try:
+        stored = get_storage().get_object(
+            minio_cache_bucket, get_object_name(original_file_id)
+        )
+    except StorageException:
+        schedule_refresh(original_file_id)
+        return None
+
+    meta = load_meta(original_file_id)
+    age = time.time() - meta["fetched"] if meta else None
+    if age is None or age > settings.PROXY_ONLY_CACHE_REVALIDATE:
+        schedule_refresh(original_file_id)
+    return stored
@@ -1,8 +1,13 @@
 import logging
 import re
-from typing import Optional, Dict, Any, List, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Iterable, Set
 
+from django import db
 from django.conf import settings
+from django.utils import timezone
 from geopy import OpenCage, Nominatim, MapBox
 from geopy.exc import GeocoderServiceError
 from geopy.geocoders.base import Geocoder
@@ -12,7 +17,49 @@ from urllib.parse import urlparse
 logger = logging.getLogger(__name__)
 
 
+class GeocodingError(Exception):
+    """All geocoders failed, so we don't know whether the address exists"""
+
+
+class TokenBucket:
+    """
+    Rate limiter that blocks until the next request is allowed, while allowing short bursts
+    when the geocoder wasn't used for a while.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.rate:
+            return
+
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+
+_geolocators: Optional[List[Tuple[str, Geocoder]]] = None
+_rate_limiters: Dict[str, TokenBucket] = {}
+
+
 def get_geolocators() -> List[Tuple[str, Geocoder]]:
+    global _geolocators
+    if _geolocators is not None:
+        return _geolocators
+
     geolocators = []
     if settings.GEOEXTRACT_ENGINE == "opencage":
         if not settings.OPENCAGE_KEY:
@@ -34,11 +81,31 @@ def get_geolocators() -> List[Tuple[str, Geocoder]]:
         )
     )
 
+    _geolocators = geolocators
     return geolocators
 
 
-def geocode(search: str) -> Optional[Dict[str, Any]]:
+def get_rate_limiter(name: str) -> TokenBucket:
+    """One rate limiter per geocoder and process"""
+    if name not in _rate_limiters:
+        _rate_limiters[name] = TokenBucket(settings.GEOCODING_RATE_LIMITS.get(name))
+    return _rate_limiters[name]
+
+
+def normalize_search_str(search: str) -> str:
+    # The cutoff comes from a limitation of InnoDB
+    return re.sub(r"\s+", " ", search).strip().lower()[:767]
+
+
+def query_geocoders(search: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Asks the geocoders one after another until one answers, bypassing the cache.
+
+    Returns the geometry (None if the address wasn't found) and the name of the geocoder
+    or raises a GeocodingError if all geocoders failed.
+    """
     for name, geolocator in get_geolocators():
+        get_rate_limiter(name).acquire()
         try:
             if name == "mapbox":
                 location = geolocator.geocode(search, exactly_one=False)
@@ -52,18 +119,65 @@ def geocode(search: str) -> Optional[Dict[str, Any]]:
             continue
 
         if location:
-            return {
+            geometry = {
                 "type": "Point",
                 "coordinates": [location[0].longitude, location[0].latitude],
             }
+            return geometry, name
         else:
             logger.debug(f"No location found for {search}")
-            return None
-    # exc_info to help sentry with grouping
-    logger.error(
-        f"All geocoding attempts failed. Search string was {search}", exc_info=True
-    )
-    return None
+            return None, name
+    raise GeocodingError(f"All geocoding attempts failed. Search string was {search}")
+
+
+def geocode_many(searches: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Geocodes a batch of search strings, returning a mapping from search string to geometry.
+
+    Results are looked up in the geocoding cache with a single query and only the missing
+    or expired ones are sent to the (rate limited) geocoders.
+    """
+    # Importing this at the top would be circular
+    from mainapp.models import CachedGeocode
+
+    keys = {search: normalize_search_str(search) for search in searches}
+    cached = {
+        entry.search_str: entry
+        for entry in CachedGeocode.objects.filter(search_str__in=set(keys.values()))
+    }
+
+    results = {}
+    for search, key in keys.items():
+        entry = cached.get(key)
+        if not entry or entry.is_expired():
+            try:
+                geometry, geocoder = query_geocoders(search)
+            except GeocodingError:
+                # exc_info to help sentry with grouping
+                logger.error(
+                    f"All geocoding attempts failed. Search string was {search}",
+                    exc_info=True,
+                )
+                # We don't know whether the address exists, so we don't cache that
+                results[search] = None
+                continue
+
+            entry, _ = CachedGeocode.objects.update_or_create(
+                search_str=key,
+                defaults={
+                    "geometry": geometry,
+                    "geocoder": geocoder,
+                    "fetched": timezone.now(),
+                },
+            )
+            cached[key] = entry
+        results[search] = entry.geometry
+
+    return results
+
+
+def geocode(search: str) -> Optional[Dict[str, Any]]:
+    return geocode_many([search])[search]
 
 
 def _format_opencage_location(location) -> str:
@@ -87,7 +201,8 @@ def _format_nominatim_location(location) -> str:
         return location.split(",")[0]
 
 
-def latlng_to_address(lat, lng) -> str:
+def reverse_geocode(lat: float, lng: float) -> Optional[str]:
+    """Asks the geocoder for the address at the coordinates, bypassing the cache"""
     search_str = str(lat) + ", " + str(lng)
 
     if settings.GEOEXTRACT_ENGINE == "opencage":
@@ -95,13 +210,88 @@ def latlng_to_address(lat, lng) -> str:
             raise ValueError(
                 "OpenCage Data is selected as Geocoder, however no OPENCAGE_KEY is set"
             )
+        get_rate_limiter("opencage").acquire()
         location = OpenCage(settings.OPENCAGE_KEY).reverse(search_str)
         if location:
             return _format_opencage_location(location)
     else:
+        get_rate_limiter("nominatim").acquire()
         location = Nominatim(
             user_agent=slugify(settings.PRODUCT_NAME) + "/1.0"
         ).reverse(search_str)
-        if len(location) > 0:
+        if location and len(location) > 0:
             return _format_nominatim_location(location[0])
-    return search_str
+    return None
+
+
+def snap_to_grid(lat: float, lng: float) -> str:
+    """Rounds the coordinates to the reverse geocoding grid and formats them as cache key"""
+    grid = settings.REVERSE_GEOCODING_GRID
+    return "{:.6f},{:.6f}".format(round(lat / grid) * grid, round(lng / grid) * grid)
+
+
+def populate_reverse_geocoding_cache(lat: float, lng: float) -> Optional[str]:
+    # Importing this at the top would be circular
+    from mainapp.models import CachedReverseGeocode
+
+    try:
+        address = reverse_geocode(lat, lng)
+    except GeocoderServiceError as e:
+        logger.warning(f"Reverse geocoding {lat}, {lng} failed: {e}")
+        return None
+
+    CachedReverseGeocode.objects.update_or_create(
+        coordinates=snap_to_grid(lat, lng),
+        defaults={"address": address, "fetched": timezone.now()},
+    )
+    return address
+
+
+_reverse_geocoding_executor: Optional[ThreadPoolExecutor] = None
+_reverse_geocoding_pending: Set[str] = set()
+_reverse_geocoding_lock = threading.Lock()
+
+
+def _populate_in_background(lat: float, lng: float, key: str) -> None:
+    try:
+        populate_reverse_geocoding_cache(lat, lng)
+    except Exception:
+        logger.exception(f"Reverse geocoding {lat}, {lng} failed")
+    finally:
+        with _reverse_geocoding_lock:
+            _reverse_geocoding_pending.discard(key)
+        # The thread got its own database connection
+        db.connection.close()
+
+
+def latlng_to_address(lat, lng) -> str:
+    """
+    Returns the address for the coordinates from the reverse geocoding cache.
+
+    This is used while rendering searches, so we never wait for the geocoder: On a cache miss,
+    the cache is populated in a background thread and the coordinates are returned instead.
+    """
+    # Importing this at the top would be circular
+    from mainapp.models import CachedReverseGeocode
+
+    global _reverse_geocoding_executor
+
+    lat, lng = float(lat), float(lng)
+    fallback = str(lat) + ", " + str(lng)
+    key = snap_to_grid(lat, lng)
+
+    entry = CachedReverseGeocode.objects.filter(coordinates=key).first()
+    if entry and not entry.is_expired():
+        return entry.address or fallback
+
+    with _reverse_geocoding_lock:
+        if key not in _reverse_geocoding_pending:
+            _reverse_geocoding_pending.add(key)
+            if not _reverse_geocoding_executor:
+                _reverse_geocoding_executor = ThreadPoolExecutor(max_workers=1)
+            _reverse_geocoding_executor.submit(_populate_in_background, lat, lng, key)
+
+    # An expired address is still better than the coordinates
+    if entry and entry.address:
+        return entry.address
+    return fallback
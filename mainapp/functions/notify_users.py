@@ -1,22 +1,31 @@
 import logging
 from datetime import timedelta, datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.translation import gettext as _
-from elasticsearch_dsl import Q
 from html2text import html2text
 
 from mainapp.functions.mail import send_mail
 from mainapp.functions.search_notification_tools import search_result_for_notification
-from mainapp.functions.search import MainappSearch, parse_hit
+from mainapp.functions.search import (
+    NotificationSearchResult,
+    execute_many,
+    get_search,
+    params_to_search_string,
+    parse_hit,
+    search_string_to_params,
+)
 from mainapp.models import UserAlert
 
 logger = logging.getLogger(__name__)
 
+# The normalized search string and the time since when the documents are searched
+SearchKey = Tuple[str, datetime]
+
 
 class NotifyUsers:
     fallback_timeframe = timedelta(days=14)
@@ -27,22 +36,43 @@ class NotifyUsers:
         self.override_since = override_since
         self.simulate = simulate
 
-    def perform_search(self, alert: UserAlert) -> List[dict]:
+    def search_key(self, alert: UserAlert, now: datetime) -> SearchKey:
         if self.override_since is not None:
             since = self.override_since
         elif alert.last_match is not None:
             since = alert.last_match
         else:
-            since = timezone.now() - self.fallback_timeframe
-
-        search = MainappSearch(
-            alert.get_search_params(),
-            extra_filter=[Q("range", modified={"gte": since.isoformat()})],
-        )
-        executed = search.execute()
-        return [parse_hit(hit) for hit in executed.hits]
-
-    def notify_user(self, user: User) -> bool:
+            since = now - self.fallback_timeframe
+        return params_to_search_string(alert.get_search_params()), since
+
+    def perform_searches(
+        self, keys: List[SearchKey]
+    ) -> Dict[SearchKey, List[NotificationSearchResult]]:
+        """
+        Each distinct search runs only once, and they're sent to elasticsearch in batches. After a run, all notified
+        alerts have the same last_match, so alerts for the same search string usually share their search
+        """
+        searches = [
+            get_search(
+                search_string_to_params(search_string),
+                modified_since=since,
+                # Only recently modified documents are searched, so the fuzzy query is cheap
+                fuzzy=True,
+            )
+            for search_string, since in keys
+        ]
+        results = {}
+        for key, executed in zip(keys, execute_many(searches)):
+            results[key] = [
+                search_result_for_notification(parse_hit(hit)) for hit in executed.hits
+            ]
+        return results
+
+    def notify_user(
+        self,
+        user: User,
+        alert_results: List[Tuple[UserAlert, List[NotificationSearchResult]]],
+    ) -> bool:
         context = {
             "base_url": settings.ABSOLUTE_URI_BASE,
             "site_name": settings.TEMPLATE_META["logo_name"],
@@ -50,15 +80,8 @@ class NotifyUsers:
             "email": user.email,
         }
 
-        for alert in user.useralert_set.all():
-            notify_objects = self.perform_search(alert)
-            for obj in notify_objects:
-                search_result_for_notification(obj)
-
-            if len(notify_objects) > 0:
-                results = []
-                for obj in notify_objects:
-                    results.append(search_result_for_notification(obj))
+        for alert, results in alert_results:
+            if len(results) > 0:
                 context["alerts"].append({"title": str(alert), "results": results})
 
         logger.debug("User %s: %i results\n" % (user.email, len(context["alerts"])))
@@ -85,18 +108,41 @@ class NotifyUsers:
                 user.profile,
             )
 
-        if not self.override_since:
-            for alert in user.useralert_set.all():
-                alert.last_match = timezone.now()
-                alert.save()
-
         return True
 
     def notify_all(self):
-        alerts_send = 0
-        users = User.objects.filter(is_active=True).all()
+        # Documents modified while the searches run are found again by the next run instead of being missed
+        now = timezone.now()
+        users = (
+            User.objects.filter(is_active=True)
+            .select_related("profile")
+            .prefetch_related("useralert_set")
+        )
+        user_alerts: List[Tuple[User, List[Tuple[UserAlert, SearchKey]]]] = []
         for user in users:
-            alert_send = self.notify_user(user)
-            if alert_send:
+            alerts = [
+                (alert, self.search_key(alert, now))
+                for alert in user.useralert_set.all()
+            ]
+            if alerts:
+                user_alerts.append((user, alerts))
+
+        keys = list(
+            dict.fromkeys(key for _, alerts in user_alerts for _, key in alerts)
+        )
+        results = self.perform_searches(keys)
+        logger.info(
+            f"Ran {len(keys)} searches for the alerts of {len(user_alerts)} users"
+        )
+
+        alerts_send = 0
+        notified_alerts = []
+        for user, alerts in user_alerts:
+            alert_results = [(alert, results[key]) for alert, key in alerts]
+            if self.notify_user(user, alert_results):
                 alerts_send += 1
+                notified_alerts.extend(alert.id for alert, _ in alerts)
+
+        if not self.override_since:
+            UserAlert.objects.filter(id__in=notified_alerts).update(last_match=now)
         logger.info(f"Sent notifications to {alerts_send} users")
@@ -0,0 +1,132 @@
+"""
+OCR for scanned documents: The pdf is rasterized one page at a time and the pages are sent to the OCR backend
+concurrently, so that memory is bounded by the number of pages in flight instead of the size of the document.
+"""
+
+import logging
+import subprocess
+from abc import ABC, abstractmethod
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List
+
+import requests
+from PyPDF2.pdf import PdfFileReader
+from django.conf import settings
+from wand.color import Color
+from wand.image import Image
+
+logger = logging.getLogger(__name__)
+
+
+class OcrBackend(ABC):
+    """Recognizes the text on a single page image"""
+
+    # Bigger images are shrunk before they are sent to the backend
+    max_image_size: Optional[int] = None
+
+    @abstractmethod
+    def recognize(self, image: bytes) -> str:
+        raise NotImplementedError
+
+
+class AzureOcrBackend(OcrBackend):
+    """
+    Azure's Computer Vision OCR. Set OCR_AZURE_API to the url of a Computer Vision container to use a local
+    stand-in for the cloud service, which doesn't need a key.
+    """
+
+    max_image_size = 4000000
+
+    def __init__(self, api: str, key: Optional[str], language: str):
+        self.ocr_url = api + "/vision/v1.0/ocr"
+        self.language = language
+        self.session = requests.Session()
+        if key:
+            self.session.headers["Ocp-Apim-Subscription-Key"] = key
+
+    def recognize(self, image: bytes) -> str:
+        params = {"language": self.language, "detectOrientation ": "true"}
+        response = self.session.post(
+            self.ocr_url,
+            headers={"Content-Type": "application/octet-stream"},
+            params=params,
+            data=image,
+        )
+        response.raise_for_status()
+
+        analysis = response.json()
+        plain_text = ""
+        for region in analysis["regions"]:
+            for line in region["lines"]:
+                for word in line["words"]:
+                    plain_text += word["text"] + " "
+                plain_text += "\n"
+            plain_text += "\n"
+
+        return plain_text
+
+
+class TesseractOcrBackend(OcrBackend):
+    """Runs tesseract locally, which is free but less accurate. Needs the tesseract binary and language data."""
+
+    def __init__(self, language: str):
+        self.language = language
+
+    def recognize(self, image: bytes) -> str:
+        completed = subprocess.run(
+            ["tesseract", "stdin", "stdout", "-l", self.language],
+            input=image,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        return completed.stdout.decode("utf-8", "ignore")
+
+
+def get_ocr_backend() -> OcrBackend:
+    if settings.OCR_BACKEND == "tesseract":
+        return TesseractOcrBackend(settings.OCR_TESSERACT_LANGUAGE)
+    else:
+        return AzureOcrBackend(
+            settings.OCR_AZURE_API, settings.OCR_AZURE_KEY, settings.OCR_AZURE_LANGUAGE
+        )
+
+
+def rasterize_page(pdf_path: str, page: int, max_size: Optional[int]) -> bytes:
+    """Renders a single page of the pdf as png at OCR_RESOLUTION, shrunk below max_size bytes if given"""
+    with Image(filename=f"{pdf_path}[{page}]", resolution=settings.OCR_RESOLUTION) as i:
+        i.format = "png"
+        i.background_color = Color("white")
+        i.alpha_channel = "remove"
+        imgdata = i.make_blob()
+
+        # The size shrinks roughly with the number of pixels, so one or two resizes are enough
+        while max_size and len(imgdata) > max_size:
+            scale = (max_size / len(imgdata)) ** 0.5 * 0.9
+            i.resize(round(i.width * scale), round(i.height * scale))
+            imgdata = i.make_blob()
+
+    return imgdata
+
+
+def get_ocr_text_from_pdf(pdf: bytes, backend: Optional[OcrBackend] = None) -> str:
+    """Returns the recognized text of all pages, with up to OCR_CONCURRENCY pages being processed at once"""
+    backend = backend or get_ocr_backend()
+
+    # ImageMagick can only read a single page from a file
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(pdf)
+        pdf_file.flush()
+        page_count = PdfFileReader(
+            pdf_file.name, strict=False, overwriteWarnings=False
+        ).getNumPages()
+
+        def ocr_page(page: int) -> str:
+            imgdata = rasterize_page(pdf_file.name, page, backend.max_image_size)
+            return backend.recognize(imgdata)
+
+        with ThreadPoolExecutor(max_workers=settings.OCR_CONCURRENCY) as executor:
+            pages: List[str] = list(executor.map(ocr_page, range(page_count)))
+
+    return "".join(pages)
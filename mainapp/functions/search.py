@@ -1,27 +1,48 @@
 import json
 import logging
 from collections import namedtuple
-from typing import Dict, Optional, Any, List, Type
+from datetime import datetime
+from typing import Dict, Optional, Any, List, Type, Tuple
 from urllib.parse import quote
 
 from dateutil.parser import parse
 from django.conf import settings
+from django.core import signing
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Model
 from django.db.models.query import QuerySet
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import escape
 from django.utils.translation import gettext, pgettext
+from django_elasticsearch_dsl import Document
 from django_elasticsearch_dsl.registries import registry
 from django_elasticsearch_dsl.search import Search
-from elasticsearch import TransportError
-from elasticsearch_dsl import Q, FacetedSearch, TermsFacet, Search, AttrDict
-from elasticsearch_dsl.query import Bool, MultiMatch, Query
+from elasticsearch import NotFoundError, TransportError
+from elasticsearch_dsl import (
+    Q,
+    FacetedSearch,
+    TermsFacet,
+    Search,
+    AttrDict,
+    MultiSearch,
+)
+from elasticsearch_dsl.connections import get_connection
+from elasticsearch_dsl.query import (
+    Bool,
+    ConstantScore,
+    Ids,
+    MultiMatch,
+    Query,
+    Term,
+)
 from elasticsearch_dsl.response import Response
 
 from mainapp.functions.geo_functions import latlng_to_address
+from mainapp.functions.search_cache import cached_search
 
 logger = logging.getLogger(__name__)
+slow_search_logger = logging.getLogger("mainapp.slow_search")
 
 DOCUMENT_TYPES = ["file", "meeting", "paper", "organization", "person"]
 
@@ -61,12 +82,14 @@ MULTI_MATCH_FIELDS = [
     "family_name",
     "given_name",
     "name",
-    "parsed_text^0.5",
     "short_name",
     "type",
     "reference_number",
 ]
 
+# The weight of a match in the parsed text of a file relative to a match in the other fields
+FILE_TEXT_BOOST = 0.5
+
 NotificationSearchResult = namedtuple(
     "NotificationSearchResult", ["title", "url", "type", "type_name", "highlight"]
 )
@@ -80,6 +103,20 @@ def get_document_indices():
     }
 
 
+def get_file_text_index() -> str:
+    return settings.ELASTICSEARCH_PREFIX + "-file-text"
+
+
+def get_search(params: Dict[str, str], **kwargs) -> "MainappSearch":
+    """Returns the search for the configured backend, see db_search.py for the search without elasticsearch"""
+    if settings.ELASTICSEARCH_ENABLED:
+        return MainappSearch(params, **kwargs)
+
+    from mainapp.functions.db_search import DatabaseSearch
+
+    return DatabaseSearch(params, **kwargs)
+
+
 class ElasticsearchNotAvailableError(Exception):
     def __str__(self):
         return (
@@ -103,13 +140,41 @@ class MainappSearch(FacetedSearch):
         offset: Optional[int] = None,
         limit: Optional[int] = None,
         extra_filter: Optional[List[Query]] = None,
+        cache: bool = False,
+        search_after: Optional[List[Any]] = None,
+        pit_id: Optional[str] = None,
+        fuzzy: Optional[bool] = None,
+        modified_since: Optional[datetime] = None,
     ):
+        """
+        With cache, the response may come from the search cache, see search_cache.py
+
+        search_after and pit_id come from the cursor of the previous page (see decode_cursor) and replace the offset
+        for deep pages. Those pages don't compute the facets.
+
+        With fuzzy=None, the fuzzy query only runs if the exact query found less than SEARCH_FUZZY_THRESHOLD hits.
+
+        extra_filter also applies to the search in the parsed texts, where only `modified` is available.
+        modified_since is such a filter that DatabaseSearch also understands.
+        """
         self.params = params
+        self.cache = cache
+        self.search_after = search_after
+        self.pit_id = pit_id
+        self.fuzzy = fuzzy
+        # The files whose parsed text matches, with the score of that match, see search_file_texts
+        self.file_text_scores: Dict[int, float] = {}
+        # Whether more texts matched than SEARCH_FILE_TEXT_LIMIT, so some files are missing in the total and the facets
+        self.file_texts_truncated = False
         self.errors = []
         self.offset = offset
         self.limit = limit
         self.index = list(get_document_indices().values())
         self.extra_filter: List[Query] = extra_filter or []
+        if modified_since:
+            self.extra_filter.append(
+                Q("range", modified={"gte": modified_since.isoformat()})
+            )
 
         # Note that for django templates it makes a difference if a value is undefined or None
         self.options = {}
@@ -140,43 +205,166 @@ class MainappSearch(FacetedSearch):
             self.options["sort"] = self.params["sort"]
         else:
             sort = ["_score"]
+        # Cursors need a total order, and the ids are only unique within one index
+        sort += ["_index", {"id": {"order": "asc", "unmapped_type": "long"}}]
 
         super().__init__(self.params.get("searchterm"), filters, sort)
 
-    def highlight(self, search: Search) -> Search:
-        # TODO: Why did we have this?
-        # search = search.highlight_options(require_field_match=False)
-        search = search.highlight(
-            "*", fragment_size=150, pre_tags="<mark>", post_tags="</mark>"
+    @staticmethod
+    def highlight_options(search: Search) -> Search:
+        return search.highlight_options(
+            fragment_size=150,
+            number_of_fragments=settings.SEARCH_HIGHLIGHT_FRAGMENTS,
+            pre_tags=["<mark>"],
+            post_tags=["</mark>"],
         )
+
+    def highlight(self, search: Search) -> Search:
+        search = self.highlight_options(search)
+        for field in settings.SEARCH_HIGHLIGHT_FIELDS:
+            if field in ["name", "reference_number"]:
+                # These replace the value in the result list, so they need to be complete
+                search = search.highlight(field, number_of_fragments=0)
+            elif field == "parsed_text":
+                # Highlighted separately for the files on the page, see add_file_text_highlights
+                pass
+            else:
+                search = search.highlight(field)
         return search
 
+    def match_query(self, query: str, fields: List[str]) -> List[Query]:
+        # Fuzziness AUTO(=2) gives more error tolerance, but is also a lot slower and has many false positives
+        # We're using https://stackoverflow.com/a/35375562/3549270 to make exact matches score higher than fuzzy
+        # matches
+        # The fuzzy query is expensive with common words, so it's only added when the exact query found few hits
+        should = [
+            MultiMatch(
+                query=escape_elasticsearch_query(query),
+                operator="and",
+                fields=fields,
+            )
+        ]
+        if self.fuzzy:
+            should.append(
+                MultiMatch(
+                    query=escape_elasticsearch_query(query),
+                    operator="and",
+                    fields=fields,
+                    fuzziness="1",
+                    prefix_length=1,
+                )
+            )
+        return should
+
     def query(self, search: Search, query: str) -> Search:
         if query:
             self.options["searchterm"] = query
-            # Fuzziness AUTO(=2) gives more error tolerance, but is also a lot slower and has many false positives
-            # We're using https://stackoverflow.com/a/35375562/3549270 to make exact matches score higher than fuzzy
-            # matches
-            search = search.query(
-                Bool(
-                    should=[
-                        MultiMatch(
-                            query=escape_elasticsearch_query(query),
-                            operator="and",
-                            fields=self.fields,
-                        ),
-                        MultiMatch(
-                            query=escape_elasticsearch_query(query),
-                            operator="and",
-                            fields=self.fields,
-                            fuzziness="1",
-                            prefix_length=1,
-                        ),
-                    ]
-                )
-            )
+            should = self.match_query(query, self.fields)
+            if self.file_text_scores:
+                should.append(self.file_text_query())
+            search = search.query(Bool(should=should))
         return search
 
+    def file_text_query(self) -> Query:
+        """
+        Matches the files found by search_file_texts, each with the score of its text match, so that the ranking
+        is about the same as if the text was part of the file index
+        """
+        return Bool(
+            filter=[Term(_index=get_document_indices()["file"])],
+            should=[
+                ConstantScore(filter=Term(id=file_id), boost=score * FILE_TEXT_BOOST)
+                for file_id, score in self.file_text_scores.items()
+            ],
+            minimum_should_match=1,
+        )
+
+    def searches_file_texts(self) -> bool:
+        if not self._query:
+            return False
+        return "file" in self.options.get("document_type", ["file"])
+
+    def file_text_search(self) -> Search:
+        """
+        Finds the files whose parsed text matches the query in the file text index, which is then joined with the
+        other indices by file id in the main query. Only the best SEARCH_FILE_TEXT_LIMIT files are taken, or the
+        newest or oldest when sorting by date. When there are more, the total is only a lower bound (see response).
+        """
+        search = Search(index=get_file_text_index())
+        search = search.query(
+            Bool(should=self.match_query(self._query, ["parsed_text"]))
+        )
+        for extra_filter in self.extra_filter:
+            search = search.filter(extra_filter)
+        sort = self.params.get("sort")
+        if sort in ["date_newest", "date_oldest"]:
+            # Sorted by date, the results must start with the newest (or oldest) matching files, not the best matching
+            order = "desc" if sort == "date_newest" else "asc"
+            search = search.sort({"sort_date": {"order": order}}).extra(
+                track_scores=True
+            )
+        search = search.source(False).extra(track_total_hits=False)
+        return search[: settings.SEARCH_FILE_TEXT_LIMIT]
+
+    def set_file_texts(self, raw: Dict[str, Any]):
+        hits = raw["hits"]["hits"]
+        self.file_text_scores = {int(hit["_id"]): hit["_score"] for hit in hits}
+        self.file_texts_truncated = len(hits) >= settings.SEARCH_FILE_TEXT_LIMIT
+
+    def search_file_texts(self):
+        self.set_file_texts(self._run_cached(self.file_text_search(), "file_text"))
+
+    def file_text_highlight_search(self, raw: Dict[str, Any]) -> Optional[Search]:
+        """
+        Highlights the parsed text of the files on the page, which is a lot cheaper than highlighting all the
+        files search_file_texts found. None if there's nothing to highlight.
+        """
+        if "parsed_text" not in settings.SEARCH_HIGHLIGHT_FIELDS:
+            return None
+        hits = self.file_text_hits(raw)
+        if not hits:
+            return None
+
+        search = Search(index=get_file_text_index())
+        search = search.query(
+            Bool(should=self.match_query(self._query, ["parsed_text"]))
+        )
+        search = search.filter(Ids(values=[hit["_id"] for hit in hits]))
+        search = search.source(False).extra(track_total_hits=False)[: len(hits)]
+        search = self.highlight_options(search)
+        if settings.SEARCH_HIGHLIGHT_FVH:
+            # The fast vector highlighter uses the term vectors instead of analyzing the whole text again
+            return search.highlight("parsed_text", type="fvh")
+        else:
+            return search.highlight("parsed_text")
+
+    def file_text_hits(self, raw: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The files in the results that were found by their text"""
+        file_index = get_document_indices()["file"]
+        return [
+            hit
+            for hit in raw["hits"]["hits"]
+            if hit["_index"] == file_index and int(hit["_id"]) in self.file_text_scores
+        ]
+
+    def apply_file_text_highlights(
+        self, raw: Dict[str, Any], highlight_raw: Dict[str, Any]
+    ):
+        highlights = {
+            text_hit["_id"]: text_hit["highlight"]["parsed_text"]
+            for text_hit in highlight_raw["hits"]["hits"]
+            if "highlight" in text_hit
+        }
+        for hit in self.file_text_hits(raw):
+            if hit["_id"] in highlights:
+                hit.setdefault("highlight", {})["parsed_text"] = highlights[hit["_id"]]
+
+    def add_file_text_highlights(self, raw: Dict[str, Any]):
+        search = self.file_text_highlight_search(raw)
+        if search is not None:
+            raw_highlights = self._run_cached(search, "file_text_highlight")
+            self.apply_file_text_highlights(raw, raw_highlights)
+
     def search(self) -> Search:
         search = super().search()  # type: Search
         try:
@@ -207,7 +395,7 @@ class MainappSearch(FacetedSearch):
 
         # indices_boost: Titles often repeat the organization name and the test contains person names, but
         # when searching for those proper nouns, the person/organization itself should be at the top
-        # _source: Take only the fields we use, and especially ignore the huge parsed_text
+        # _source: Take only the fields we use
         search.update_from_dict(
             {
                 "indices_boost": [
@@ -221,10 +409,22 @@ class MainappSearch(FacetedSearch):
                     "legal_date",
                     "reference_number",
                     "display_date",
+                    "preview_available",
                 ],
+                # Counting all hits of common words is slow, so above that we only show "Over ..."
+                "track_total_hits": settings.SEARCH_TRACK_TOTAL_HITS,
             }
         )
 
+        if self.search_after is not None:
+            search = search.extra(search_after=self.search_after)
+        if self.pit_id:
+            # With a point in time, the request must not name the indices
+            keep_alive = f"{settings.SEARCH_POINT_IN_TIME}s"
+            search = search.index().extra(
+                pit={"id": self.pit_id, "keep_alive": keep_alive}
+            )
+
         # N.B.: indexing reset from and size
         if self.limit:
             if self.offset:
@@ -234,6 +434,11 @@ class MainappSearch(FacetedSearch):
 
         return search
 
+    def aggregate(self, search: Search):
+        # The facets are the same for all pages, so only the first page computes them
+        if self.search_after is None:
+            super().aggregate(search)
+
     def build_search(self) -> Search:
         search = super().build_search()
         if logger.isEnabledFor(logging.DEBUG):
@@ -245,11 +450,215 @@ class MainappSearch(FacetedSearch):
         return search
 
     def execute(self):
+        raw = self._execute()
+        if self.fuzzy is None and self._query:
+            if raw["hits"]["total"]["value"] < settings.SEARCH_FUZZY_THRESHOLD:
+                self.fuzzy = True
+                self._s = self.build_search()
+                raw = self._execute()
+            else:
+                self.fuzzy = False
+        try:
+            self.add_file_text_highlights(raw)
+        except TransportError as e:
+            raise ElasticsearchNotAvailableError() from e
+
+        return self.response(raw)
+
+    def response(self, raw: Dict[str, Any]) -> Response:
+        if self.file_texts_truncated:
+            # Only the first SEARCH_FILE_TEXT_LIMIT files found by their text are counted, so it's "Over ..."
+            raw["hits"]["total"] = {**raw["hits"]["total"], "relation": "gte"}
+        response = self._s._response_class(self._s, raw)
+        response._faceted_search = self
+        return response
+
+    def _execute(self) -> Dict[str, Any]:
         # Return a more useful error message in debug mode
         try:
-            return super().execute()
+            if self.searches_file_texts():
+                self.search_file_texts()
+                self._s = self.build_search()
+            if not self.cache or self.pit_id:
+                try:
+                    raw = self._run()
+                except NotFoundError:
+                    if not self.pit_id:
+                        raise
+                    # The point in time expired, so continue without one
+                    logger.info("The point in time for the search cursor expired")
+                    self.pit_id = None
+                    self._s = self.build_search()
+                    raw = self._run()
+            else:
+                request = {"index": self._s._index, "body": self._s.to_dict()}
+                raw = cached_search(request, self._run)
         except TransportError as e:
             raise ElasticsearchNotAvailableError() from e
+        return raw
+
+    def _run(self) -> Dict[str, Any]:
+        raw = self._s.execute().to_dict()
+        self.log_if_slow(raw)
+        return raw
+
+    def _run_cached(self, search: Search, kind: str) -> Dict[str, Any]:
+        """For the searches in the file text index, which are logged like the main search when they're slow"""
+
+        def run() -> Dict[str, Any]:
+            raw = search.execute().to_dict()
+            self.log_if_slow(raw, search, kind)
+            return raw
+
+        if not self.cache:
+            return run()
+        request = {"index": search._index, "body": search.to_dict()}
+        return cached_search(request, run)
+
+    def log_if_slow(
+        self, raw: Dict[str, Any], search: Optional[Search] = None, kind: str = "main"
+    ):
+        """
+        Writes searches slower than SEARCH_SLOW_QUERY_THRESHOLD as one json object per line to the slow log.
+        `kind` tells the main search apart from the file_text search and the file_text_highlight search
+        """
+        took = raw.get("took")
+        threshold = settings.SEARCH_SLOW_QUERY_THRESHOLD
+        if not threshold or took is None or took < threshold:
+            return
+
+        body = (search or self._s).to_dict()
+        entry = {
+            "time": timezone.now(),
+            "kind": kind,
+            "took": took,
+            "params": self.params,
+            "fuzzy": bool(self.fuzzy),
+            "cursor": self.search_after is not None,
+            "total": raw.get("hits", {}).get("total"),
+            "aggregations": "aggs" in body,
+            "shape": query_shape(
+                {key: body[key] for key in ["query", "post_filter"] if key in body}
+            ),
+        }
+        slow_search_logger.info(json.dumps(entry, cls=DjangoJSONEncoder))
+
+    def next_cursor(self, executed) -> Optional[str]:
+        """Returns the cursor for the page after the executed one, or None if this was the last page"""
+        if not self.limit or len(executed.hits) < self.limit:
+            return None
+        pit_id = executed.to_dict().get("pit_id", self.pit_id)
+        sort = list(executed.hits[-1].meta.sort)
+        return encode_cursor(sort, pit_id, bool(self.fuzzy))
+
+
+def run_multi_search(searches: List[Search]) -> List[Dict[str, Any]]:
+    """Sends the searches to elasticsearch in multi searches of SEARCH_MULTI_SEARCH_SIZE"""
+    raws = []
+    size = settings.SEARCH_MULTI_SEARCH_SIZE
+    for start in range(0, len(searches), size):
+        multi_search = MultiSearch()
+        for search in searches[start : start + size]:
+            multi_search = multi_search.add(search)
+        try:
+            responses = multi_search.execute()
+        except TransportError as e:
+            raise ElasticsearchNotAvailableError() from e
+        raws.extend(response.to_dict() for response in responses)
+    return raws
+
+
+def execute_many(main_searches: List[MainappSearch]) -> List[Response]:
+    """
+    Executes many searches with a few multi searches instead of several requests per search: First all the file
+    text searches, then all the main searches and then the highlighting of the file texts.
+
+    This is for the notifications, so the searches aren't cached, and they must already know whether they're
+    fuzzy, since there is no second run with the fuzzy query.
+    """
+    if not settings.ELASTICSEARCH_ENABLED:
+        return [main_search.execute() for main_search in main_searches]
+    assert all(main_search.fuzzy is not None for main_search in main_searches)
+
+    text_searches = [
+        main_search
+        for main_search in main_searches
+        if main_search.searches_file_texts()
+    ]
+    text_raws = run_multi_search(
+        [main_search.file_text_search() for main_search in text_searches]
+    )
+    for main_search, text_raw in zip(text_searches, text_raws):
+        main_search.log_if_slow(text_raw, main_search.file_text_search(), "file_text")
+        main_search.set_file_texts(text_raw)
+        main_search._s = main_search.build_search()
+
+    raws = run_multi_search([main_search._s for main_search in main_searches])
+    for main_search, raw in zip(main_searches, raws):
+        main_search.log_if_slow(raw)
+
+    highlighted = []
+    for main_search, raw in zip(main_searches, raws):
+        search = main_search.file_text_highlight_search(raw)
+        if search is not None:
+            highlighted.append((main_search, raw, search))
+    highlight_raws = run_multi_search([search for _, _, search in highlighted])
+    for (main_search, raw, search), highlight_raw in zip(highlighted, highlight_raws):
+        main_search.log_if_slow(highlight_raw, search, "file_text_highlight")
+        main_search.apply_file_text_highlights(raw, highlight_raw)
+
+    return [main_search.response(raw) for main_search, raw in zip(main_searches, raws)]
+
+
+def query_shape(query: Any) -> Any:
+    """Replaces the values in a query with "?", so that the slow searches can be grouped by their structure"""
+    if isinstance(query, dict):
+        return {
+            key: value if key == "fields" else query_shape(value)
+            for key, value in query.items()
+        }
+    elif isinstance(query, list):
+        return [query_shape(value) for value in query]
+    else:
+        return "?"
+
+
+def encode_cursor(
+    search_after: List[Any], pit_id: Optional[str] = None, fuzzy: bool = False
+) -> str:
+    """
+    The cursors are signed, so that they are opaque to the frontend and can't be used to alter the query.
+    They also say whether the first page used the fuzzy query, so that all pages use the same query.
+    """
+    return signing.dumps(
+        {"search_after": search_after, "pit": pit_id, "fuzzy": fuzzy},
+        salt="search-cursor",
+        compress=True,
+    )
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Any], Optional[str], bool]:
+    """Raises signing.BadSignature for invalid cursors"""
+    data = signing.loads(cursor, salt="search-cursor")
+    return data["search_after"], data["pit"], data["fuzzy"]
+
+
+def open_point_in_time() -> Optional[str]:
+    """
+    Opens a point in time if SEARCH_POINT_IN_TIME is set, so that the following pages of the endless scrolling
+    don't shift when the index changes. It's only opened for the second page, since most searches don't go further.
+    """
+    if not settings.SEARCH_POINT_IN_TIME or not settings.ELASTICSEARCH_ENABLED:
+        return None
+    try:
+        response = get_connection().open_point_in_time(
+            index=",".join(get_document_indices().values()),
+            keep_alive=f"{settings.SEARCH_POINT_IN_TIME}s",
+        )
+    except TransportError as e:
+        logger.warning(f"Failed to open a point in time: {e}")
+        return None
+    return response["id"]
 
 
 def _add_date_after(
@@ -355,6 +764,9 @@ def parse_hit(hit: AttrDict, highlighting: bool = True) -> Dict[str, Any]:
     parsed["type_translated"] = DOCUMENT_TYPE_NAMES[parsed["type"]]
     parsed["url"] = reverse(parsed["type"], args=[hit.id])
     parsed["score"] = hit.meta.score
+    # Only files have previews, see file_previews.py
+    if parsed.pop("preview_available", False):
+        parsed["thumbnail_url"] = reverse("file-preview", args=[hit.id, "thumbnail"])
 
     if highlighting:
         highlights = get_highlights(hit, parsed)
@@ -385,8 +797,16 @@ def autocomplete(query: str) -> Response:
     This way we enforce that the whole entered word has to be matched (save for some fuzziness) and the algorithm
     does not fall back to matching only the first character in extreme cases. This prevents absurd cases where
     "Garret Walker" and "Hector Mendoza" are suggested when we're entering "Mahatma Ghandi"
+
+    Persons, organizations and reference numbers come from the autocomplete index, so this only searches the
+    titles of files, meetings and papers. Without elasticsearch, the titles are searched in the database.
     """
-    search_query = Search(index=list(get_document_indices().values()))
+    indices = get_document_indices()
+    search_query = Search(index=[indices["file"], indices["meeting"], indices["paper"]])
+    if not settings.ELASTICSEARCH_ENABLED:
+        from mainapp.functions.db_search import autocomplete_titles
+
+        return search_query._response_class(search_query, autocomplete_titles(query))
     search_query = search_query.query(
         "match",
         autocomplete={
@@ -398,22 +818,26 @@ def autocomplete(query: str) -> Response:
     )
     search_query = search_query.extra(min_score=1)
     search_query = search_query.update_from_dict(
-        {
-            "indices_boost": [
-                {get_document_indices()["person"]: 4},
-                {get_document_indices()["organization"]: 4},
-                {get_document_indices()["paper"]: 2},
-            ]
-        }
+        {"indices_boost": [{indices["paper"]: 2}]}
     )
-    response = search_query.execute()
-    return response
+    request = {"index": search_query._index, "body": search_query.to_dict()}
+    raw = cached_search(request, lambda: search_query.execute().to_dict())
+    return search_query._response_class(search_query, raw)
 
 
-def search_bulk_index(model: Type[Model], qs: QuerySet, **kwargs):
+def search_bulk_index(
+    model: Type[Model],
+    qs: QuerySet,
+    documents: Optional[List[Type[Document]]] = None,
+    **kwargs,
+):
     """Django orm bulk functions such as `bulk_create`, `bulk_index` and
     `update`do not send signals for the modified objects and therefore do not
     automatically update the elasticsearch index. This function therefore
-    bulk-reindexes the changed objects."""
-    [current_doc] = registry.get_documents([model])
-    return current_doc().update(qs, **kwargs)
+    bulk-reindexes the changed objects.
+
+    With `documents`, only those documents of the model are updated, e.g. to
+    skip the file text index when only the metadata of the files changed."""
+    for document in registry.get_documents([model]):
+        if documents is None or document in documents:
+            document().update(qs, **kwargs)
@@ -0,0 +1,139 @@
+"""
+Caches the raw elasticsearch responses of the searches on the website, so that popular queries don't hit
+elasticsearch on every request.
+
+The entries are keyed by the complete elasticsearch request, which covers the normalized query, the filters and the
+offset. Every entry is tagged with the search generation, a counter in the cache that the importers bump after they
+changed the data, so that no outdated results are shown after an import. Outdated entries are kept for
+SEARCH_CACHE_STALE_TIMEOUT and served when elasticsearch fails.
+
+The names for the person and organization facets are looked up in an index that's rebuilt when the generation
+changes, so rendering the facets only touches the buckets elasticsearch returned.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from elasticsearch import TransportError
+
+logger = logging.getLogger(__name__)
+
+generation_key = "search-generation"
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2)
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+
+# The generation the facet labels were built for and the labels
+_facet_labels: Tuple[Optional[float], Dict[str, Dict[int, str]]] = (None, {})
+
+
+def get_search_generation() -> float:
+    generation = cache.get(generation_key)
+    if generation is None:
+        # The cache was cleared or evicted the key, so we can't tell which entries are outdated. A new generation
+        # treats all of them as outdated, while a fixed default would make entries from before an import fresh again
+        cache.add(generation_key, time.time(), None)
+        generation = cache.get(generation_key, 0)
+    return generation
+
+
+def bump_search_generation():
+    """Invalidates all cached search results. Called by the importers after they changed the data"""
+    # A new unique value instead of incr, so that an evicted counter can't restart at an old value
+    cache.set(generation_key, time.time(), None)
+
+
+def get_cache_key(request: Dict[str, Any]) -> str:
+    serialized = json.dumps(request, sort_keys=True, cls=DjangoJSONEncoder)
+    return "search:" + hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def refresh(key: str, execute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    generation = get_search_generation()
+    response = execute()
+    entry = {"generation": generation, "time": time.time(), "response": response}
+    cache.set(key, entry, settings.SEARCH_CACHE_STALE_TIMEOUT)
+    return response
+
+
+def refresh_in_background(key: str, execute: Callable[[], Dict[str, Any]]):
+    def run():
+        try:
+            refresh(key, execute)
+        except TransportError as e:
+            logger.warning(f"Failed to refresh a cached search result: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresh_executor.submit(run)
+
+
+def cached_search(
+    request: Dict[str, Any], execute: Callable[[], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Returns the cached response for the elasticsearch request or calls `execute` to get the response.
+
+    If elasticsearch fails, an outdated response is returned if there is one. With
+    SEARCH_CACHE_STALE_WHILE_REVALIDATE, outdated responses are returned right away and refreshed in the background.
+    """
+    if not settings.SEARCH_CACHE_TIMEOUT:
+        return execute()
+
+    key = get_cache_key(request)
+    entry = cache.get(key)
+    if entry:
+        age = time.time() - entry["time"]
+        if (
+            entry["generation"] == get_search_generation()
+            and age < settings.SEARCH_CACHE_TIMEOUT
+        ):
+            return entry["response"]
+        if settings.SEARCH_CACHE_STALE_WHILE_REVALIDATE:
+            refresh_in_background(key, execute)
+            return entry["response"]
+
+    try:
+        return refresh(key, execute)
+    except TransportError:
+        if entry:
+            logger.warning(
+                "Elasticsearch failed, serving an outdated search result",
+                exc_info=True,
+            )
+            return entry["response"]
+        raise
+
+
+def build_facet_labels() -> Dict[str, Dict[int, str]]:
+    from mainapp.models import Organization, Person
+
+    org = settings.SITE_DEFAULT_ORGANIZATION
+    persons = Person.objects.filter(membership__organization=org).distinct()
+    return {
+        "organization": dict(Organization.objects.values_list("id", "name")),
+        "person": dict(persons.values_list("id", "name")),
+    }
+
+
+def get_facet_labels() -> Dict[str, Dict[int, str]]:
+    """Returns the names of the persons and organizations by id for each facet, rebuilt after every import"""
+    global _facet_labels
+    generation = get_search_generation()
+    if _facet_labels[0] != generation:
+        _facet_labels = (generation, build_facet_labels())
+    return _facet_labels[1]
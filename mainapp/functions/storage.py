@@ -0,0 +1,341 @@
+"""
+All binary data, i.e. the files, the previews and other cached data and the pgp keys, goes through this abstraction.
+
+By default, everything is stored in minio. Single-node deployments can set STORAGE_BACKEND=filesystem to keep the
+objects in STORAGE_DIRECTORY instead, which saves a network hop and a second copy of every file and allows serving
+the files with sendfile. The bucket names stay the same in both backends; with the filesystem backend, each bucket
+is a directory.
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+from io import BytesIO
+from typing import IO, Iterator, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from minio.error import MinioException
+
+from mainapp.functions.minio import bucket_list, minio_client, setup_minio
+
+logger = logging.getLogger(__name__)
+
+# The umask can only be read by setting it, so it's read once at import before any threads start
+_umask = os.umask(0o022)
+os.umask(_umask)
+
+
+class StorageException(Exception):
+    """The object doesn't exist or the storage couldn't be reached"""
+
+
+class StoredObject(ABC):
+    """An object opened for reading. Use it as context manager so that the connection or file is closed"""
+
+    size: int
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    # Set if the object is a file on the local disk, which can be served with sendfile
+    local_path: Optional[str] = None
+
+    @abstractmethod
+    def read(self) -> bytes:
+        """Reads the whole object"""
+
+    @abstractmethod
+    def read_range(self, start: int, end: int) -> bytes:
+        """Reads the bytes from start to end, with end being exclusive"""
+
+    @abstractmethod
+    def stream(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Reads the object in chunks"""
+
+    @abstractmethod
+    def stream_range(
+        self, start: int, end: int, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """Reads the bytes from start to end in chunks, with end being exclusive"""
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def __enter__(self) -> "StoredObject":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Storage(ABC):
+    @abstractmethod
+    def setup(self):
+        """Creates the buckets"""
+
+    @abstractmethod
+    def put_object(
+        self,
+        bucket: str,
+        name: str,
+        data: IO[bytes],
+        length: int,
+        content_type: Optional[str] = None,
+    ):
+        pass
+
+    @abstractmethod
+    def get_object(self, bucket: str, name: str) -> StoredObject:
+        pass
+
+    @abstractmethod
+    def remove_object(self, bucket: str, name: str):
+        """Removing an object that doesn't exist is not an error"""
+
+    @abstractmethod
+    def list_objects(self, bucket: str) -> Iterator[str]:
+        """Returns the names of all objects in the bucket"""
+
+
+class MinioObject(StoredObject):
+    """
+    The metadata comes from stat_object. The body is only requested when it's read, either completely or only
+    the requested range, so that serving a range or answering a conditional request doesn't download the object
+    """
+
+    def __init__(self, bucket: str, name: str, stat):
+        self.bucket = bucket
+        self.name = name
+        self.size = stat.size
+        self.content_type = stat.content_type
+        # minio strips the quotes, which http needs
+        self.etag = f'"{stat.etag}"' if stat.etag else None
+        self.last_modified = stat.last_modified
+        self.response = None
+
+    def _get(self, start: int = 0, end: Optional[int] = None):
+        # A length of 0 means until the end of the object
+        length = end - start if end is not None else 0
+        try:
+            return minio_client().get_object(
+                self.bucket, self.name, offset=start, length=length
+            )
+        except MinioException as e:
+            raise StorageException(f"{self.bucket}/{self.name}: {e}") from e
+
+    def _full_response(self):
+        if not self.response:
+            self.response = self._get()
+        return self.response
+
+    def read(self) -> bytes:
+        return self._full_response().read()
+
+    def read_range(self, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+        response = self._get(start, end)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def stream(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        return self._full_response().stream(chunk_size)
+
+    def stream_range(
+        self, start: int, end: int, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        if end <= start:
+            return
+        response = self._get(start, end)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def close(self):
+        if self.response:
+            self.response.close()
+            self.response.release_conn()
+
+
+class MinioStorage(Storage):
+    def setup(self):
+        setup_minio()
+
+    def put_object(
+        self,
+        bucket: str,
+        name: str,
+        data: IO[bytes],
+        length: int,
+        content_type: Optional[str] = None,
+    ):
+        try:
+            minio_client().put_object(
+                bucket,
+                name,
+                data,
+                length,
+                content_type=content_type or "application/octet-stream",
+            )
+        except MinioException as e:
+            raise StorageException(f"{bucket}/{name}: {e}") from e
+
+    def get_object(self, bucket: str, name: str) -> StoredObject:
+        try:
+            return MinioObject(bucket, name, minio_client().stat_object(bucket, name))
+        except MinioException as e:
+            raise StorageException(f"{bucket}/{name}: {e}") from e
+
+    def remove_object(self, bucket: str, name: str):
+        try:
+            minio_client().remove_object(bucket, name)
+        except MinioException as e:
+            raise StorageException(f"{bucket}/{name}: {e}") from e
+
+    def list_objects(self, bucket: str) -> Iterator[str]:
+        try:
+            for stored in minio_client().list_objects(bucket, recursive=True):
+                yield stored.object_name
+        except MinioException as e:
+            raise StorageException(f"{bucket}: {e}") from e
+
+
+class FilesystemObject(StoredObject):
+    """Range reads are served from a memory map, so they don't copy the file through a buffer"""
+
+    def __init__(self, path: str, content_type: Optional[str]):
+        self.local_path = path
+        self.content_type = content_type
+        self.fp = open(path, "rb")
+        stat = os.fstat(self.fp.fileno())
+        self.size = stat.st_size
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        self.mmap: Optional[mmap.mmap] = None
+
+    def read(self) -> bytes:
+        return self.fp.read()
+
+    def read_range(self, start: int, end: int) -> bytes:
+        # Empty files can't be mapped
+        if self.size == 0:
+            return b""
+        if not self.mmap:
+            self.mmap = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mmap[start:end]
+
+    def stream(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        return iter(lambda: self.fp.read(chunk_size), b"")
+
+    def stream_range(
+        self, start: int, end: int, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        for chunk_start in range(start, end, chunk_size):
+            yield self.read_range(chunk_start, min(chunk_start + chunk_size, end))
+
+    def close(self):
+        if self.mmap:
+            self.mmap.close()
+        self.fp.close()
+
+
+class FilesystemStorage(Storage):
+    """
+    Each bucket is a directory below the root. The content types are kept in a json file next to the object,
+    in a separate .meta directory so that they don't show up as objects.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def get_path(self, bucket: str, name: str, meta: bool = False) -> str:
+        if meta:
+            path = os.path.join(self.root, ".meta", bucket, name + ".json")
+        else:
+            path = os.path.join(self.root, bucket, name)
+        path = os.path.normpath(path)
+        # The names are ids, fingerprints or fixed paths, but better safe than sorry
+        if not path.startswith(self.root + os.sep):
+            raise StorageException(f"Invalid object name {name}")
+        return path
+
+    def setup(self):
+        for bucket in bucket_list:
+            bucket_path = os.path.join(self.root, settings.MINIO_PREFIX + bucket)
+            os.makedirs(bucket_path, exist_ok=True)
+
+    def _write_atomically(self, path: str, data: IO[bytes]):
+        """Readers never see a partially written object"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), prefix=".tmp-", delete=False
+        ) as tmp_file:
+            shutil.copyfileobj(data, tmp_file)
+        # Temporary files are private (0600), but e.g. nginx must be able to read the objects for X-Accel-Redirect
+        os.chmod(tmp_file.name, 0o666 & ~_umask)
+        os.replace(tmp_file.name, path)
+
+    def put_object(
+        self,
+        bucket: str,
+        name: str,
+        data: IO[bytes],
+        length: int,
+        content_type: Optional[str] = None,
+    ):
+        path = self.get_path(bucket, name)
+        meta = json.dumps({"content_type": content_type}).encode()
+        try:
+            self._write_atomically(path, data)
+            self._write_atomically(self.get_path(bucket, name, True), BytesIO(meta))
+        except OSError as e:
+            raise StorageException(f"{bucket}/{name}: {e}") from e
+
+    def get_object(self, bucket: str, name: str) -> StoredObject:
+        try:
+            with open(self.get_path(bucket, name, True)) as fp:
+                content_type = json.load(fp)["content_type"]
+        except (OSError, ValueError):
+            content_type = None
+
+        try:
+            return FilesystemObject(self.get_path(bucket, name), content_type)
+        except OSError as e:
+            raise StorageException(f"{bucket}/{name}: {e}") from e
+
+    def remove_object(self, bucket: str, name: str):
+        for path in [self.get_path(bucket, name), self.get_path(bucket, name, True)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                raise StorageException(f"{bucket}/{name}: {e}") from e
+
+    def list_objects(self, bucket: str) -> Iterator[str]:
+        bucket_path = os.path.join(self.root, bucket)
+        for directory, _, filenames in os.walk(bucket_path):
+            for filename in filenames:
+                # Skip the objects that are being written
+                if filename.startswith(".tmp-"):
+                    continue
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, bucket_path).replace(os.sep, "/")
+
+
+def get_storage() -> Storage:
+    if settings.STORAGE_BACKEND == "filesystem":
+        return FilesystemStorage(settings.STORAGE_DIRECTORY)
+    else:
+        return MinioStorage()
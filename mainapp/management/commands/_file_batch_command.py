@@ -0,0 +1,187 @@
+import logging
+import sys
+from abc import ABC, abstractmethod
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dateutil import parser as date_parser
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import QuerySet
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+from tqdm import tqdm
+
+from mainapp.functions.search import search_bulk_index
+from mainapp.functions.search_cache import bump_search_generation
+from mainapp.models import File
+
+logger = logging.getLogger(__name__)
+
+
+class FileBatchCommand(BaseCommand, ABC):
+    """
+    Base for the commands that analyse many files, e.g. to rebuild the persons or locations.
+
+    The file ids are split into batches which are processed in a process pool. Each worker loads its batch with
+    only the fields it needs, analyses the files one by one with `analyze_file` and writes the results back in bulk
+    with `save_results`. Only the files of the batch are then reindexed.
+
+    The batches are processed in the order of the ids, so an aborted run can be resumed with --start-id.
+    """
+
+    # The fields analyze_file needs, or None for all fields (e.g. when writing text with history)
+    fields: Optional[List[str]] = ["id", "name", "parsed_text"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--id", type=int, nargs="*", help="Only process the files with these ids"
+        )
+        parser.add_argument(
+            "--since", help="Only process files that were modified since this date"
+        )
+        parser.add_argument(
+            "--start-id", type=int, help="Resume with the file with this id"
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            help="Use only that many processes. With 1, everything runs in this process",
+        )
+
+    def get_queryset(self, options: Dict[str, Any]) -> QuerySet:
+        """The files to process, before filtering by --id, --since and --start-id"""
+        return File.objects.all()
+
+    def get_context(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Data computed once and passed to the workers, which must be picklable"""
+        return {}
+
+    @classmethod
+    @abstractmethod
+    def analyze_file(cls, file: File, context: Dict[str, Any]) -> Any:
+        """Runs in the workers. Results that are None are not saved"""
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def save_results(cls, results: List[Tuple[File, Any]], context: Dict[str, Any]):
+        """Runs in the workers. Writes the results of a batch back with bulk queries"""
+        raise NotImplementedError
+
+    def finish(self, options: Dict[str, Any], started: datetime):
+        """Called after all batches were processed"""
+
+    @classmethod
+    def process_batch(cls, file_ids: List[int], context: Dict[str, Any]) -> int:
+        """Returns the number of files with results"""
+        # The parsed text is deferred by default
+        files = File.objects.filter(id__in=file_ids).order_by("id").defer(None)
+        if cls.fields:
+            files = files.only(*cls.fields)
+
+        results = []
+        for file in files:
+            try:
+                result = cls.analyze_file(file, context)
+            except Exception as e:
+                logger.exception(f"File {file.id}: Failed to analyze: {e}")
+                continue
+            if result is not None:
+                results.append((file, result))
+
+        if results:
+            cls.save_results(results, context)
+            if settings.ELASTICSEARCH_ENABLED:
+                search_bulk_index(
+                    File, File.objects.filter(id__in=[file.id for file, _ in results])
+                )
+        return len(results)
+
+    def wait_for_batches(
+        self, batches: List[List[int]], results: Iterable[int], pbar: Optional[tqdm]
+    ) -> int:
+        with_results = 0
+        for batch, count in zip(batches, results):
+            with_results += count
+            logger.info(
+                f"Processed the files up to id {batch[-1]}, "
+                f"resume with --start-id {batch[-1] + 1}"
+            )
+            if pbar:
+                pbar.update(len(batch))
+        return with_results
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        files = self.get_queryset(options)
+        if options["id"]:
+            files = files.filter(id__in=options["id"])
+        if options["since"]:
+            since = date_parser.parse(options["since"])
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            files = files.filter(modified__gte=since)
+        if options["start_id"]:
+            files = files.filter(id__gte=options["start_id"])
+
+        # We need to build a list because mysql connections and process pools don't pair well.
+        file_ids = list(files.order_by("id").values_list("id", flat=True))
+        batch_size = options["batch_size"]
+        batches = [
+            file_ids[i : i + batch_size] for i in range(0, len(file_ids), batch_size)
+        ]
+        context = self.get_context(options)
+        logger.info(f"Processing {len(file_ids)} files in {len(batches)} batches")
+
+        pbar = None
+        if sys.stdout.isatty() and not settings.TESTING:
+            pbar = tqdm(total=len(file_ids))
+
+        if options["max_workers"] == 1:
+            results = map(self.process_batch, batches, repeat(context))
+            with_results = self.wait_for_batches(batches, results, pbar)
+        else:
+            # The workers open their own connections, see the importer
+            db.connections.close_all()
+            with ProcessPoolExecutor(max_workers=options["max_workers"]) as executor:
+                results = executor.map(self.process_batch, batches, repeat(context))
+                with_results = self.wait_for_batches(batches, results, pbar)
+
+        if pbar:
+            pbar.close()
+
+        self.stdout.write(f"Updated {with_results} of {len(file_ids)} files")
+        self.finish(options, started)
+        bump_search_generation()
+
+
+def set_many_to_many(files_to_related: Dict[int, List[int]], field_name: str):
+    """Replaces the related objects of many files with two queries instead of calling `.set()` for each file"""
+    field = File._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_field_name() + "_id"
+    target = field.m2m_reverse_field_name() + "_id"
+
+    through.objects.filter(**{source + "__in": list(files_to_related)}).delete()
+    through.objects.bulk_create(
+        [
+            through(**{source: file_id, target: related_id})
+            for file_id, related_ids in files_to_related.items()
+            for related_id in set(related_ids)
+        ]
+    )
+    # The modified date should reflect the change as it did with file.save()
+    File.objects.filter(id__in=list(files_to_related)).update(modified=timezone.now())
+
+
+def update_parsed_text(files: List[File]):
+    """Saves the changed parsed_text of the files, including the history"""
+    now = timezone.now()
+    for file in files:
+        file.modified = now
+    bulk_update_with_history(files, File, ["parsed_text", "modified"])
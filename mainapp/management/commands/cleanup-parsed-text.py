@@ -1,19 +1,33 @@
-import logging
+from typing import Any, Dict, List, Optional, Tuple
 
-from django.core.management.base import BaseCommand
+from django.db.models import QuerySet
 
 from mainapp.functions.document_parsing import cleanup_extracted_text
+from mainapp.management.commands._file_batch_command import (
+    FileBatchCommand,
+    update_parsed_text,
+)
 from mainapp.models import File
 
-logger = logging.getLogger(__name__)
 
-
-class Command(BaseCommand):
+class Command(FileBatchCommand):
     help = "Fixes the parsed_text"
 
-    def handle(self, *args, **options):
-        files = File.objects.all()
-        for file in files:
-            if file.parsed_text:
-                file.parsed_text = cleanup_extracted_text(file.parsed_text)
-                file.save()
+    # The history needs the complete rows
+    fields = None
+
+    def get_queryset(self, options: Dict[str, Any]) -> QuerySet:
+        return File.objects.exclude(parsed_text="").filter(parsed_text__isnull=False)
+
+    @classmethod
+    def analyze_file(cls, file: File, context: Dict[str, Any]) -> Optional[str]:
+        parsed_text = cleanup_extracted_text(file.parsed_text)
+        if parsed_text == file.parsed_text:
+            return None
+        return parsed_text
+
+    @classmethod
+    def save_results(cls, results: List[Tuple[File, str]], context: Dict[str, Any]):
+        for file, parsed_text in results:
+            file.parsed_text = parsed_text
+        update_parsed_text([file for file, _ in results])
@@ -0,0 +1,49 @@
+import logging
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db.models import QuerySet
+
+from mainapp.functions.file_previews import create_previews
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.storage import get_storage
+from mainapp.management.commands._file_batch_command import FileBatchCommand
+from mainapp.models import File
+
+logger = logging.getLogger(__name__)
+
+
+class Command(FileBatchCommand):
+    help = "Renders the previews of the pdfs that were imported before the importer created them"
+
+    fields = ["id", "mime_type"]
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Also render the previews of files that already have them",
+        )
+
+    def get_queryset(self, options: Dict[str, Any]) -> QuerySet:
+        files = File.objects.filter(mime_type__startswith="application/pdf")
+        if not options["all"]:
+            files = files.filter(preview_available=False)
+        return files
+
+    @classmethod
+    def analyze_file(cls, file: File, context: Dict[str, Any]) -> Optional[bool]:
+        with NamedTemporaryFile(suffix=".pdf") as tmp_file:
+            with get_storage().get_object(minio_file_bucket, str(file.id)) as stored:
+                tmp_file.write(stored.read())
+            tmp_file.flush()
+            if not create_previews(file.id, tmp_file.name):
+                return None
+        return True
+
+    @classmethod
+    def save_results(cls, results: List[Tuple[File, bool]], context: Dict[str, Any]):
+        File.objects.filter(id__in=[file.id for file, _ in results]).update(
+            preview_available=True
+        )
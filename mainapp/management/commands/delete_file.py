@@ -1,5 +1,5 @@
 """
-Manually delete a file from minio
+Manually delete a file from the storage
 """
 from django.core.management.base import BaseCommand
 
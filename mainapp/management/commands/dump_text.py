@@ -1,29 +1,161 @@
 """
-Quick and dirty solution to quickly dump out potentially gigabytes of text into a json file
+Exports the text extracted from the files as compressed JSON lines or parquet, e.g. for data analysis.
+
+The files are read in chunks ordered by id (keyset pagination), so memory use is bounded by the chunk size and not by
+the size of the corpus.
 """
-from django.core.management.base import BaseCommand
+import gzip
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from dateutil import parser as date_parser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import QuerySet
+from django.utils import timezone
 from tqdm import tqdm
 
 from mainapp.models import File
 
-import json
+fields = ["id", "name", "page_count", "sort_date", "parsed_text"]
+
+
+class JsonLinesWriter:
+    """One gzip compressed json object per line"""
+
+    suffix = ".jsonl.gz"
+
+    def __init__(self, path: Path):
+        self.fp = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            row = dict(row, sort_date=row["sort_date"].isoformat())
+            self.fp.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.fp.close()
+
+
+class ParquetWriter:
+    """Zstd compressed parquet, written one row group per chunk. Needs pyarrow"""
+
+    suffix = ".parquet"
+
+    def __init__(self, path: Path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise CommandError(
+                "Exporting to parquet needs pyarrow (poetry install --extras parquet)"
+            )
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema(
+            [
+                ("id", pyarrow.int64()),
+                ("name", pyarrow.string()),
+                ("page_count", pyarrow.int32()),
+                ("sort_date", pyarrow.timestamp("us", tz="UTC")),
+                ("parsed_text", pyarrow.string()),
+            ]
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(
+            str(path), self.schema, compression="zstd"
+        )
+
+    def write(self, rows: List[Dict[str, Any]]):
+        # Table.from_pylist only exists since pyarrow 7
+        columns = {name: [row[name] for row in rows] for name in self.schema.names}
+        table = self.pyarrow.Table.from_pydict(columns, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+writers = {"jsonl": JsonLinesWriter, "parquet": ParquetWriter}
 
 
 class Command(BaseCommand):
-    help = "Dump all text extracted from the pdfs to a json file"
+    help = "Dump all text extracted from the pdfs to compressed json lines or parquet files"
 
     def add_arguments(self, parser):
-        parser.add_argument("target")
+        parser.add_argument(
+            "target",
+            help="The output file, without suffix. With --shard-size, the shards are numbered",
+        )
+        parser.add_argument("--format", choices=writers.keys(), default="jsonl")
+        parser.add_argument(
+            "--since",
+            help="Only export the files that were modified since this date, for incremental exports",
+        )
+        parser.add_argument(
+            "--shard-size", type=int, help="Start a new file after that many files"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="How many files are loaded from the database at once",
+        )
+
+    def iter_chunks(
+        self, files: QuerySet, chunk_size: int
+    ) -> Iterator[List[Dict[str, Any]]]:
+        last_id = 0
+        while True:
+            chunk = list(
+                files.filter(id__gt=last_id).order_by("id").values(*fields)[:chunk_size]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1]["id"]
 
     def handle(self, *args, **options):
-        with open(options["target"], "w") as fp:
-            fp.write("{\n")
-            total = File.objects.count()
-            for i, file in tqdm(enumerate(File.objects.all()), total=total):
-                fp.write(f'    "{file.id}": ')
-                fp.write(json.dumps(file.parsed_text))
-                if i < total - 1:
-                    fp.write(",\n")
-                else:
-                    fp.write("\n")
-            fp.write("}")
+        started = timezone.now()
+        writer_class = writers[options["format"]]
+        shard_size = options["shard_size"]
+        target = options["target"]
+
+        files = File.objects.all()
+        if options["since"]:
+            since = date_parser.parse(options["since"])
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            files = files.filter(modified__gte=since)
+
+        shards = 0
+        writer = None
+        written_to_shard = 0
+        with tqdm(total=files.count(), disable=None) as pbar:
+            for chunk in self.iter_chunks(files, options["chunk_size"]):
+                while chunk:
+                    if not writer or (shard_size and written_to_shard >= shard_size):
+                        if writer:
+                            writer.close()
+                        if shard_size:
+                            path = Path(f"{target}-{shards:05d}{writer_class.suffix}")
+                        else:
+                            path = Path(target + writer_class.suffix)
+                        writer = writer_class(path)
+                        shards += 1
+                        written_to_shard = 0
+
+                    if shard_size:
+                        rows = chunk[: shard_size - written_to_shard]
+                    else:
+                        rows = chunk
+                    chunk = chunk[len(rows) :]
+                    writer.write(rows)
+                    written_to_shard += len(rows)
+                    pbar.update(len(rows))
+
+        if writer:
+            writer.close()
+
+        self.stdout.write(
+            f"Wrote {shards} file(s). Use --since {started.isoformat()} for the next incremental export"
+        )
@@ -1,24 +1,39 @@
 import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.core.management.base import CommandError
+from django.db.models import Q, QuerySet
 
 from mainapp.functions.document_parsing import (
-    get_ocr_text_from_pdf,
     extract_persons,
     cleanup_extracted_text,
     extract_locations,
+    geocode_new_locations,
+    get_address_pipeline,
+)
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.ocr import get_ocr_text_from_pdf
+from mainapp.functions.storage import get_storage
+from mainapp.management.commands._file_batch_command import (
+    FileBatchCommand,
+    set_many_to_many,
+    update_parsed_text,
 )
-from mainapp.functions.minio import minio_client, minio_file_bucket
 from mainapp.models import File, Body
 
+logger = logging.getLogger(__name__)
+
 
-class Command(BaseCommand):
+class Command(FileBatchCommand):
     help = "OCRs a file and writes the result back to the database"
 
+    # The history needs the complete rows
+    fields = None
+
     def add_arguments(self, parser):
-        parser.add_argument("--id", type=int, help="OCR the file with the given ID")
+        super().add_arguments(parser)
         parser.add_argument(
             "--empty",
             dest="all_empty",
@@ -26,31 +41,56 @@ class Command(BaseCommand):
             help="OCR all files with empty parsed_text",
         )
 
-    def parse_file(self, file: File, fallback_city: str):
-        logging.info("- Parsing: " + str(file.id) + " (" + file.name + ")")
-        with minio_client().get_object(minio_file_bucket, str(file.id)) as file_handle:
-            recognized_text = get_ocr_text_from_pdf(file_handle.read())
-        if len(recognized_text) > 0:
-            file.parsed_text = cleanup_extracted_text(recognized_text)
-            file.mentioned_persons = extract_persons(
-                file.name + "\n" + (recognized_text or "") + "\n"
-            )
-            file.locations.set(extract_locations(file.parsed_text, fallback_city))
-            file.save()
-        else:
-            logging.warning("Nothing recognized")
-
-    def handle(self, *args, **options):
-        fallback_city = Body.objects.get(id=settings.SITE_DEFAULT_BODY).short_name
+    def get_queryset(self, options: Dict[str, Any]) -> QuerySet:
         if options["all_empty"]:
-            all_files = File.objects.filter(
-                Q(parsed_text="") | Q(parsed_text__isnull=True)
-            ).all()
-            for file in all_files:
-                try:
-                    self.parse_file(file, fallback_city)
-                except Exception as e:
-                    logging.error("Error parsing file {}: {}".format(str(file.id), e))
+            return File.objects.filter(Q(parsed_text="") | Q(parsed_text__isnull=True))
         elif options["id"]:
-            file = File.objects.get(id=options["id"])
-            self.parse_file(file, fallback_city)
+            return File.objects.all()
+        else:
+            raise CommandError("Please pass either --empty or --id")
+
+    def get_context(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "fallback_city": Body.objects.get(id=settings.SITE_DEFAULT_BODY).short_name,
+            "address_pipeline_checksum": get_address_pipeline().checksum,
+        }
+
+    @classmethod
+    def analyze_file(
+        cls, file: File, context: Dict[str, Any]
+    ) -> Optional[Tuple[List[int], List[int]]]:
+        logger.info("- Parsing: " + str(file.id) + " (" + file.name + ")")
+        with get_storage().get_object(minio_file_bucket, str(file.id)) as file_handle:
+            recognized_text = get_ocr_text_from_pdf(file_handle.read())
+        if not recognized_text:
+            logger.warning(f"File {file.id}: Nothing recognized")
+            return None
+
+        file.parsed_text = cleanup_extracted_text(recognized_text)
+        persons = extract_persons(file.name + "\n" + recognized_text + "\n")
+        pipeline = get_address_pipeline(context["address_pipeline_checksum"])
+        locations = extract_locations(
+            file.parsed_text, context["fallback_city"], pipeline
+        )
+        person_ids = [person.id for person in persons]
+        location_ids = [location.id for location in locations]
+        return person_ids, location_ids
+
+    @classmethod
+    def save_results(
+        cls,
+        results: List[Tuple[File, Tuple[List[int], List[int]]]],
+        context: Dict[str, Any],
+    ):
+        update_parsed_text([file for file, _ in results])
+        set_many_to_many(
+            {file.id: person_ids for file, (person_ids, _) in results},
+            "mentioned_persons",
+        )
+        set_many_to_many(
+            {file.id: location_ids for file, (_, location_ids) in results},
+            "locations",
+        )
+
+    def finish(self, options: Dict[str, Any], started: datetime):
+        geocode_new_locations(started)
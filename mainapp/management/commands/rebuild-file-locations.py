@@ -1,44 +1,58 @@
-import logging
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-
-from mainapp.functions.document_parsing import extract_locations
+from django.core.management.base import CommandError
+from django.db.models import QuerySet
+
+from mainapp.functions.document_parsing import (
+    extract_locations,
+    geocode_new_locations,
+    get_address_pipeline,
+)
+from mainapp.management.commands._file_batch_command import (
+    FileBatchCommand,
+    set_many_to_many,
+)
 from mainapp.models import File, Body
 
-logger = logging.getLogger(__name__)
-
 
-class Command(BaseCommand):
+class Command(FileBatchCommand):
     help = "Rebuilds the file locations"
 
     def add_arguments(self, parser):
-        parser.add_argument("--id", type=int, nargs="*", help="Rebuild only one file")
+        super().add_arguments(parser)
         parser.add_argument(
             "--all", dest="all", action="store_true", help="Rebuild all files"
         )
 
-    def parse_file(self, file: File, fallback_city: str):
-        self.stdout.write("Parsing: " + str(file.id) + " (" + file.name + ")")
-        locations = extract_locations(file.parsed_text, fallback_city)
-        self.stdout.write("{} locations found".format(len(locations)))
-        file.locations.set(locations)
-        file.save()
-
-    def handle(self, *args, **options):
-        fallback_city = Body.objects.get(id=settings.SITE_DEFAULT_BODY).short_name
-
-        if options["all"]:
-            all_files = File.objects.all()
-            for file in all_files:
-                try:
-                    self.parse_file(file, fallback_city)
-                except Exception as e:
-                    logger.exception(str(e))
-                    self.stderr.write(
-                        "Error parsing file: {}: {}".format(str(file.id), e)
-                    )
-        elif options["id"]:
-            for file_id in options["id"]:
-                file = File.objects.get(id=file_id)
-                self.parse_file(file, fallback_city)
+    def get_queryset(self, options: Dict[str, Any]) -> QuerySet:
+        if not options["all"] and not options["id"]:
+            raise CommandError("Please pass either --all or --id")
+        return File.objects.all()
+
+    def get_context(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "fallback_city": Body.objects.get(id=settings.SITE_DEFAULT_BODY).short_name,
+            # This builds and persists the address pipeline snapshot, which the workers then load
+            "address_pipeline_checksum": get_address_pipeline().checksum,
+        }
+
+    @classmethod
+    def analyze_file(cls, file: File, context: Dict[str, Any]) -> List[int]:
+        pipeline = get_address_pipeline(context["address_pipeline_checksum"])
+        locations = extract_locations(
+            file.parsed_text, context["fallback_city"], pipeline
+        )
+        return [location.id for location in locations]
+
+    @classmethod
+    def save_results(
+        cls, results: List[Tuple[File, List[int]]], context: Dict[str, Any]
+    ):
+        set_many_to_many(
+            {file.id: location_ids for file, location_ids in results}, "locations"
+        )
+
+    def finish(self, options: Dict[str, Any], started: datetime):
+        geocode_new_locations(started)
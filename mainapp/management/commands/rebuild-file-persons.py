@@ -1,31 +1,27 @@
-import logging
+from typing import Any, Dict, List, Tuple
 
-from django.core.management.base import BaseCommand
-
-from mainapp.functions.document_parsing import extract_persons
+from mainapp.functions.document_parsing import get_person_matcher
+from mainapp.management.commands._file_batch_command import (
+    FileBatchCommand,
+    set_many_to_many,
+)
 from mainapp.models import File
 
 
-class Command(BaseCommand):
+class Command(FileBatchCommand):
     help = 'Rebuilds the "mentioned persons"-table'
 
-    def add_arguments(self, parser):
-        parser.add_argument(
-            "--id", type=int, help="Parse only the file with the given ID"
-        )
-
-    def parse_file(self, file: File):
-        logging.info("- Parsing: " + str(file.id) + " (" + file.name + ")")
-        file.mentioned_persons = extract_persons(
+    @classmethod
+    def analyze_file(cls, file: File, context: Dict[str, Any]) -> List[int]:
+        persons = get_person_matcher().find(
             file.name + "\n" + (file.parsed_text or "") + "\n"
         )
-        file.save()
+        return [person.id for person in persons]
 
-    def handle(self, *args, **options):
-        if options["id"]:
-            file = File.objects.get(id=options["id"])
-            self.parse_file(file)
-        else:
-            files = File.objects.all()
-            for file in files:
-                self.parse_file(file)
+    @classmethod
+    def save_results(
+        cls, results: List[Tuple[File, List[int]]], context: Dict[str, Any]
+    ):
+        set_many_to_many(
+            {file.id: person_ids for file, person_ids in results}, "mentioned_persons"
+        )
@@ -2,17 +2,17 @@ from typing import Set
 
 from django.core.management.base import BaseCommand
 
-from mainapp.functions.minio import minio_client, minio_file_bucket
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.storage import get_storage
 from mainapp.models import File
 
 
 class Command(BaseCommand):
-    help = "Marks files as missing in the database that are deleted in minio"
+    help = "Marks files as missing in the database that are deleted in the storage"
 
     def handle(self, *args, **options):
         existing_files = set(
-            int(file.object_name)
-            for file in minio_client().list_objects(minio_file_bucket)
+            int(name) for name in get_storage().list_objects(minio_file_bucket)
         )
         expected_files: Set[int] = set(
             File.objects.filter(filesize__gt=0).values_list("id", flat=True)
@@ -20,6 +20,6 @@ class Command(BaseCommand):
         missing_files = expected_files - existing_files
         if len(missing_files) > 0:
             self.stdout.write(
-                f"{len(missing_files)} files are marked as imported but aren't available in minio"
+                f"{len(missing_files)} files are marked as imported but aren't available in the storage"
             )
             File.objects.filter(id__in=missing_files).update(filesize=None)
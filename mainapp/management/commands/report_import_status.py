@@ -7,7 +7,8 @@ from django.db.models import Count
 from django.db.models import Model
 
 from mainapp import models
-from mainapp.functions.minio import minio_client, minio_file_bucket
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.storage import get_storage
 from mainapp.models import File, Body, UserAlert
 
 logger = logging.getLogger(__name__)
@@ -59,11 +60,9 @@ class Command(BaseCommand):
             f"There are {alerts} alerts by {users_with_alerts} of {users} users"
         )
 
-        # Check if there are files which are listed as imported but aren't in minio
-        # We convert everything to strings because there might be non-numeric files in minio
-        existing_files = set(
-            file.object_name for file in minio_client().list_objects(minio_file_bucket)
-        )
+        # Check if there are files which are listed as imported but aren't in the storage
+        # We convert everything to strings because there might be non-numeric files in the storage
+        existing_files = set(get_storage().list_objects(minio_file_bucket))
         expected_files = set(
             str(i)
             for i in File.objects.filter(filesize__gt=0).values_list("id", flat=True)
@@ -71,5 +70,5 @@ class Command(BaseCommand):
         missing_files = len(expected_files - existing_files)
         if missing_files > 0:
             self.stdout.write(
-                f"{missing_files} files are marked as imported but aren't available in minio"
+                f"{missing_files} files are marked as imported but aren't available in the storage"
             )
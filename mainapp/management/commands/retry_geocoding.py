@@ -3,7 +3,7 @@ import logging
 from django.core.management.base import BaseCommand
 from tqdm import tqdm
 
-from mainapp.functions.geo_functions import geocode
+from mainapp.functions.geo_functions import geocode_many
 from mainapp.models import Location
 
 logger = logging.getLogger(__name__)
@@ -18,10 +18,17 @@ class Command(BaseCommand):
         )
         total = without_geometry.count()
         fixed = 0
-        for location in tqdm(without_geometry.all(), total=total):
-            geometry = geocode(location.search_str)
-            if geometry:
-                location.geometry = geometry
-                location.save()
-                fixed += 1
+        locations = list(without_geometry)
+        with tqdm(total=total) as pbar:
+            # Addresses that weren't found recently are answered by the geocoding cache
+            for i in range(0, len(locations), 100):
+                chunk = locations[i : i + 100]
+                geometries = geocode_many(location.search_str for location in chunk)
+                for location in chunk:
+                    geometry = geometries[location.search_str]
+                    if geometry:
+                        location.geometry = geometry
+                        location.save()
+                        fixed += 1
+                pbar.update(len(chunk))
         logger.info(f"Fixed {fixed} of {total}")
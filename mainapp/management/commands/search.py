@@ -1,22 +1,166 @@
 import json
+import statistics
+import time
+from typing import Any, Dict, List
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch_dsl import Search
 
-from mainapp.functions.search import search_string_to_params, MainappSearch
+from mainapp.functions.search import (
+    search_string_to_params,
+    MainappSearch,
+    params_to_search_string,
+)
+
+
+def format_nanos(nanos: int) -> str:
+    return "{:.2f}ms".format(nanos / 1_000_000)
 
 
 class Command(BaseCommand):
-    help = "Executes a search query, printing the query and the raw response"
+    help = (
+        "Executes a search query, printing the query and the raw response. "
+        "With --profile, it shows where elasticsearch spends the time, "
+        "and with --replay it benchmarks the searches from a file"
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("search")
+        parser.add_argument("search", nargs="?")
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Show the time spent in each query clause, in the aggregations and in the highlighting",
+        )
+        parser.add_argument(
+            "--replay",
+            help="A file with searches, either the search-slow.log or one search string per line",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="How often each search is run for --profile and --replay (default 3)",
+        )
 
     def handle(self, *args, **options):
+        if options["replay"]:
+            self.replay(options["replay"], options["repeat"])
+            return
+        if options["search"] is None:
+            raise CommandError("You need to pass a search or --replay")
+
         self.stdout.write("Searching for '{}'".format(options["search"]))
         params = search_string_to_params(options["search"])
+        if options["profile"]:
+            self.profile(params, options["repeat"])
+            return
+
         main_search = MainappSearch(params)
         search = main_search.build_search()
         self.stdout.write(json.dumps(search.to_dict()))
         executed = main_search.execute()
         del executed["_faceted_search"]
         self.stdout.write(json.dumps(executed.to_dict()))
+
+    def write_profile(self, node: Dict[str, Any], depth: int):
+        description = node["description"].replace("\n", " ")[:120]
+        self.stdout.write(
+            "{}{} {} {}".format(
+                "  " * depth,
+                format_nanos(node["time_in_nanos"]),
+                node["type"],
+                description,
+            )
+        )
+        for child in node.get("children", []):
+            self.write_profile(child, depth + 1)
+
+    def median_took(self, search: Search, repeat: int) -> float:
+        return statistics.median(
+            search.execute(ignore_cache=True).took for _ in range(repeat)
+        )
+
+    def write_search_profile(self, title: str, search: Search):
+        profiled = search.extra(profile=True).execute(ignore_cache=True).to_dict()
+        self.stdout.write(
+            "{}: took {}ms with profiling".format(title, profiled["took"])
+        )
+        for shard in profiled["profile"]["shards"]:
+            self.stdout.write(shard["id"])
+            for search_profile in shard["searches"]:
+                for query in search_profile["query"]:
+                    self.write_profile(query, 1)
+                self.stdout.write(
+                    "  {} rewrite".format(format_nanos(search_profile["rewrite_time"]))
+                )
+            for aggregation in shard["aggregations"]:
+                self.write_profile(aggregation, 1)
+
+    def profile(self, params: Dict[str, str], repeat: int):
+        main_search = MainappSearch(params)
+        # This decides whether the fuzzy query is needed and finds the files to highlight
+        raw = main_search.execute().to_dict()
+        self.stdout.write("Fuzzy query: {}".format(main_search.fuzzy))
+
+        # The parsed texts are searched first, in their own index, see MainappSearch.file_text_search
+        if main_search.searches_file_texts():
+            text_search = main_search.file_text_search()
+            self.write_search_profile("File text search", text_search)
+            self.stdout.write(
+                "Median took: {}ms".format(self.median_took(text_search, repeat))
+            )
+
+        self.write_search_profile("Main search", main_search.build_search())
+        # The highlighting happens in the fetch phase, which isn't profiled, so we compare with a search without it
+        took = self.median_took(main_search.build_search(), repeat)
+        main_search.highlight = lambda search: search
+        took_without_highlight = self.median_took(main_search.build_search(), repeat)
+        self.stdout.write(
+            "Median took: {}ms, of which {}ms highlighting".format(
+                took, took - took_without_highlight
+            )
+        )
+
+        # The texts of the files on the page are highlighted with a separate search, which is mostly highlighting
+        highlight_search = main_search.file_text_highlight_search(raw)
+        if highlight_search is not None:
+            self.write_search_profile("File text highlighting", highlight_search)
+            self.stdout.write(
+                "Median took: {}ms".format(self.median_took(highlight_search, repeat))
+            )
+
+    def replay(self, path: str, repeat: int):
+        searches: List[Dict[str, str]] = []
+        with open(path) as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("{"):
+                    searches.append(json.loads(line)["params"])
+                else:
+                    searches.append(search_string_to_params(line))
+
+        results = []
+        for params in searches:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                MainappSearch(params).execute()
+                times.append((time.perf_counter() - start) * 1000)
+            results.append((statistics.median(times), max(times), params))
+
+        results.sort(key=lambda result: result[0], reverse=True)
+        self.stdout.write("median ms   max ms  search")
+        for median, maximum, params in results:
+            self.stdout.write(
+                "{:9.1f} {:8.1f}  {}".format(
+                    median, maximum, params_to_search_string(params)
+                )
+            )
+        total = sum(result[0] for result in results)
+        self.stdout.write(
+            "{} searches, {:.1f}ms in total (sum of the medians)".format(
+                len(results), total
+            )
+        )
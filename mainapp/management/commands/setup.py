@@ -3,17 +3,18 @@ from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django_elasticsearch_dsl.registries import registry
 
-from mainapp.functions.minio import setup_minio
+from mainapp.functions.db_search import create_fulltext_indexes
+from mainapp.functions.storage import get_storage
 
 
 class Command(BaseCommand):
-    help = "Set all database up (mariadb, elasticsearch and minio)"
+    help = "Set all database up (mariadb, elasticsearch and minio or the storage directory)"
 
     def handle(self, *args, **options):
         self.stdout.write("Running migrations")
         call_command("migrate")
-        self.stdout.write("Creating minio buckets")
-        setup_minio()
+        self.stdout.write("Creating the storage buckets")
+        get_storage().setup()
         if settings.ELASTICSEARCH_ENABLED:
             self.stdout.write("Creating elasticsearch indices")
             # The logic comes from django_elasticsearch_dsl.managment.commands.search_index:_create
@@ -28,4 +29,8 @@ class Command(BaseCommand):
                 # See also https://github.com/elastic/elasticsearch/issues/19862
                 index.create(ignore=400)
         else:
-            self.stdout.write("Elasticsearch is disabled; Not creating any indices")
+            self.stdout.write(
+                "Elasticsearch is disabled; Creating the full-text indexes for the database search"
+            )
+            for name in create_fulltext_indexes():
+                self.stdout.write("Created the full-text index '{}'".format(name))
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.12 on 2026-10-19 03:02
+
+from django.db import migrations, models
+import django.utils.timezone
+import djgeojson.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0030_auto_20210125_1431'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedGeocode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('search_str', models.CharField(max_length=767, unique=True)),
+                ('geometry', djgeojson.fields.GeometryField(default=None, null=True)),
+                ('geocoder', models.CharField(blank=True, max_length=20, null=True)),
+                ('fetched', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
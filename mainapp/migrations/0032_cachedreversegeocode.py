@@ -0,0 +1,26 @@
+# Generated by Django 3.1.12 on 2026-10-19 03:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0031_cachedgeocode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedReverseGeocode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fetched', models.DateTimeField(default=django.utils.timezone.now)),
+                ('coordinates', models.CharField(max_length=50, unique=True)),
+                ('address', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.12 on 2026-10-19 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0032_cachedreversegeocode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='preview_available',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='historicalfile',
+            name='preview_available',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from .agenda_item import AgendaItem
 from .body import Body
+from .cached_geocode import CachedGeocode, CachedReverseGeocode
 from .consultation import Consultation
 from .file import File
 from .helper import DefaultFields
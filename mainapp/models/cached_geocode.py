@@ -0,0 +1,61 @@
+from abc import abstractmethod
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from djgeojson.fields import GeometryField
+
+
+class GeocodingCacheEntry(models.Model):
+    """Common expiry logic for the geocoding caches"""
+
+    fetched = models.DateTimeField(default=timezone.now)
+
+    @abstractmethod
+    def is_found(self) -> bool:
+        """Whether the geocoder found something. Found entries expire after GEOCODING_CACHE_DAYS"""
+        raise NotImplementedError
+
+    def is_expired(self) -> bool:
+        if self.is_found():
+            max_age = timedelta(days=settings.GEOCODING_CACHE_DAYS)
+        else:
+            max_age = timedelta(days=settings.GEOCODING_CACHE_NEGATIVE_DAYS)
+        return self.fetched + max_age < timezone.now()
+
+    class Meta:
+        abstract = True
+
+
+class CachedGeocode(GeocodingCacheEntry):
+    """
+    The result of geocoding a (normalized) search string, so that we ask the geocoders only once
+    for each address. Addresses that couldn't be found are cached with an empty geometry.
+    """
+
+    search_str = models.CharField(max_length=767, unique=True)
+    geometry = GeometryField(null=True, default=None)
+    geocoder = models.CharField(max_length=20, null=True, blank=True)
+
+    def is_found(self) -> bool:
+        return bool(self.geometry)
+
+    def __str__(self):
+        return "{}: {}".format(self.search_str, self.geometry)
+
+
+class CachedReverseGeocode(GeocodingCacheEntry):
+    """
+    The address for coordinates snapped to a grid (see REVERSE_GEOCODING_GRID), so that searches
+    around nearly the same point share an entry.
+    """
+
+    coordinates = models.CharField(max_length=50, unique=True)
+    address = models.TextField(null=True, blank=True)
+
+    def is_found(self) -> bool:
+        return bool(self.address)
+
+    def __str__(self):
+        return "{}: {}".format(self.coordinates, self.address)
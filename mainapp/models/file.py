@@ -5,8 +5,13 @@ from dateutil import tz
 from django.db import models
 from django.urls import reverse
 
-from mainapp.functions.minio import minio_client, minio_file_bucket
-from .helper import DefaultFields
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.storage import get_storage
+from .helper import (
+    DefaultFields,
+    SoftDeleteModelManager,
+    SoftDeleteModelManagerWithDeleted,
+)
 from .location import Location
 from .person import Person
 
@@ -14,6 +19,21 @@ from .person import Person
 fallback_date = datetime(1995, 1, 1, 0, 0, 0, tzinfo=tz.tzlocal())
 
 
+class FileManager(SoftDeleteModelManager):
+    """
+    The parsed text can be megabytes large and is needed only by few pages, so it's only loaded on access.
+    Use `.defer(None)` where the text of many files is needed to avoid one query per file.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer("parsed_text")
+
+
+class FileManagerWithDeleted(SoftDeleteModelManagerWithDeleted):
+    def get_queryset(self):
+        return super().get_queryset().defer("parsed_text")
+
+
 class File(DefaultFields):
     name = models.CharField(max_length=200)
     filename = models.CharField(max_length=200)
@@ -31,11 +51,16 @@ class File(DefaultFields):
     description = models.TextField(null=True, blank=True)
     # Sometimes we need to delete file even if they were not deleted at the source
     manually_deleted = models.BooleanField(default=False)
+    # Whether there are images of the first page in the cache bucket, see file_previews.py
+    preview_available = models.BooleanField(default=False)
 
     # Store these values for we might need them for a proxy
     oparl_access_url = models.CharField(max_length=512, null=True, blank=True)
     oparl_download_url = models.CharField(max_length=512, null=True, blank=True)
 
+    objects = FileManager()
+    objects_with_deleted = FileManagerWithDeleted()
+
     def __str__(self):
         return self.filename or self.name
 
@@ -54,6 +79,16 @@ class File(DefaultFields):
     def get_default_link(self):
         return reverse("file", args=[self.id])
 
+    def get_thumbnail_url(self) -> Optional[str]:
+        if not self.preview_available:
+            return None
+        return reverse("file-preview", args=[self.id, "thumbnail"])
+
+    def get_preview_url(self) -> Optional[str]:
+        if not self.preview_available:
+            return None
+        return reverse("file-preview", args=[self.id, "preview"])
+
     def name_autocomplete(self):
         return self.name if len(self.name) > 0 else " "
 
@@ -62,10 +97,14 @@ class File(DefaultFields):
 
     def manually_delete(self):
         """Sometimes we need to delete files even if they were not deleted at the source"""
+        from mainapp.functions.file_previews import delete_previews
+
         self.deleted = True
         self.manually_deleted = True
+        self.preview_available = False
         self.save()
-        minio_client().remove_object(minio_file_bucket, str(self.id))
+        get_storage().remove_object(minio_file_bucket, str(self.id))
+        delete_previews(self.id)
 
     def get_assigned_meetings(self):
         from .meeting import Meeting
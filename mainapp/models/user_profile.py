@@ -5,7 +5,8 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-from mainapp.functions.minio import minio_client, minio_pgp_keys_bucket
+from mainapp.functions.minio import minio_pgp_keys_bucket
+from mainapp.functions.storage import get_storage
 
 
 class UserProfile(models.Model):
@@ -21,9 +22,8 @@ class UserProfile(models.Model):
     pgp_key_fingerprint = models.CharField(max_length=64, null=True, blank=True)
 
     def add_pgp_key(self, pgp_key_fingerprint: str, pgp_key: str):
-        """This should eventually be abstracted away into a file manager class"""
         key_bytes = pgp_key.encode()
-        minio_client().put_object(
+        get_storage().put_object(
             minio_pgp_keys_bucket,
             pgp_key_fingerprint,
             BytesIO(key_bytes),
@@ -38,7 +38,7 @@ class UserProfile(models.Model):
         if not self.pgp_key_fingerprint:
             return
 
-        minio_client().remove_object(minio_pgp_keys_bucket, self.pgp_key_fingerprint)
+        get_storage().remove_object(minio_pgp_keys_bucket, self.pgp_key_fingerprint)
 
         self.pgp_key_fingerprint = None
         self.save()
@@ -48,11 +48,9 @@ class UserProfile(models.Model):
         if not self.pgp_key_fingerprint:
             return None
 
-        return (
-            minio_client()
-            .get_object(minio_pgp_keys_bucket, self.pgp_key_fingerprint)
-            .read()
-        )
+        storage = get_storage()
+        with storage.get_object(minio_pgp_keys_bucket, self.pgp_key_fingerprint) as key:
+            return key.read()
 
     class Meta:
         verbose_name = _("User profile")
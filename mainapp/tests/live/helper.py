@@ -1,7 +1,7 @@
 from elasticsearch_dsl import AttrList, AttrDict
 from elasticsearch_dsl.response import Hit, AggResponse
 
-from mainapp.functions.search import MainappSearch
+from mainapp.functions.search import MainappSearch, get_file_text_index
 
 hit_template = {
     "_index": "mst-test-file",
@@ -40,6 +40,13 @@ response_premade = {
         },
     },
 }
+# The search in the file text index doesn't find anything unless a test wants it to
+response_file_text = {"hits": {"total": {"relation": "eq", "value": 0}, "hits": []}}
+
+
+def is_file_text_search(search) -> bool:
+    return search._index == [get_file_text_index()]
+
 
 template = {
     "fields": {
@@ -67,7 +74,7 @@ class MockMainappSearch(MainappSearch):
 
 
 def mock_search_autocomplete(*args):
-    return AttrDict({"hits": []})
+    return AttrDict({"hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}})
 
 
 class MockMainappSearchEndlessScroll(MainappSearch):
@@ -75,11 +82,11 @@ class MockMainappSearchEndlessScroll(MainappSearch):
 
     def execute(self):
         out = []
-        for position in range(
-            self._s.to_dict()["from"],
-            self._s.to_dict()["from"] + self._s.to_dict()["size"],
-        ):
+        query = self._s.to_dict()
+        start = query["search_after"][0] + 1 if "search_after" in query else 0
+        for position in range(start, start + query["size"]):
             result = template.copy()
+            result["sort"] = [position]
             result["highlight"] = {"name": ["<mark>" + str(position) + "</mark>"]}
             result["fields"] = {
                 "id": position,
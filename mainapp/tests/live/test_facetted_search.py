@@ -5,7 +5,6 @@ from unittest import mock, skip
 from django.test import override_settings
 from selenium.webdriver.common.keys import Keys
 
-from mainapp.models import Person
 from mainapp.tests.live.chromedriver_test_case import ChromeDriverTestCase
 from mainapp.tests.live.helper import (
     MockMainappSearch,
@@ -130,10 +129,9 @@ class FacettedSearchTest(ChromeDriverTestCase):
     def test_dropdown_filter(self):
         self.visit("/search/query/word/")
         self.click_by_id("personButton")
+        # Only the persons with results are listed
         count = len(self.browser.find_by_css("[data-filter-key='person'] .filter-item"))
-        org = settings.SITE_DEFAULT_ORGANIZATION
-        persons = Person.objects.filter(membership__organization=org).distinct().count()
-        self.assertEqual(count, persons)
+        self.assertEqual(count, 1)
         self.browser.fill("filter-person", "Frank")
         count = len(self.browser.find_by_css("[data-filter-key='person'] .filter-item"))
         self.assertEqual(count, 1)
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mainapp.functions.autocomplete_index import (
+    get_autocomplete_index,
+    update_autocomplete_index,
+)
+from mainapp.functions.search_cache import bump_search_generation
+from mainapp.models import Person
+
+paper_hit = {
+    "_index": "mst-test-paper",
+    "_type": "_doc",
+    "_id": "1",
+    "_source": {"id": 1, "name": "Bill for Education"},
+}
+
+
+def execute(search, ignore_cache=False):
+    raw = {"hits": {"total": {"value": 1, "relation": "eq"}, "hits": [paper_hit]}}
+    return search._response_class(search, raw)
+
+
+class TestAutocompleteIndex(TestCase):
+    fixtures = ["initdata"]
+
+    def setUp(self):
+        cache.clear()
+        bump_search_generation()
+
+    def suggest(self, query):
+        return [
+            suggestion["name"] for suggestion in get_autocomplete_index().suggest(query)
+        ]
+
+    def test_suggest(self):
+        self.assertEqual(self.suggest("under"), ["Claire Underwood", "Frank Underwood"])
+        self.assertEqual(self.suggest("frank UNDER"), ["Frank Underwood"])
+        # There are multiple bodies, so the organizations have the name of their body
+        self.assertEqual(
+            self.suggest("house of rep"),
+            [
+                "Assembly of the House of Representatives "
+                "(United States House of Representatives)"
+            ],
+        )
+        self.assertEqual(
+            self.suggest("edu 1"),
+            [
+                "Bill for Education (Edu 1)",
+                "Changerequest for the bill about eduction (Edu 1/ Changerequest 1)",
+            ],
+        )
+        self.assertEqual(self.suggest("Mahatma"), [])
+        self.assertEqual(self.suggest(" "), [])
+
+    def test_shared_and_rebuilt(self):
+        update_autocomplete_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("frank"), ["Frank Underwood"])
+
+        Person.objects.filter(name="Frank Underwood").update(name="Francis Underwood")
+        self.assertEqual(self.suggest("frank"), ["Frank Underwood"])
+        bump_search_generation()
+        self.assertEqual(self.suggest("fran"), ["Francis Underwood"])
+
+    @override_settings(ELASTICSEARCH_ENABLED=True)
+    def test_view(self):
+        with mock.patch(
+            "elasticsearch_dsl.Search.execute", side_effect=execute, autospec=True
+        ):
+            response = self.client.get(reverse("search_autocomplete", args=["edu"]))
+        # The paper found by elasticsearch is already in the results from the reference number
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "name": "Bill for Education (Edu 1)",
+                    "url": reverse("paper", args=[1]),
+                },
+                {
+                    "name": "Changerequest for the bill about eduction (Edu 1/ Changerequest 1)",
+                    "url": reverse("paper", args=[2]),
+                },
+            ],
+        )
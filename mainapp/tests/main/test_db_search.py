@@ -0,0 +1,99 @@
+from django.test import TestCase, override_settings
+
+from mainapp.functions.db_search import DatabaseSearch, highlight_text
+from mainapp.functions.search import get_search, parse_hit
+from mainapp.models import File, Meeting, Membership
+
+
+@override_settings(ELASTICSEARCH_ENABLED=False)
+class TestDatabaseSearch(TestCase):
+    fixtures = ["initdata"]
+
+    def search(self, params, **kwargs):
+        main_search = get_search(params, **kwargs)
+        self.assertIsInstance(main_search, DatabaseSearch)
+        executed = main_search.execute()
+        return main_search, executed, [parse_hit(hit) for hit in executed.hits]
+
+    def test_search(self):
+        _, executed, results = self.search({"searchterm": "complexity"})
+        self.assertEqual(executed.hits.total.value, 1)
+        [result] = results
+        self.assertEqual((result["type"], result["id"]), ("file", 1))
+        self.assertIn("The <mark>Complexity</mark> of Songs", result["name_escaped"])
+        self.assertIn("modern <mark>complexity</mark> theory", result["highlight"])
+        self.assertEqual(executed.facets["person"], [(1, 1, False)])
+
+    def test_thumbnail(self):
+        File.objects.filter(pk=1).update(preview_available=True)
+        _, _, [result] = self.search({"searchterm": "complexity"})
+        self.assertEqual(result["thumbnail_url"], "/file-preview/1/thumbnail.jpg")
+        response = self.client.get("/search/query/complexity/")
+        self.assertContains(response, 'src="/file-preview/1/thumbnail.jpg"')
+
+    def test_filters(self):
+        params = {"searchterm": "Edu", "document-type": "paper"}
+        _, executed, results = self.search(params)
+        self.assertEqual([result["id"] for result in results], [1, 2])
+        # Like in elasticsearch, the document type facet ignores the document type filter
+        self.assertIn(("mst-test-file", 2, False), executed.facets["document_type"])
+
+        _, _, results = self.search({"person": "1", "document-type": "paper"})
+        self.assertEqual([result["id"] for result in results], [3])
+        # Meetings don't have dates to filter by
+        _, _, results = self.search({"searchterm": "Meeting", "after": "2100-01-01"})
+        self.assertEqual(results, [])
+
+    def test_pages(self):
+        params = {"searchterm": "meeting", "sort": "date_newest"}
+        main_search, executed, first = self.search(params, limit=5)
+        self.assertEqual(executed.hits.total.value, 7)
+        newest = list(Meeting.objects.order_by("-start").values_list("id", flat=True))
+        self.assertEqual([result["id"] for result in first], newest[:5])
+
+        search_after = list(executed.hits[-1].meta.sort)
+        _, executed, second = self.search(params, limit=5, search_after=search_after)
+        self.assertEqual([result["id"] for result in second], newest[5:])
+        self.assertNotIn("aggregations", executed.to_dict())
+
+    def test_pages_of_mixed_types(self):
+        params = {"searchterm": "e"}
+        _, executed, everything = self.search(params, limit=100)
+        self.assertGreater(executed.hits.total.value, 6)
+
+        pages = []
+        search_after = None
+        while search_after is None or len(pages[-1]) == 3:
+            _, executed, page = self.search(params, limit=3, search_after=search_after)
+            pages.append(page)
+            if page:
+                search_after = list(executed.hits[-1].meta.sort)
+        results = [result for page in pages for result in page]
+        ids = [(result["type"], result["id"]) for result in results]
+        self.assertEqual(ids, [(result["type"], result["id"]) for result in everything])
+
+    def test_repeated_membership(self):
+        membership = Membership.objects.get(pk=1)
+        membership.pk = None
+        membership.role = "Member"
+        membership.save()
+        params = {"organization": str(membership.organization_id)}
+        _, executed, results = self.search(params)
+        ids = [(result["type"], result["id"]) for result in results]
+        self.assertEqual(ids.count(("person", membership.person_id)), 1)
+        self.assertEqual(executed.hits.total.value, len(results))
+
+    def test_views(self):
+        response = self.client.get("/search/query/complexity/")
+        self.assertContains(response, "The <mark>Complexity</mark> of Songs")
+        response = self.client.get("/search/suggest/Bill/")
+        self.assertIn(
+            {"name": "Bill for Education", "url": "/paper/1/"}, response.json()
+        )
+
+    def test_highlight_text(self):
+        text = "a" * 200 + " Radweg " + "b" * 200
+        highlight = highlight_text(text, ["radweg"], fragment_size=150)
+        self.assertEqual(len(highlight), 150 + len("<mark></mark>"))
+        self.assertIn("<mark>Radweg</mark>", highlight)
+        self.assertIsNone(highlight_text(text, ["Schule"]))
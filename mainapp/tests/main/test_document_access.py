@@ -1,6 +1,11 @@
+from unittest import mock
+
 from django.test import TestCase, override_settings
+from django.urls import reverse
 
+from mainapp.functions.minio import minio_cache_bucket
 from mainapp.models import Paper, File
+from mainapp.tests.utils import MinioMock
 
 
 @override_settings(
@@ -36,3 +41,41 @@ class TestDocumentAccess(TestCase):
         self.assertEqual(1, paper.id)
         file_papers = file.paper_set.all()
         self.assertEqual(self.base_paper_len, len(file_papers))
+
+    def test_parsed_text_is_deferred(self):
+        paper = Paper.objects.get(pk=1)
+        for file in paper.files.all():
+            self.assertEqual(file.get_deferred_fields(), {"parsed_text"})
+
+        file = File.objects.get(pk=2)
+        with self.assertNumQueries(1):
+            self.assertIn("some content", file.parsed_text)
+
+        # Saving a file without loading the text keeps it
+        file = File.objects.get(pk=2)
+        file.name = "Renamed"
+        file.save()
+        self.assertIn("some content", File.objects.get(pk=2).parsed_text)
+        self.assertEqual(
+            File.objects.defer(None).get(pk=2).get_deferred_fields(), set()
+        )
+
+    def test_file_preview(self):
+        minio = MinioMock()
+        minio.storage[minio_cache_bucket]["file-previews/2-thumbnail.jpg"] = b"jpeg"
+        with mock.patch("mainapp.functions.minio._minio_singleton", new=minio):
+            url = reverse("file-preview", args=[2, "thumbnail"])
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+            File.objects.filter(pk=2).update(preview_available=True)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b"jpeg")
+            self.assertEqual(response["Content-Type"], "image/jpeg")
+
+            self.assertEqual(File.objects.get(pk=2).get_thumbnail_url(), url)
+            url = reverse("file-preview", args=[2, "preview"])
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+            File.objects.get(pk=2).manually_delete()
+            self.assertEqual(minio.storage[minio_cache_bucket], {})
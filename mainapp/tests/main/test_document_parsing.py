@@ -1,15 +1,22 @@
 import os
-from typing import Optional, Dict, Any
+import tempfile
+from typing import Optional, Dict, Any, Tuple
 from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
+from mainapp.functions import document_parsing
 from mainapp.functions.document_parsing import (
     extract_locations,
+    get_address_pipeline,
+    split_text,
     extract_from_file,
     extract_persons,
+    extract_raw_locations,
+    geocode_new_locations,
 )
-from mainapp.models import File, Person
+from mainapp.models import File, Person, Location, SearchStreet
 from mainapp.tests.utils import test_media_root
 
 values = {
@@ -32,10 +39,14 @@ def geocode(search_str: str) -> Optional[Dict[str, Any]]:
     return None
 
 
+def query_geocoders(search_str: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    return geocode(search_str), "mock"
+
+
 class TestDocumentParsing(TestCase):
     fixtures = ["initdata", "cologne-pois-test"]
 
-    @mock.patch("mainapp.functions.document_parsing.geocode", new=geocode)
+    @mock.patch("mainapp.functions.geo_functions.query_geocoders", new=query_geocoders)
     def test_location_extraction(self):
         file = File.objects.get(id=3)
         locations = extract_locations(file.parsed_text, "Köln")
@@ -48,6 +59,75 @@ class TestDocumentParsing(TestCase):
         self.assertTrue("Karlstraße 7" in location_names)
         self.assertFalse("Wolfsweg" in location_names)
 
+    @mock.patch("mainapp.functions.geo_functions.query_geocoders", new=query_geocoders)
+    def test_location_geocoding_is_deferred(self):
+        start = timezone.now()
+        text = "Tel-Aviv-Straße 12 und nochmal Tel-Aviv-Straße 12 und die Severinstraße"
+        locations = extract_locations(text, "Köln")
+        self.assertEqual(
+            sorted(location.description for location in locations),
+            ["Severinstraße", "Tel-Aviv-Straße 12"],
+        )
+        self.assertEqual([location.geometry for location in locations], [None, None])
+
+        # Already known locations are reused
+        self.assertEqual(extract_locations(text, "Köln"), locations)
+
+        self.assertEqual(geocode_new_locations(start), 2)
+        location = Location.objects.get(description="Tel-Aviv-Straße 12")
+        self.assertEqual(location.coordinates(), {"lat": 50.9301069, "lon": 6.955077})
+
+    def test_split_text(self):
+        text = "Anker straße 1 und Severinstraße 12 oder Tel-Aviv-Straße"
+        # Addresses on a boundary are completely in the next chunk
+        self.assertEqual(
+            split_text(text, 20, 15),
+            [
+                "Anker straße 1 und Severinstraße 12",
+                " Severinstraße 12 oder Tel-Aviv-Straß",
+                " oder Tel-Aviv-Straße",
+            ],
+        )
+        self.assertEqual(split_text(text, 100, 8), [text])
+
+    def test_chunked_location_extraction(self):
+        text = "Ein Antrag zur Tel-Aviv-Straße 12. " * 3 + "Und zur Severinstraße 5."
+        pipeline = get_address_pipeline()
+        expected = pipeline.extract(text)
+        with override_settings(TEXT_CHUNK_SIZE=20, TEXT_CHUNK_OVERLAP=30):
+            found = extract_raw_locations(text, pipeline)
+        # A chunk can end between street and house number, which additionally finds the bare street name
+        for location in expected:
+            self.assertEqual(found.count(location), 1)
+
+    def test_address_pipeline_snapshot(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+            GEOEXTRACT_CACHE_DIRECTORY=cache_dir
+        ), mock.patch.object(document_parsing, "_address_pipeline", None):
+            pipeline = get_address_pipeline()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertIs(get_address_pipeline(pipeline.checksum), pipeline)
+
+            # Another process loads the snapshot instead of building the pipeline
+            document_parsing._address_pipeline = None
+            with mock.patch.object(
+                document_parsing.AddressPipeline, "__init__", return_value=None
+            ) as builder:
+                snapshot = get_address_pipeline()
+            self.assertFalse(builder.called)
+            self.assertEqual(snapshot.checksum, pipeline.checksum)
+            text = "Wir treffen uns in der Severinstraße"
+            self.assertEqual(snapshot.extract(text), pipeline.extract(text))
+
+            # A new street invalidates the snapshot
+            SearchStreet.objects.create(displayed_name="Zülpicher Wall")
+            rebuilt = get_address_pipeline()
+            self.assertNotEqual(rebuilt.checksum, pipeline.checksum)
+            self.assertEqual(
+                rebuilt.extract("Am Zülpicher Wall"), [{"name": "Zülpicher Wall"}]
+            )
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
     def test_person_extraction(self):
         frank = Person.objects.get(pk=1)
         doug = Person.objects.get(pk=4)
@@ -69,6 +149,23 @@ class TestDocumentParsing(TestCase):
         persons = extract_persons(text)
         self.assertTrue(doug not in persons)
 
+        text = "Doug Stampering comes first, but Doug Stamper is still mentioned."
+        persons = extract_persons(text)
+        self.assertTrue(doug in persons)
+
+    def test_person_matcher_rebuild(self):
+        text = "A letter from Claire Hale to the council"
+        self.assertEqual(extract_persons(text), [])
+
+        claire = Person.objects.create(
+            name="Claire Hale", given_name="Claire", family_name="Hale"
+        )
+        self.assertEqual(extract_persons(text), [claire])
+
+        claire.deleted = True
+        claire.save()
+        self.assertEqual(extract_persons(text), [])
+
     def test_pdf_parsing(self):
         file = os.path.join(
             test_media_root, "Donald Knuth - The Complexity of Songs.pdf"
@@ -0,0 +1,48 @@
+import gzip
+import json
+import os
+import tempfile
+from unittest import skipIf
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from mainapp.models import File
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class TestDumpText(TestCase):
+    fixtures = ["initdata"]
+
+    def test_sharded_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            target = os.path.join(tmp_dir, "corpus")
+            call_command("dump_text", target, shard_size=2, chunk_size=3)
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)),
+                [f"corpus-0000{i}.jsonl.gz" for i in range(3)],
+            )
+
+            with gzip.open(target + "-00001.jsonl.gz", "rt") as fp:
+                rows = [json.loads(line) for line in fp]
+        self.assertEqual([row["id"] for row in rows], [3, 4])
+        self.assertEqual(rows[0]["name"], "env-test")
+        self.assertEqual(rows[0]["sort_date"], "2017-09-10T00:00:00+00:00")
+
+    @skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            target = os.path.join(tmp_dir, "corpus")
+            call_command("dump_text", target, format="parquet", chunk_size=3)
+            table = pyarrow.parquet.read_table(target + ".parquet")
+        self.assertEqual(table.num_rows, File.objects.count())
+        self.assertEqual(
+            table.column_names, ["id", "name", "page_count", "sort_date", "parsed_text"]
+        )
+        rows = table.to_pydict()
+        self.assertEqual(rows["id"][2], 3)
+        self.assertEqual(rows["name"][2], "env-test")
@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from mainapp.functions.minio import minio_cache_bucket, minio_file_bucket
+from mainapp.management.commands._file_batch_command import FileBatchCommand
+from mainapp.models import File, Person
+from mainapp.tests.utils import MinioMock
+
+
+class TestFileBatchCommand(TestCase):
+    fixtures = ["initdata"]
+
+    def test_rebuild_file_persons(self):
+        frank = Person.objects.get(pk=1)
+        File.objects.filter(pk=4).update(parsed_text="A letter to Frank Underwood")
+        File.objects.filter(pk=5).update(parsed_text="A letter to nobody")
+        File.objects.get(pk=5).mentioned_persons.set([frank])
+
+        call_command("rebuild-file-persons", start_id=4, batch_size=1, max_workers=1)
+
+        self.assertEqual(list(File.objects.get(pk=4).mentioned_persons.all()), [frank])
+        self.assertEqual(list(File.objects.get(pk=5).mentioned_persons.all()), [])
+
+    def test_cleanup_parsed_text(self):
+        File.objects.filter(pk=4).update(parsed_text="A hyphen-\nated word")
+        history_count = File.history.filter(id=4).count()
+
+        call_command("cleanup-parsed-text", id=[4, 5], max_workers=1)
+
+        file = File.objects.get(pk=4)
+        self.assertEqual(file.parsed_text, "A hyphenated word")
+        self.assertEqual(file.history.count(), history_count + 1)
+
+    def test_create_file_previews(self):
+        File.objects.filter(pk__in=[2, 3]).update(mime_type="application/pdf")
+        File.objects.filter(pk=3).update(preview_available=True)
+        minio = MinioMock()
+        minio.storage[minio_file_bucket]["2"] = b"%PDF-1.4"
+        previews = {"thumbnail": b"small", "preview": b"big"}
+        with mock.patch("mainapp.functions.minio._minio_singleton", new=minio):
+            with mock.patch(
+                "mainapp.functions.file_previews.render_previews",
+                return_value=previews,
+            ) as render_previews:
+                call_command("create-file-previews", max_workers=1)
+
+        render_previews.assert_called_once()
+        self.assertTrue(File.objects.get(pk=2).preview_available)
+        self.assertEqual(
+            minio.storage[minio_cache_bucket]["file-previews/2-thumbnail.jpg"],
+            b"small",
+        )
+
+    def test_incomplete_command(self):
+        class Command(FileBatchCommand):
+            @classmethod
+            def analyze_file(cls, file, context):
+                return None
+
+        with self.assertRaises(TypeError):
+            Command()
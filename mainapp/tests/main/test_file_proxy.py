@@ -0,0 +1,134 @@
+import tempfile
+from concurrent.futures import Executor, Future
+from unittest import mock
+
+import responses
+from django.test import TestCase, override_settings, RequestFactory
+
+from mainapp.functions import file_proxy
+from mainapp.functions.minio import minio_cache_bucket
+from mainapp.functions.storage import StorageException, get_storage
+from mainapp.views.views import file_serve_proxy
+
+proxy_template = "https://ris.example.org/file/{}"
+pdf = b"%PDF-1.4 Hello World"
+
+
+class ImmediateExecutor(Executor):
+    """Runs the background downloads right away, so that the tests see their results"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class TestFileProxy(TestCase):
+    fixtures = ["initdata"]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            PROXY_ONLY_TEMPLATE=proxy_template,
+            PROXY_ONLY_CACHE=True,
+            STORAGE_BACKEND="filesystem",
+            STORAGE_DIRECTORY=self.directory.name,
+        )
+        self.settings.enable()
+        self.executor = mock.patch(
+            "mainapp.functions.file_proxy._fetch_executor", new=ImmediateExecutor()
+        )
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_fetch_through(self):
+        factory = RequestFactory()
+        with responses.RequestsMock() as requests_mock:
+            requests_mock.add(
+                responses.GET,
+                proxy_template.format(2),
+                body=pdf,
+                content_type="application/pdf",
+                headers={"ETag": '"v1"'},
+            )
+            # The first viewer gets the file from the RIS while it's downloaded into the cache
+            response = file_serve_proxy(factory.get("/"), "2")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), pdf)
+            self.assertEqual(response["Content-Type"], "application/pdf")
+            response.close()
+            self.assertEqual(len(requests_mock.calls), 2)
+
+            # The second request and the range requests don't reach the RIS
+            response = file_serve_proxy(factory.get("/", HTTP_RANGE="bytes=9-13"), "2")
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b"".join(response.streaming_content), b"Hello")
+            self.assertEqual(response["Content-Type"], "application/pdf")
+            response.close()
+            self.assertEqual(len(requests_mock.calls), 2)
+
+    def test_without_cache(self):
+        with override_settings(PROXY_ONLY_CACHE=False):
+            with responses.RequestsMock() as requests_mock:
+                requests_mock.add(responses.GET, proxy_template.format(2), body=pdf)
+                response = file_serve_proxy(RequestFactory().get("/"), "2")
+                self.assertEqual(b"".join(response.streaming_content), pdf)
+                self.assertEqual(len(requests_mock.calls), 1)
+        self.assertEqual(list(get_storage().list_objects(minio_cache_bucket)), [])
+
+    def test_single_download(self):
+        with mock.patch.object(file_proxy, "_fetching", {"2"}):
+            self.assertIsNone(file_proxy.schedule_refresh("2"))
+            with responses.RequestsMock() as requests_mock:
+                requests_mock.add(responses.GET, proxy_template.format(2), body=pdf)
+                response = file_serve_proxy(RequestFactory().get("/"), "2")
+                self.assertEqual(b"".join(response.streaming_content), pdf)
+                # Only the response to the viewer, the download is already running
+                self.assertEqual(len(requests_mock.calls), 1)
+
+    def test_errors_are_not_cached(self):
+        with responses.RequestsMock() as requests_mock:
+            requests_mock.add(responses.GET, proxy_template.format(2), status=404)
+            response = file_serve_proxy(RequestFactory().get("/"), "2")
+            self.assertEqual(response.status_code, 404)
+        with self.assertRaises(StorageException):
+            get_storage().get_object(
+                minio_cache_bucket, file_proxy.get_object_name("2")
+            )
+
+    def test_revalidation(self):
+        with responses.RequestsMock() as requests_mock:
+            requests_mock.add(
+                responses.GET,
+                proxy_template.format(2),
+                body=pdf,
+                content_type="application/pdf",
+                headers={"ETag": '"v1"'},
+            )
+            file_proxy.fetch_into_cache("2")
+            fetched = file_proxy.load_meta("2")["fetched"]
+
+        with override_settings(PROXY_ONLY_CACHE_REVALIDATE=-1):
+            with mock.patch(
+                "mainapp.functions.file_proxy.schedule_refresh"
+            ) as schedule_refresh:
+                file_proxy.get_cached_file("2").close()
+                schedule_refresh.assert_called_once_with("2")
+
+        with responses.RequestsMock() as requests_mock:
+            requests_mock.add(responses.GET, proxy_template.format(2), status=304)
+            file_proxy.refresh("2")
+            self.assertEqual(
+                requests_mock.calls[0].request.headers["If-None-Match"], '"v1"'
+            )
+        self.assertGreater(file_proxy.load_meta("2")["fetched"], fetched)
+
+        # Files that were removed from the RIS are removed from the cache
+        with responses.RequestsMock() as requests_mock:
+            requests_mock.add(responses.GET, proxy_template.format(2), status=404)
+            file_proxy.refresh("2")
+            self.assertIsNone(file_proxy.get_cached_file("2"))
@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from mainapp.functions import geo_functions
+from mainapp.functions.geo_functions import (
+    geocode_many,
+    GeocodingError,
+    TokenBucket,
+    geocode,
+    latlng_to_address,
+    populate_reverse_geocoding_cache,
+)
+from mainapp.models import CachedGeocode, CachedReverseGeocode
+
+marienplatz = {"type": "Point", "coordinates": [11.575833, 48.1375]}
+
+
+class TestGeocodingCache(TestCase):
+    def test_cache(self):
+        def query_geocoders(search_str: str):
+            if search_str.startswith("Marienplatz 1"):
+                return marienplatz, "mock"
+            return None, "mock"
+
+        with mock.patch(
+            "mainapp.functions.geo_functions.query_geocoders",
+            side_effect=query_geocoders,
+        ) as query_mock:
+            searches = ["Marienplatz 1, München", "Nowhere 1, München"]
+            self.assertEqual(
+                geocode_many(searches),
+                {"Marienplatz 1, München": marienplatz, "Nowhere 1, München": None},
+            )
+            self.assertEqual(query_mock.call_count, 2)
+
+            # Both the found and the missing address are cached, ignoring case and whitespace
+            self.assertEqual(geocode("marienplatz  1, münchen"), marienplatz)
+            self.assertEqual(geocode("Nowhere 1, München"), None)
+            self.assertEqual(query_mock.call_count, 2)
+
+            # Negative entries expire earlier
+            CachedGeocode.objects.update(fetched=timezone.now() - timedelta(days=30))
+            geocode_many(searches)
+            self.assertEqual(query_mock.call_count, 3)
+
+    def test_failure_is_not_cached(self):
+        with mock.patch(
+            "mainapp.functions.geo_functions.query_geocoders",
+            side_effect=GeocodingError(),
+        ):
+            self.assertEqual(geocode("Marienplatz 1, München"), None)
+        self.assertEqual(CachedGeocode.objects.count(), 0)
+
+
+class TestTokenBucket(TestCase):
+    def test_rate_limit(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
+
+
+class TestReverseGeocodingCache(TestCase):
+    def tearDown(self):
+        if geo_functions._reverse_geocoding_executor:
+            geo_functions._reverse_geocoding_executor.shutdown(wait=True)
+            geo_functions._reverse_geocoding_executor = None
+
+    @mock.patch(
+        "mainapp.functions.geo_functions.reverse_geocode", return_value="Marienplatz 1"
+    )
+    def test_cached(self, _reverse_geocode):
+        populate_reverse_geocoding_cache(48.1375, 11.575833)
+        with mock.patch(
+            "mainapp.functions.geo_functions._populate_in_background"
+        ) as populate:
+            # Points in the same grid cell share the entry
+            self.assertEqual(latlng_to_address(48.13752, 11.57581), "Marienplatz 1")
+            self.assertFalse(populate.called)
+
+    def test_miss_populates_in_background(self):
+        with mock.patch(
+            "mainapp.functions.geo_functions._populate_in_background"
+        ) as populate:
+            self.assertEqual(
+                latlng_to_address(48.1375, 11.575833), "48.1375, 11.575833"
+            )
+            self.assertEqual(
+                latlng_to_address(48.1375, 11.575833), "48.1375, 11.575833"
+            )
+            geo_functions._reverse_geocoding_executor.shutdown(wait=True)
+        # The second request doesn't schedule the same lookup again
+        populate.assert_called_once_with(48.1375, 11.575833, "48.137500,11.576000")
+        geo_functions._reverse_geocoding_pending.clear()
+        self.assertEqual(CachedReverseGeocode.objects.count(), 0)
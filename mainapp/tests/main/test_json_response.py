@@ -0,0 +1,43 @@
+from datetime import datetime
+from unittest import mock, skipIf
+
+from django.test import TestCase
+from django.utils import timezone
+
+from mainapp.models import File, Location, Paper
+from mainapp.views import utils
+from mainapp.views.utils import build_map_object, dumps_json
+
+
+@skipIf(utils.orjson is None, "orjson isn't installed")
+class TestJsonResponse(TestCase):
+    """orjson and the json module must write the same json"""
+
+    fixtures = ["initdata"]
+
+    def assertSameJson(self, function):
+        with mock.patch("mainapp.views.utils.orjson", None):
+            expected = function()
+        self.assertEqual(function(), expected)
+        return expected
+
+    def test_dates(self):
+        data = {1: datetime(2020, 5, 17, 12, 7, 37, 887853, tzinfo=timezone.utc)}
+        self.assertEqual(
+            self.assertSameJson(lambda: dumps_json(data)),
+            '{"1":"2020-05-17T12:07:37.887Z"}',
+        )
+
+    def test_map_object(self):
+        # The geodata is keyed by the ids of the locations and papers
+        File.objects.get(pk=1).locations.set([Location.objects.get(pk=1)])
+        papers = Paper.objects.all()
+        map_object = self.assertSameJson(lambda: build_map_object(geo_papers=papers))
+        self.assertIn('"documents":{"1":', map_object)
+
+    def test_calendar_data(self):
+        params = {"start": "2017-01-01", "end": "2030-01-01"}
+        content = self.assertSameJson(
+            lambda: self.client.get("/calendar/data/", params).content
+        )
+        self.assertIn(b'"details":"/meeting/', content)
@@ -4,12 +4,16 @@ from unittest import mock
 
 from django.contrib.auth.models import User
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from mainapp.models import UserAlert, UserProfile
 from mainapp.tests.live.helper import MockMainappSearch
 
 
+def execute_many(searches):
+    return [MockMainappSearch.execute(search) for search in searches]
+
+
 class TestNotifyUsers(TestCase):
     fixtures = ["initdata"]
 
@@ -29,11 +33,10 @@ class TestNotifyUsers(TestCase):
             alert_object.user = newuser
             alert_object.save()
 
+    @override_settings(ELASTICSEARCH_ENABLED=True)
     @mock.patch("mainapp.functions.notify_users.send_mail")
-    @mock.patch(
-        "mainapp.functions.search.MainappSearch.execute", new=MockMainappSearch.execute
-    )
-    def test_notify(self, send_mail_function):
+    @mock.patch("mainapp.functions.notify_users.execute_many", side_effect=execute_many)
+    def test_notify(self, _execute_many, send_mail_function):
         self._create_user_with_alerts("test@example.org", ["test"])
 
         out = StringIO()
@@ -51,3 +54,21 @@ class TestNotifyUsers(TestCase):
         )
         self.assertTrue("Unsubscribe" in send_mail_function.call_args[0][2])
         self.assertTrue("Unsubscribe" in send_mail_function.call_args[0][3])
+
+    @override_settings(ELASTICSEARCH_ENABLED=True)
+    @mock.patch("mainapp.functions.notify_users.send_mail")
+    @mock.patch("mainapp.functions.notify_users.execute_many", side_effect=execute_many)
+    def test_shared_searches(self, execute_many_function, send_mail_function):
+        self._create_user_with_alerts("first@example.org", ["test", "other"])
+        self._create_user_with_alerts("second@example.org", [" test  "])
+
+        call_command("notifyusers", stdout=StringIO())
+
+        # The alerts for "test" share one search
+        [searches] = execute_many_function.call_args[0]
+        self.assertEqual(len(searches), 2)
+        self.assertEqual(send_mail_function.call_count, 2)
+
+        last_matches = set(UserAlert.objects.values_list("last_match", flat=True))
+        self.assertEqual(len(last_matches), 1)
+        self.assertIsNotNone(last_matches.pop())
@@ -0,0 +1,61 @@
+import os
+from unittest import mock
+
+import responses
+from django.test import TestCase, override_settings
+
+from mainapp.functions.ocr import (
+    AzureOcrBackend,
+    OcrBackend,
+    get_ocr_text_from_pdf,
+)
+from mainapp.tests.utils import test_media_root
+
+azure_response = {
+    "regions": [
+        {
+            "lines": [
+                {"words": [{"text": "99"}, {"text": "bottles"}]},
+                {"words": [{"text": "of"}, {"text": "beer"}]},
+            ]
+        }
+    ]
+}
+
+
+class FakeOcrBackend(OcrBackend):
+    def recognize(self, image: bytes) -> str:
+        return image.decode() + "\n"
+
+
+class TestOcr(TestCase):
+    def test_azure_backend(self):
+        # e.g. a local Computer Vision container
+        backend = AzureOcrBackend("http://localhost:5000", None, "de")
+        with responses.RequestsMock() as requests_mock:
+            requests_mock.add(
+                responses.POST,
+                "http://localhost:5000/vision/v1.0/ocr",
+                json=azure_response,
+            )
+            self.assertEqual(backend.recognize(b"png"), "99 bottles \nof beer \n\n")
+            self.assertNotIn(
+                "Ocp-Apim-Subscription-Key", requests_mock.calls[0].request.headers
+            )
+
+    @override_settings(OCR_CONCURRENCY=2)
+    def test_pages_in_order(self):
+        pdf = os.path.join(
+            test_media_root, "Donald Knuth - The Complexity of Songs.pdf"
+        )
+        with open(pdf, "rb") as fp:
+            data = fp.read()
+
+        def rasterize_page(pdf_path: str, page: int, max_size):
+            return f"Page {page}".encode()
+
+        with mock.patch(
+            "mainapp.functions.ocr.rasterize_page", side_effect=rasterize_page
+        ):
+            text = get_ocr_text_from_pdf(data, FakeOcrBackend())
+        self.assertEqual(text, "Page 0\nPage 1\nPage 2\n")
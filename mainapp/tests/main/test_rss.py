@@ -1,6 +1,6 @@
 from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from mainapp.tests.live.helper import MockMainappSearch
 
@@ -18,6 +18,7 @@ class TestRSS(TestCase):
         )
         self.assertIn("Frank Underwood", response)
 
+    @override_settings(ELASTICSEARCH_ENABLED=True)
     @mock.patch(
         "mainapp.functions.search.MainappSearch.execute", new=MockMainappSearch.execute
     )
@@ -0,0 +1,134 @@
+import copy
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from elasticsearch import ConnectionError
+from elasticsearch_dsl.response import Response
+
+from mainapp.functions.search import MainappSearch, ElasticsearchNotAvailableError
+from mainapp.functions.search_cache import bump_search_generation, generation_key
+from mainapp.models import Organization
+from mainapp.tests.live.helper import (
+    response_premade,
+    response_file_text,
+    is_file_text_search,
+)
+from mainapp.views.search import aggs_to_context
+
+
+class TestSearchCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.fail = False
+
+    def execute(self, search, ignore_cache=False):
+        if self.fail:
+            raise ConnectionError("N/A", "Elasticsearch is down", None)
+        if is_file_text_search(search):
+            return Response(search, copy.deepcopy(response_file_text))
+        self.calls += 1
+        return Response(search, copy.deepcopy(response_premade))
+
+    def search(self, cached: bool = True):
+        with mock.patch(
+            "elasticsearch_dsl.Search.execute",
+            side_effect=self.execute,
+            autospec=True,
+        ):
+            return MainappSearch({"searchterm": "Radweg"}, cache=cached).execute()
+
+    def test_cache(self):
+        self.assertEqual(self.search().hits.total.value, 117)
+        executed = self.search()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(executed.hits.total.value, 117)
+        self.assertEqual(executed.facets["organization"][0][0], 41)
+
+        self.search(cached=False)
+        self.assertEqual(self.calls, 2)
+
+        # An import invalidates the cached results
+        bump_search_generation()
+        self.search()
+        self.assertEqual(self.calls, 3)
+
+    def test_stale_on_error(self):
+        self.fail = True
+        with self.assertRaises(ElasticsearchNotAvailableError):
+            self.search()
+
+        self.fail = False
+        self.search()
+        bump_search_generation()
+        self.fail = True
+        self.assertEqual(self.search().hits.total.value, 117)
+
+    def test_evicted_generation(self):
+        self.search()
+        # Without the generation, the cached results count as outdated instead of fresh
+        cache.delete(generation_key)
+        self.search()
+        self.assertEqual(self.calls, 2)
+        self.assertIsNotNone(cache.get(generation_key))
+
+
+class TestFacetLabels(TestCase):
+    fixtures = ["initdata"]
+
+    def setUp(self):
+        cache.clear()
+        bump_search_generation()
+
+    def execute(self, search, ignore_cache=False):
+        if is_file_text_search(search):
+            return Response(search, copy.deepcopy(response_file_text))
+        raw = copy.deepcopy(response_premade)
+        aggregations = raw["aggregations"]
+        aggregations["_filter_organization"]["organization"]["buckets"] = [
+            {"key": 1, "doc_count": 5},
+            {"key": 3, "doc_count": 2},
+            {"key": 99, "doc_count": 1},
+        ]
+        return search._response_class(search, raw)
+
+    def get_facets(self, params):
+        with mock.patch(
+            "elasticsearch_dsl.Search.execute", side_effect=self.execute, autospec=True
+        ):
+            main_search = MainappSearch(params)
+            return aggs_to_context(main_search.execute(), main_search.options)
+
+    def test_facet_labels(self):
+        facets = self.get_facets({"searchterm": "word"})
+        self.assertEqual(facets["organization"]["count"], 2)
+        self.assertEqual(
+            facets["organization"]["list"],
+            [
+                {
+                    "id": 1,
+                    "name": "Assembly of the House of Representatives",
+                    "doc_count": 5,
+                },
+                {"id": 3, "name": "State Department of the USA", "doc_count": 2},
+            ],
+        )
+        self.assertEqual(
+            facets["person"]["list"],
+            [{"id": 1, "name": "Frank Underwood", "doc_count": 42}],
+        )
+
+        # The selected organization is listed even without results
+        with self.assertNumQueries(0):
+            facets = self.get_facets({"searchterm": "word", "organization": "5"})
+        self.assertEqual(facets["organization"]["count"], 2)
+        self.assertEqual(facets["organization"]["list"][-1]["id"], 5)
+        self.assertEqual(facets["organization"]["list"][-1]["doc_count"], 0)
+
+        Organization.objects.filter(id=3).update(name="Department of State")
+        bump_search_generation()
+        facets = self.get_facets({"searchterm": "word"})
+        self.assertEqual(
+            facets["organization"]["list"][1]["name"], "Department of State"
+        )
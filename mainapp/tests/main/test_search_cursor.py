@@ -0,0 +1,86 @@
+import copy
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mainapp.functions.search import MainappSearch, decode_cursor, encode_cursor
+from mainapp.tests.live.helper import (
+    response_premade,
+    hit_template,
+    response_file_text,
+    is_file_text_search,
+)
+
+
+def execute(search, ignore_cache=False):
+    if is_file_text_search(search):
+        return search._response_class(search, copy.deepcopy(response_file_text))
+    raw = copy.deepcopy(response_premade)
+    query = search.to_dict()
+    start = query["search_after"][0] + 1 if "search_after" in query else 0
+    raw["hits"]["hits"] = []
+    for position in range(start, min(start + query["size"], 25)):
+        hit = copy.deepcopy(hit_template)
+        hit["_score"] = 1.0
+        hit["sort"] = [position, "mst-test-file", position]
+        raw["hits"]["hits"].append(hit)
+    if "search_after" in query:
+        del raw["aggregations"]
+    return search._response_class(search, raw)
+
+
+@override_settings(ELASTICSEARCH_ENABLED=True, SEARCH_PAGINATION_LENGTH=10)
+@mock.patch("elasticsearch_dsl.Search.execute", side_effect=execute, autospec=True)
+class TestSearchCursor(TestCase):
+    fixtures = ["initdata"]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_query(self, _execute):
+        search_after = [1.5, "mst-test-file", 159]
+        cursor = encode_cursor(search_after)
+        self.assertEqual(decode_cursor(cursor), (search_after, None, False))
+
+        query = MainappSearch({"searchterm": "word"}, limit=10)._s.to_dict()
+        self.assertIn("aggs", query)
+        self.assertNotIn("search_after", query)
+
+        main_search = MainappSearch(
+            {"searchterm": "word"}, limit=10, search_after=search_after, pit_id="abc"
+        )
+        query = main_search._s.to_dict()
+        self.assertNotIn("aggs", query)
+        self.assertEqual(query["search_after"], search_after)
+        self.assertEqual(query["pit"]["id"], "abc")
+        self.assertIsNone(main_search._s._index)
+
+    def test_pages(self, _execute):
+        url = reverse("search_api", args=["word"])
+        first = self.client.get(url).json()
+        self.assertIn("new_facets", first)
+        self.assertIn("subscribe_widget", first)
+        self.assertEqual(len(first["results"]), 10)
+        self.assertEqual(
+            first["results"][0],
+            {
+                "type": "file",
+                "url": "/file/159/",
+                "name": "long name <mark>hightlight</mark>",
+            },
+        )
+        self.assertEqual(decode_cursor(first["next_cursor"])[0][0], 9)
+
+        second = self.client.get(url, {"cursor": first["next_cursor"]}).json()
+        self.assertNotIn("new_facets", second)
+        self.assertNotIn("subscribe_widget", second)
+        self.assertEqual(decode_cursor(second["next_cursor"])[0][0], 19)
+
+        # The last page only has 5 results
+        third = self.client.get(url, {"cursor": second["next_cursor"]}).json()
+        self.assertIsNone(third["next_cursor"])
+
+        response = self.client.get(url, {"cursor": "forged"})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,90 @@
+import copy
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from mainapp.functions.search import MainappSearch
+from mainapp.tests.live.helper import (
+    response_premade,
+    response_file_text,
+    is_file_text_search,
+)
+
+
+profile = {
+    "shards": [
+        {
+            "id": "[node][index][0]",
+            "searches": [
+                {
+                    "query": [
+                        {
+                            "type": "BooleanQuery",
+                            "description": "parsed_text:radweg",
+                            "time_in_nanos": 2_000_000,
+                        }
+                    ],
+                    "rewrite_time": 1000,
+                }
+            ],
+            "aggregations": [],
+        }
+    ]
+}
+
+
+def execute(search, ignore_cache=False):
+    if is_file_text_search(search):
+        raw = copy.deepcopy(response_file_text)
+        raw["took"] = 1200
+    else:
+        raw = copy.deepcopy(response_premade)
+        raw["took"] = 1500
+    if search.to_dict().get("profile"):
+        raw["profile"] = profile
+    return search._response_class(search, raw)
+
+
+@mock.patch("elasticsearch_dsl.Search.execute", side_effect=execute, autospec=True)
+class TestSearchProfiling(TestCase):
+    def test_slow_log(self, _execute):
+        with self.assertLogs("mainapp.slow_search") as logs:
+            MainappSearch({"searchterm": "Radweg"}).execute()
+        # The search in the file texts is logged, too
+        text_line, line = logs.records
+        text_entry = json.loads(text_line.getMessage())
+        self.assertEqual((text_entry["kind"], text_entry["took"]), ("file_text", 1200))
+        entry = json.loads(line.getMessage())
+        self.assertEqual((entry["kind"], entry["took"]), ("main", 1500))
+        self.assertEqual(entry["params"], {"searchterm": "Radweg"})
+        self.assertTrue(entry["aggregations"])
+        [exact] = entry["shape"]["query"]["bool"]["should"]
+        self.assertEqual(exact["multi_match"]["query"], "?")
+
+        with override_settings(SEARCH_SLOW_QUERY_THRESHOLD=2000):
+            with mock.patch("mainapp.functions.search.slow_search_logger") as logger:
+                MainappSearch({"searchterm": "Radweg"}).execute()
+            logger.info.assert_not_called()
+
+    def test_profile(self, _execute):
+        stdout = StringIO()
+        call_command("search", "Radweg", profile=True, repeat=1, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("File text search: took 1200ms with profiling", output)
+        self.assertIn("Main search: took 1500ms with profiling", output)
+        self.assertIn("2.00ms BooleanQuery parsed_text:radweg", output)
+
+    def test_replay(self, _execute):
+        with tempfile.NamedTemporaryFile("w", suffix=".log") as fp:
+            entry = {"took": 1500, "params": {"searchterm": "Radweg"}}
+            fp.write(json.dumps(entry) + "\n\nperson:1 Schule\n")
+            fp.flush()
+            stdout = StringIO()
+            call_command("search", replay=fp.name, repeat=2, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("person:1 Schule", output)
+        self.assertIn("2 searches", output)
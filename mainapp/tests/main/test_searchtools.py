@@ -1,10 +1,21 @@
-from django.test import TestCase
+import copy
+from unittest import mock
 
+from django.test import TestCase, override_settings
+
+from mainapp.documents import FileTextDocument
 from mainapp.functions.search import (
     search_string_to_params,
     params_to_search_string,
     MainappSearch,
     MULTI_MATCH_FIELDS,
+    parse_hit,
+)
+from mainapp.models import File
+from mainapp.tests.live.helper import (
+    response_premade,
+    response_file_text,
+    is_file_text_search,
 )
 
 expected_params = {
@@ -36,7 +47,14 @@ expected_params = {
         {"mst-test-organization": 4},
         {"mst-test-paper": 2},
     ],
-    "_source": ["id", "name", "legal_date", "reference_number", "display_date"],
+    "_source": [
+        "id",
+        "name",
+        "legal_date",
+        "reference_number",
+        "display_date",
+        "preview_available",
+    ],
     "aggs": {
         "_filter_document_type": {
             "filter": {"match_all": {}},
@@ -51,12 +69,23 @@ expected_params = {
             "aggs": {"organization": {"terms": {"field": "organization_ids"}}},
         },
     },
-    "sort": [{"sort_date": {"order": "desc"}}],
+    "sort": [
+        {"sort_date": {"order": "desc"}},
+        "_index",
+        {"id": {"order": "asc", "unmapped_type": "long"}},
+    ],
     "highlight": {
         "fields": {
-            "*": {"fragment_size": 150, "pre_tags": "<mark>", "post_tags": "</mark>"}
-        }
+            "name": {"number_of_fragments": 0},
+            "reference_number": {"number_of_fragments": 0},
+            "description": {},
+        },
+        "fragment_size": 150,
+        "number_of_fragments": 1,
+        "pre_tags": ["<mark>"],
+        "post_tags": ["</mark>"],
     },
+    "track_total_hits": 1000,
 }
 
 
@@ -76,11 +105,137 @@ class TestSearchtools(TestCase):
         self.assertEqual(instring, self.params)
 
     def test_params_to_query(self):
-        main_search = MainappSearch(self.params)
+        main_search = MainappSearch(self.params, fuzzy=True)
         self.assertEqual(main_search.errors, [])
         self.assertEqual(main_search.build_search().to_dict(), expected_params)
 
+    def test_fuzzy_second_phase(self):
+        queries = []
+
+        def execute(search, ignore_cache=False):
+            if is_file_text_search(search):
+                return search._response_class(search, copy.deepcopy(response_file_text))
+            query = search.to_dict()
+            queries.append(query)
+            raw = copy.deepcopy(response_premade)
+            if len(query["query"]["bool"]["should"]) == 1:
+                raw["hits"]["total"]["value"] = 1
+            return search._response_class(search, raw)
+
+        with mock.patch(
+            "elasticsearch_dsl.Search.execute", side_effect=execute, autospec=True
+        ):
+            main_search = MainappSearch(self.params)
+            self.assertEqual(main_search.execute().hits.total.value, 117)
+            self.assertEqual(len(queries), 2)
+            self.assertTrue(main_search.fuzzy)
+            self.assertEqual(queries[1]["query"], expected_params["query"])
+
+            # The exact query finds enough hits
+            queries.clear()
+            with override_settings(SEARCH_FUZZY_THRESHOLD=1):
+                main_search = MainappSearch(self.params)
+                self.assertEqual(main_search.execute().hits.total.value, 1)
+            self.assertEqual(len(queries), 1)
+            self.assertFalse(main_search.fuzzy)
+
+    def test_file_text_join(self):
+        requests = []
+
+        def execute(search, ignore_cache=False):
+            query = search.to_dict()
+            requests.append(query)
+            if not is_file_text_search(search):
+                raw = copy.deepcopy(response_premade)
+                raw["hits"]["hits"][0]["_score"] = 1.5
+                return search._response_class(search, raw)
+            raw = copy.deepcopy(response_file_text)
+            text_hit = {"_index": "mst-test-file-text", "_id": "159", "_score": 3.0}
+            if "highlight" in query:
+                text_hit["highlight"] = {"parsed_text": ["some <mark>word</mark>"]}
+            raw["hits"]["hits"] = [text_hit]
+            return search._response_class(search, raw)
+
+        with mock.patch(
+            "elasticsearch_dsl.Search.execute", side_effect=execute, autospec=True
+        ):
+            executed = MainappSearch({"searchterm": "word"}, fuzzy=False).execute()
+
+        [text, main, highlight] = requests
+        self.assertEqual(text["_source"], False)
+        self.assertEqual(
+            main["query"]["bool"]["should"][1],
+            {
+                "bool": {
+                    "filter": [{"term": {"_index": "mst-test-file"}}],
+                    "should": [
+                        {
+                            "constant_score": {
+                                "filter": {"term": {"id": 159}},
+                                "boost": 1.5,
+                            }
+                        }
+                    ],
+                    "minimum_should_match": 1,
+                }
+            },
+        )
+        self.assertNotIn("parsed_text", main["highlight"]["fields"])
+        self.assertEqual(
+            highlight["query"]["bool"]["filter"], [{"ids": {"values": ["159"]}}]
+        )
+        self.assertEqual(
+            parse_hit(executed.hits[0])["highlight"], "some <mark>word</mark>"
+        )
+
+        # Without files, the file text index isn't searched
+        main_search = MainappSearch({"searchterm": "word", "document-type": "paper"})
+        self.assertFalse(main_search.searches_file_texts())
+
+    @override_settings(SEARCH_FILE_TEXT_LIMIT=1)
+    def test_file_text_limit(self):
+        requests = []
+
+        def execute(search, ignore_cache=False):
+            requests.append(search.to_dict())
+            if not is_file_text_search(search):
+                return search._response_class(search, copy.deepcopy(response_premade))
+            raw = copy.deepcopy(response_file_text)
+            raw["hits"]["hits"] = [
+                {"_index": "mst-test-file-text", "_id": "159", "_score": 3.0}
+            ]
+            return search._response_class(search, raw)
+
+        with mock.patch(
+            "elasticsearch_dsl.Search.execute", side_effect=execute, autospec=True
+        ):
+            params = {"searchterm": "word", "sort": "date_newest"}
+            executed = MainappSearch(params, fuzzy=False).execute()
+
+        # More texts may match than were joined, so the total is only a lower bound
+        self.assertEqual(executed.hits.total.relation, "gte")
+        # The newest matching texts instead of the best matching ones
+        self.assertEqual(requests[0]["sort"], [{"sort_date": {"order": "desc"}}])
+        self.assertTrue(requests[0]["track_scores"])
+
     def test_params_to_search_string(self):
         expected = "document-type:file,committee radius:50 sort:date_newest word radius anotherword"
         search_string = params_to_search_string(self.params)
         self.assertEqual(search_string, expected)
+
+
+@override_settings(ELASTICSEARCH_ENABLED=True)
+class TestFileTextDocument(TestCase):
+    fixtures = ["initdata"]
+
+    def test_metadata_change_skips_text(self):
+        with mock.patch.object(FileTextDocument, "_bulk") as bulk, mock.patch.object(
+            FileTextDocument, "update_dates"
+        ) as update_dates:
+            # The parsed text is deferred by default, so it didn't change
+            FileTextDocument().update(File.objects.get(pk=2))
+            bulk.assert_not_called()
+            update_dates.assert_called_once()
+
+            FileTextDocument().update(File.objects.defer(None).get(pk=2))
+            bulk.assert_called_once()
@@ -0,0 +1,132 @@
+import os
+import stat
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mainapp.functions.minio import minio_file_bucket
+from mainapp.functions.storage import (
+    FilesystemStorage,
+    MinioStorage,
+    Storage,
+    StorageException,
+    get_storage,
+)
+from mainapp.tests.utils import MinioMock
+
+
+class TestStorage(TestCase):
+    fixtures = ["initdata"]
+
+    def check_storage(self, storage: Storage):
+        data = b"%PDF-1.4 Hello World"
+        storage.put_object(
+            minio_file_bucket, "2", BytesIO(data), len(data), "application/pdf"
+        )
+        with storage.get_object(minio_file_bucket, "2") as stored:
+            self.assertEqual(stored.size, len(data))
+            self.assertEqual(stored.content_type, "application/pdf")
+            self.assertEqual(stored.read_range(9, 14), b"Hello")
+            self.assertEqual(b"".join(stored.stream(4)), data)
+        self.assertEqual(list(storage.list_objects(minio_file_bucket)), ["2"])
+
+        storage.remove_object(minio_file_bucket, "2")
+        with self.assertRaises(StorageException):
+            storage.get_object(minio_file_bucket, "2")
+        self.assertEqual(list(storage.list_objects(minio_file_bucket)), [])
+
+    def test_filesystem_storage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = FilesystemStorage(directory)
+            storage.setup()
+            self.check_storage(storage)
+            # Removing twice is fine
+            storage.remove_object(minio_file_bucket, "2")
+
+            # The web server must be able to read the objects for FILE_SERVE_ACCEL_REDIRECT
+            with mock.patch("mainapp.functions.storage._umask", 0o022):
+                storage.put_object(minio_file_bucket, "3", BytesIO(b"%PDF"), 4)
+            mode = os.stat(storage.get_path(minio_file_bucket, "3")).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0o644)
+            with self.assertRaises(StorageException):
+                storage.get_object(minio_file_bucket, "../../../etc/passwd")
+
+    def test_minio_storage(self):
+        with mock.patch("mainapp.functions.minio._minio_singleton", new=MinioMock()):
+            self.check_storage(MinioStorage())
+
+    def test_file_serve_from_filesystem(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                STORAGE_BACKEND="filesystem", STORAGE_DIRECTORY=directory
+            ):
+                url = reverse("file-content", args=[2])
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+                data = b"%PDF-1.4"
+                get_storage().put_object(
+                    minio_file_bucket, "2", BytesIO(data), len(data), "application/pdf"
+                )
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b"".join(response.streaming_content), data)
+                self.assertEqual(response["Content-Type"], "application/pdf")
+
+    def check_file_serve_ranges(self):
+        data = b"%PDF-1.4 Hello World"
+        get_storage().put_object(
+            minio_file_bucket, "2", BytesIO(data), len(data), "application/pdf"
+        )
+        url = reverse("file-content", args=[2])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=9-13")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"Hello")
+        self.assertEqual(response["Content-Range"], f"bytes 9-13/{len(data)}")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+        response = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), b"World")
+        response = self.client.get(url, HTTP_RANGE="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+        # Multiple ranges aren't supported, so the whole file is sent
+        response = self.client.get(url, HTTP_RANGE="bytes=0-1,3-4")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), data)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        return response
+
+    def test_file_serve_ranges(self):
+        minio = MinioMock()
+        with mock.patch("mainapp.functions.minio._minio_singleton", new=minio):
+            response = self.check_file_serve_ranges()
+            # Every range is requested on its own, without downloading the whole object first
+            self.assertEqual(
+                minio.get_requests,
+                [
+                    (minio_file_bucket, "2", 9, 5),
+                    (minio_file_bucket, "2", 15, 5),
+                    (minio_file_bucket, "2", 0, 0),
+                ],
+            )
+            url = reverse("file-content", args=[2])
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(len(minio.get_requests), 3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                STORAGE_BACKEND="filesystem", STORAGE_DIRECTORY=directory
+            ):
+                response = self.check_file_serve_ranges()
+                url = reverse("file-content", args=[2])
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(response.status_code, 304)
+
+    @override_settings(FILE_SERVE_ACCEL_REDIRECT="/internal-file-content/")
+    def test_file_serve_accel_redirect(self):
+        response = self.client.get(reverse("file-content", args=[2]))
+        self.assertEqual(response["X-Accel-Redirect"], "/internal-file-content/2")
@@ -1,9 +1,10 @@
+import hashlib
 import json
 import logging
 from collections import defaultdict
 from io import BytesIO
 from pathlib import Path
-from typing import List, Tuple, Dict, Union, DefaultDict
+from typing import List, Tuple, Dict, Union, DefaultDict, Optional
 
 from django.core.serializers.json import DjangoJSONEncoder
 from minio.error import MinioException
@@ -44,28 +45,105 @@ class ElasticsearchMock:
             logger.warning("query: " + json.dumps(query, cls=DjangoJSONEncoder))
         raise RuntimeError(f"Query not found")
 
+    def msearch(self, body: List[dict], index=None, **kwargs):
+        """The multi search body alternates between the header with the index and the query"""
+        responses = [
+            self.search(index=header.get("index", index), body=query)
+            for header, query in zip(body[::2], body[1::2])
+        ]
+        return {"responses": responses}
+
+
+class MinioResponseMock(BytesIO):
+    """Mocks the urllib3 response minio returns, with the headers the storage needs"""
+
+    def __init__(self, data: bytes, content_type: str):
+        super().__init__(data)
+        self.headers = {"Content-Length": str(len(data)), "Content-Type": content_type}
+
+    def stream(self, chunk_size: int):
+        return iter(lambda: self.read(chunk_size), b"")
+
+    def release_conn(self):
+        pass
+
+
+class MinioObjectMock:
+    def __init__(
+        self,
+        object_name: str,
+        size: int = 0,
+        content_type: Optional[str] = None,
+        etag: Optional[str] = None,
+    ):
+        self.object_name = object_name
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = None
+
 
 class MinioMock:
     """Mocks a simple minio storage with a dict"""
 
     storage: DefaultDict[str, Dict[str, bytes]]
+    content_types: Dict[Tuple[str, str], str]
+    # The bucket, name, offset and length of every get_object call
+    get_requests: List[Tuple[str, str, int, int]]
 
     def __init__(self):
         self.storage = defaultdict(dict)
+        self.content_types = {}
+        self.get_requests = []
 
     # noinspection PyUnusedLocal
-    def put_object(self, bucket, object_name, data, *args, **kwargs):
+    def put_object(
+        self,
+        bucket,
+        object_name,
+        data,
+        *args,
+        content_type="application/octet-stream",
+        **kwargs,
+    ):
         self.storage[bucket][object_name] = data.read()
+        self.content_types[(bucket, object_name)] = content_type
 
     def fput_object(self, bucket: str, object_name: str, filepath: str):
         with open(filepath, "rb") as fp:
             self.storage[bucket][object_name] = fp.read()
 
-    def get_object(self, bucket: str, object_name: str):
+    def get_object(
+        self, bucket: str, object_name: str, offset: int = 0, length: int = 0
+    ):
+        self.get_requests.append((bucket, object_name, offset, length))
         if object_name in self.storage[bucket]:
-            return BytesIO(self.storage[bucket][object_name])
+            data = self.storage[bucket][object_name]
+            if length:
+                data = data[offset : offset + length]
+            else:
+                data = data[offset:]
+            content_type = self.content_types.get(
+                (bucket, object_name), "application/octet-stream"
+            )
+            return MinioResponseMock(data, content_type)
         else:
             raise MinioException(None)
 
+    def stat_object(self, bucket: str, object_name: str):
+        if object_name not in self.storage[bucket]:
+            raise MinioException(None)
+        data = self.storage[bucket][object_name]
+        content_type = self.content_types.get(
+            (bucket, object_name), "application/octet-stream"
+        )
+        etag = hashlib.md5(data).hexdigest()
+        return MinioObjectMock(object_name, len(data), content_type, etag)
+
     def remove_object(self, bucket: str, object_name: str):
-        del self.storage[bucket][object_name]
+        # Like minio, removing a missing object is not an error
+        self.storage[bucket].pop(object_name, None)
+
+    # noinspection PyUnusedLocal
+    def list_objects(self, bucket: str, *args, **kwargs):
+        return [MinioObjectMock(name) for name in self.storage[bucket]]
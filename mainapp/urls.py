@@ -19,9 +19,9 @@ urlpatterns = [
         name="search_autocomplete",
     ),
     re_path(
-        r"^search/results_only/(?P<query>.*)/$",
-        views.search_results_only,
-        name="search_results_only",
+        r"^search/api/(?P<query>.*)/$",
+        views.search_api,
+        name="search_api",
     ),
     path(
         "search/format_geo/<int:lat>,<int:lng>/",
@@ -69,6 +69,11 @@ urlpatterns = [
     path("profile/", profile_view, name="profile-home"),
     path("profile/delete/", profile_delete, name="profile-delete"),
     path("file-content/<int:id>", views.file_serve, name="file-content"),
+    path(
+        "file-preview/<int:id>/<str:kind>.jpg",
+        views.file_preview,
+        name="file-preview",
+    ),
     path("robots.txt", views.robots_txt, name="robots-txt"),
     path("sitemap.xml", views.sitemap_xml, name="sitemap-xml"),
     path("opensearch.xml", views.opensearch_xml, name="opensearch-xml"),
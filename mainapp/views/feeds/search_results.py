@@ -8,7 +8,7 @@ from django.utils.feedgenerator import Enclosure
 from django.utils.translation import gettext as _
 
 from mainapp.functions.search_notification_tools import params_to_human_string
-from mainapp.functions.search import search_string_to_params, MainappSearch, parse_hit
+from mainapp.functions.search import search_string_to_params, get_search, parse_hit
 from mainapp.models import Paper, File
 
 
@@ -29,7 +29,9 @@ class SearchResultsFeed(Feed):
 
     def items(self, query):
         params = search_string_to_params(query)
-        main_search = MainappSearch(params, limit=settings.SEARCH_PAGINATION_LENGTH)
+        main_search = get_search(
+            params, limit=settings.SEARCH_PAGINATION_LENGTH, cache=True
+        )
         executed = main_search.execute()
         results = [parse_hit(hit, highlighting=False) for hit in executed.hits]
         return results
@@ -6,7 +6,7 @@ import dateutil.parser
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.db.models import Count
-from django.http import JsonResponse, HttpResponse
+from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 from django.utils.http import urlencode
@@ -17,7 +17,7 @@ from pytz import timezone
 from slugify import slugify
 
 from mainapp.models import Meeting, Organization, AgendaItem, Person
-from mainapp.views.utils import build_map_object
+from mainapp.views.utils import build_map_object, json_response
 
 
 def calendar(request, init_view=None, init_date=None):
@@ -54,7 +54,9 @@ def calendar_data(request):
     if end.tzinfo is None or end.tzinfo.utcoffset(end) is None:
         end = local_time_zone.localize(end)
 
-    meetings = Meeting.objects.filter(start__gte=start, start__lte=end)
+    meetings = Meeting.objects.filter(start__gte=start, start__lte=end).only(
+        "id", "name", "start", "end", "cancelled"
+    )
     data = []
     for meeting in meetings:
         class_name = []
@@ -71,7 +73,7 @@ def calendar_data(request):
                 "className": class_name,
             }
         )
-    return JsonResponse(data, safe=False)
+    return json_response(data)
 
 
 def meeting(request, pk):
@@ -1,31 +1,38 @@
-import json
 import logging
+from typing import Any, Dict
 
 from csp.decorators import csp_update
 from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.core.signing import BadSignature
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render, redirect
 from django.template import loader
 from django.urls import reverse
 from django.utils.translation import gettext as _
 
+from mainapp.functions.autocomplete_index import get_autocomplete_index
 from mainapp.functions.geo_functions import latlng_to_address
 from mainapp.functions.search_notification_tools import params_are_subscribable
 from mainapp.functions.search import (
     search_string_to_params,
     MainappSearch,
+    get_search,
     parse_hit,
     params_to_search_string,
     DOCUMENT_TYPE_NAMES,
     autocomplete,
+    decode_cursor,
+    open_point_in_time,
 )
-from mainapp.models import Body, Organization, Person
+from mainapp.functions.search_cache import get_facet_labels
 from mainapp.views.utils import (
     handle_subscribe_requests,
     is_subscribed_to_search,
     build_map_object,
+    dumps_json,
     NeedsLoginError,
+    json_response,
 )
 
 logger = logging.getLogger(__name__)
@@ -44,6 +51,8 @@ def _search_to_context(query, main_search: MainappSearch, executed, results, req
         "total_hits": executed.hits.total,
         "subscribable": params_are_subscribable(main_search.params),
         "is_subscribed": is_subscribed_to_search(request.user, main_search.params),
+        "next_cursor": main_search.next_cursor(executed),
+        "document_types_json": dumps_json(DOCUMENT_TYPE_NAMES),
     }
 
     return context
@@ -53,7 +62,9 @@ def _search_to_context(query, main_search: MainappSearch, executed, results, req
 def search(request, query):
     params = search_string_to_params(query)
     normalized = params_to_search_string(params)
-    main_search = MainappSearch(params, limit=settings.SEARCH_PAGINATION_LENGTH)
+    main_search = get_search(
+        params, limit=settings.SEARCH_PAGINATION_LENGTH, cache=True
+    )
 
     for error in main_search.errors:
         messages.error(request, error)
@@ -73,31 +84,33 @@ def search(request, query):
     results = [parse_hit(hit) for hit in executed.hits]
 
     context = _search_to_context(normalized, main_search, executed, results, request)
-    context["new_facets"] = aggs_to_context(executed)
+    context["new_facets"] = aggs_to_context(executed, main_search.options)
 
     return render(request, "mainapp/search/search.html", context)
 
 
-def aggs_to_context(executed):
+def aggs_to_context(executed, options: Dict[str, Any]):
+    """Only the buckets elasticsearch returned are listed, with their names from the facet labels index"""
     new_facets_context = {}
-    org = settings.SITE_DEFAULT_ORGANIZATION
-    bucketing = {
-        "organization": Organization.objects.all(),
-        "person": Person.objects.filter(membership__organization=org).distinct(),
-    }
-    for aggs_field, queryset in bucketing.items():
-        aggs_count = 0
-        view_list = []
-        for db_object in queryset:
-            view_object = {"id": db_object.id, "name": db_object.name, "doc_count": 0}
-            setattr(db_object, "doc_count", 0)
-            for bucket in executed.facets[aggs_field]:
-                if bucket[0] == db_object.id:
-                    view_object["doc_count"] = bucket[1]
-                    aggs_count += 1
-                    break
-            view_list.append(view_object)
-        new_facets_context[aggs_field] = {"count": aggs_count, "list": view_list}
+    facet_labels = get_facet_labels()
+    for aggs_field in ["organization", "person"]:
+        names = facet_labels[aggs_field]
+        doc_counts = {}
+        for bucket in executed.facets[aggs_field]:
+            if bucket[0] in names:
+                doc_counts.setdefault(bucket[0], bucket[1])
+        view_list = [
+            {"id": object_id, "name": names[object_id], "doc_count": doc_count}
+            for object_id, doc_count in doc_counts.items()
+        ]
+        # The dropdown takes the label of the selected value from the list
+        selected = options.get(aggs_field)
+        if selected and selected.isdigit() and int(selected) not in doc_counts:
+            if int(selected) in names:
+                view_list.append(
+                    {"id": int(selected), "name": names[int(selected)], "doc_count": 0}
+                )
+        new_facets_context[aggs_field] = {"count": len(doc_counts), "list": view_list}
 
     searchable_document_types = []
     for doc_type, translated in DOCUMENT_TYPE_NAMES.items():
@@ -114,20 +127,55 @@ def aggs_to_context(executed):
     return new_facets_context
 
 
-def search_results_only(request, query):
-    """Returns only the result list items. Used for the endless scrolling"""
+def hit_to_json(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Only the fields the result list shows, without the empty ones. name, reference_number and highlight are
+    already escaped html with the <mark> tags of the highlighting
+    """
+    result = {
+        "type": parsed["type"],
+        "url": parsed["url"],
+        "name": parsed["name_escaped"],
+    }
+    optional = {
+        "reference_number": parsed["reference_number_escaped"],
+        "legal_date": parsed.get("legal_date"),
+        "display_date": parsed.get("display_date"),
+        "highlight": parsed.get("highlight"),
+        "thumbnail_url": parsed.get("thumbnail_url"),
+    }
+    result.update((key, value) for key, value in optional.items() if value)
+    return result
+
+
+def search_api(request, query):
+    """
+    The results as json for the facets and the endless scrolling, which passes the cursor of the previous page.
+    The browser renders the results itself (see SearchResults.js). The facets and the subscribe widget only
+    change with the query, so only the first page has them.
+    """
     params = search_string_to_params(query)
     normalized = params_to_search_string(params)
-    after = int(request.GET.get("after", 0))
-    main_search = MainappSearch(
-        params, offset=after, limit=settings.SEARCH_PAGINATION_LENGTH
+    search_after = pit_id = fuzzy = None
+    if "cursor" in request.GET:
+        try:
+            search_after, pit_id, fuzzy = decode_cursor(request.GET["cursor"])
+        except BadSignature:
+            return HttpResponseBadRequest("Invalid cursor")
+        if not pit_id:
+            pit_id = open_point_in_time()
+    main_search = get_search(
+        params,
+        limit=settings.SEARCH_PAGINATION_LENGTH,
+        cache=True,
+        search_after=search_after,
+        pit_id=pit_id,
+        fuzzy=fuzzy,
     )
 
     executed = main_search.execute()
     # The mocked results don't have a took value
     logger.debug("Elasticsearch query took {}ms".format(executed.to_dict().get("took")))
-    results = [parse_hit(hit) for hit in executed.hits]
-    context = _search_to_context(normalized, main_search, executed, results, request)
 
     assert executed.hits.total["relation"] in ["eq", "gte"]
 
@@ -136,68 +184,48 @@ def search_results_only(request, query):
         total_results = total_results.to_dict()
 
     result = {
-        "results": loader.render_to_string(
-            "mainapp/search/results_section.html", context, request
-        ),
-        "total_results": total_results,
-        "subscribe_widget": loader.render_to_string(
-            "partials/subscribe_widget.html", context, request
-        ),
-        "more_link": reverse(search_results_only, args=[normalized]),
-        # TOOD: Currently we need both because the js for the dropdown facet
-        # and document type facet hasn't been unified
-        "facets": executed.facets.to_dict(),
-        "new_facets": aggs_to_context(executed),
         "query": normalized,
+        "results": [hit_to_json(parse_hit(hit)) for hit in executed.hits],
+        "total_results": total_results,
+        "next_cursor": main_search.next_cursor(executed),
     }
+    if search_after is None:
+        context = {
+            "subscribable": params_are_subscribable(params),
+            "is_subscribed": is_subscribed_to_search(request.user, params),
+        }
+        result["subscribe_widget"] = loader.render_to_string(
+            "partials/subscribe_widget.html", context, request
+        )
+        result["new_facets"] = aggs_to_context(executed, main_search.options)
 
-    return JsonResponse(result, safe=False)
+    return json_response(result)
 
 
 def search_autocomplete(_, query):
-    if not settings.ELASTICSEARCH_ENABLED:
-        results = [{"name": _("search disabled"), "url": reverse("index")}]
-        return HttpResponse(json.dumps(results), content_type="application/json")
+    results = [
+        {"name": suggestion["name"], "url": suggestion["url"]}
+        for suggestion in get_autocomplete_index().suggest(query)
+    ]
+    urls = set(result["url"] for result in results)
 
-    response = autocomplete(query)
-
-    multibody = Body.objects.count() > 1
-
-    results = []
-    num_persons = num_organizations = 0
-    limit_per_type = 5
-
-    for hit in response.hits:
+    for hit in autocomplete(query).hits:
         doc_type = hit.meta.index.split("-")[-1]
-        if doc_type == "person":
-            if num_persons < limit_per_type:
-                results.append(
-                    {"name": hit.name, "url": reverse("person", args=[hit.id])}
-                )
-                num_persons += 1
-        elif doc_type == "organization":
-            if num_organizations < limit_per_type:
-                if multibody and hit.body:
-                    name = hit.name + " (" + hit.body.name + ")"
-                else:
-                    name = hit.name
-                results.append(
-                    {"name": name, "url": reverse("organization", args=[hit.id])}
-                )
-                num_organizations += 1
-        elif doc_type in ["file", "paper", "meeting"]:
-            name = hit.name
-            results.append({"name": name, "url": reverse(doc_type, args=[hit.id])})
+        if doc_type in ["file", "paper", "meeting"]:
+            url = reverse(doc_type, args=[hit.id])
+            # A paper can also be found by its reference number
+            if url not in urls:
+                results.append({"name": hit.name, "url": url})
         else:
             logger.error(
                 "Unknown document type in elastic search response: %s"
                 % hit.meta.doc_type
             )
 
-    return JsonResponse(results, safe=False)
+    return json_response(results)
 
 
 def search_format_geo(_, lat, lng):
-    return JsonResponse(
-        {"lat": lat, "lng": lng, "formatted": latlng_to_address(lat, lng)}, safe=False
+    return json_response(
+        {"lat": lat, "lng": lng, "formatted": latlng_to_address(lat, lng)}
     )
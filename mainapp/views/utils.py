@@ -1,14 +1,32 @@
 import json
-from typing import Optional, List, Dict, Any
+import re
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 
 from django.conf import settings
 from django.contrib import messages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
 from django.utils.translation import gettext as _
 
+from mainapp.functions.storage import StoredObject
 from mainapp.models import UserAlert, Body, Paper
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+range_re = re.compile(r"^bytes=(\d*)-(\d*)$")
+
 
 class NeedsLoginError(Exception):
     def __init__(self, redirect_url):
@@ -48,6 +66,7 @@ def index_papers_to_geodata(papers: List[Paper]) -> Dict[str, Any]:
                         "id": file.id,
                         "name": file.name,
                         "url": reverse("file", args=[file.id]),
+                        "thumbnail_url": file.get_thumbnail_url(),
                     }
                 )
 
@@ -121,4 +140,117 @@ def build_map_object(body: Optional[Body] = None, geo_papers=None):
     if geo_papers:
         map_obj["documents"] = index_papers_to_geodata(geo_papers)
 
-    return json.dumps(map_obj)
+    return dumps_json(map_obj)
+
+
+def dumps_json(data: Any) -> str:
+    """
+    Compact json, written by orjson if it's installed (the fast-json extra), which is several times faster than the
+    json module. Both write the same: Integer keys become strings and the dates are formatted by DjangoJSONEncoder.
+    """
+    if orjson:
+        return orjson.dumps(
+            data,
+            default=DjangoJSONEncoder().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        ).decode()
+    return json.dumps(
+        data, cls=DjangoJSONEncoder, separators=(",", ":"), ensure_ascii=False
+    )
+
+
+def json_response(data: Any) -> HttpResponse:
+    """Like JsonResponse, but with dumps_json, for the search, calendar and map endpoints"""
+    return HttpResponse(dumps_json(data), content_type="application/json")
+
+
+def parse_range_header(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns start and exclusive end of a single byte range, or None for anything else, e.g. multiple ranges,
+    in which case the whole file is sent. Raises a ValueError if the range can't be satisfied.
+    """
+    match = range_re.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # The last n bytes
+        if int(end) == 0:
+            raise ValueError(header)
+        return max(size - int(end), 0), size
+    if int(start) >= size or (end and int(end) < int(start)):
+        raise ValueError(header)
+    if not end:
+        return int(start), size
+    return int(start), min(int(end) + 1, size)
+
+
+class ClosingIterator:
+    """Closes the stored object once django is done with the streaming response, also on aborted requests"""
+
+    def __init__(self, stored: StoredObject, chunks: Iterable[bytes]):
+        self.stored = stored
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.stored.close()
+
+
+def serve_stored_object(
+    request: HttpRequest, stored: StoredObject, max_age: int
+) -> HttpResponse:
+    """
+    Streams an object from the storage with support for conditional requests and single byte ranges,
+    which pdf.js uses to load only the pages it shows. Closes the object.
+    """
+    last_modified = None
+    if stored.last_modified:
+        last_modified = int(stored.last_modified.timestamp())
+
+    response = get_conditional_response(
+        request, etag=stored.etag, last_modified=last_modified
+    )
+    byte_range = None
+    if response is None and request.META.get("HTTP_RANGE"):
+        # Only send a part if the client has the same version of the rest
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if (
+            not if_range
+            or if_range == stored.etag
+            or (last_modified and parse_http_date_safe(if_range) == last_modified)
+        ):
+            try:
+                byte_range = parse_range_header(request.META["HTTP_RANGE"], stored.size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stored.size}"
+
+    if response is not None:
+        stored.close()
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            ClosingIterator(stored, stored.stream_range(start, end)), status=206
+        )
+        response["Content-Range"] = f"bytes {start}-{end - 1}/{stored.size}"
+        response["Content-Length"] = end - start
+    elif stored.local_path:
+        # The wsgi server can send a real file with sendfile
+        response = FileResponse(open(stored.local_path, "rb"))
+        stored.close()
+    else:
+        response = StreamingHttpResponse(ClosingIterator(stored, stored.stream()))
+        response["Content-Length"] = stored.size
+
+    if response.status_code in [200, 206]:
+        response["Content-Type"] = stored.content_type or "application/octet-stream"
+    response["Accept-Ranges"] = "bytes"
+    if stored.etag:
+        response["ETag"] = stored.etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
@@ -4,19 +4,24 @@ from csp.decorators import csp_update
 from django.conf import settings
 from django.conf.urls.static import static
 from django.db.models import Q, Count
-from django.http import HttpRequest
+from django.http import HttpRequest, Http404
 from django.http import StreamingHttpResponse
+from django.http.response import HttpResponseBase
 from django.shortcuts import render, get_object_or_404
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import html
 from django.utils import timezone
 from django.views.generic import DetailView
+from requests import HTTPError
 from urllib.parse import quote
 
 from importer.functions import requests_get
-from mainapp.functions.minio import minio_client, minio_file_bucket
+from mainapp.functions.file_previews import get_preview_object_name, preview_kinds
+from mainapp.functions.file_proxy import get_cached_file
+from mainapp.functions.minio import minio_file_bucket, minio_cache_bucket
 from mainapp.functions.search import DOCUMENT_TYPE_NAMES_PL
+from mainapp.functions.storage import StorageException, get_storage
 from mainapp.models import (
     Body,
     File,
@@ -30,7 +35,7 @@ from mainapp.models import (
 from mainapp.models.organization import ORGANIZATION_TYPE_NAMES_PLURAL
 from mainapp.models.organization_type import OrganizationType
 from mainapp.views import person_grid_context, HttpResponse, DOCUMENT_TYPE_NAMES
-from mainapp.views.utils import build_map_object
+from mainapp.views.utils import build_map_object, serve_stored_object
 
 logger = logging.getLogger(__name__)
 
@@ -227,31 +232,74 @@ def file(request, pk, context_meeting_id=None):
     return render(request, "mainapp/file/file.html", context)
 
 
-def file_serve_proxy(
-    request: HttpRequest, original_file_id: int
-) -> StreamingHttpResponse:
+def file_serve_proxy(request: HttpRequest, original_file_id: str) -> HttpResponseBase:
     """Ensure that the file is not deleted in the database"""
     get_object_or_404(File, id=original_file_id)
 
     """ Util to proxy back to the original RIS in case we don't want to download all the files """
+    if settings.PROXY_ONLY_CACHE:
+        # On a miss, the file is streamed from the RIS below while it's downloaded into the cache in the background
+        try:
+            stored_file = get_cached_file(original_file_id)
+        except StorageException as e:
+            logger.warning(f"File proxy cache for {original_file_id} failed: {e}")
+            stored_file = None
+
+        if stored_file:
+            return serve_stored_object(request, stored_file, max_age=3600)
+
     url = settings.PROXY_ONLY_TEMPLATE.format(original_file_id)
 
-    response = requests_get(url, stream=True)
+    try:
+        response = requests_get(url, stream=True)
+    except HTTPError as e:
+        # Errors of the RIS such as 404 are passed on
+        response = e.response
     return StreamingHttpResponse(
-        response.iter_content(chunk_size=None), status=response.status_code
+        response.iter_content(chunk_size=None),
+        status=response.status_code,
+        content_type=response.headers.get("Content-Type"),
     )
 
 
 def file_serve(request, id):
-    logger.warning("Serving media files through django is slow")
+    # Ensure that the file is not deleted in the database
+    file = get_object_or_404(File, id=id)
+
+    if settings.FILE_SERVE_ACCEL_REDIRECT:
+        # nginx does the actual transfer from minio or the storage directory
+        response = HttpResponse(content_type=file.mime_type)
+        response["X-Accel-Redirect"] = settings.FILE_SERVE_ACCEL_REDIRECT + str(file.id)
+    else:
+        logger.warning("Serving media files through django is slow")
+        try:
+            stored_file = get_storage().get_object(minio_file_bucket, str(id))
+        except StorageException:
+            raise Http404
+        # The files rarely change and can be revalidated cheaply with the etag
+        response = serve_stored_object(request, stored_file, max_age=3600)
 
-    """ Ensure that the file is not deleted in the database """
-    get_object_or_404(File, id=id)
+    if settings.SITE_SEO_NOINDEX:
+        response["X-Robots-Tag"] = "noindex"
+
+    return response
 
-    minio_file = minio_client().get_object(minio_file_bucket, str(id))
-    response = HttpResponse(minio_file.read())
 
-    response["Content-Type"] = minio_file.headers["Content-Type"]
+def file_preview(request, id, kind):
+    """Serves the images of the first page from the private cache bucket"""
+    file = get_object_or_404(File, id=id)
+    if kind not in preview_kinds or not file.preview_available:
+        raise Http404
+
+    try:
+        with get_storage().get_object(
+            minio_cache_bucket, get_preview_object_name(file.id, kind)
+        ) as preview:
+            response = HttpResponse(preview.read(), content_type="image/jpeg")
+    except StorageException:
+        raise Http404
+    # The previews only change when the file changes, which is rare
+    response["Cache-Control"] = "public, max-age=86400"
 
     if settings.SITE_SEO_NOINDEX:
         response["X-Robots-Tag"] = "noindex"
@@ -165,6 +165,15 @@ MINIO_HOST = env.str("MINIO_HOST", "localhost:9000")
 MINIO_ACCESS_KEY = env.str("MINIO_ACCESS_KEY", "meinestadttransparent")
 MINIO_SECRET_KEY = env.str("MINIO_SECRET_KEY", "meinestadttransparent")
 
+# Valid values for STORAGE_BACKEND: minio, filesystem
+STORAGE_BACKEND = env.str("STORAGE_BACKEND", "minio").lower()
+if STORAGE_BACKEND not in ["minio", "filesystem"]:
+    raise ValueError("Unknown storage backend: " + STORAGE_BACKEND)
+# Where the filesystem backend keeps the files, the cache and the pgp keys
+STORAGE_DIRECTORY = env.str("STORAGE_DIRECTORY", os.path.join(BASE_DIR, "storage"))
+# If set, e.g. to /internal-file-content/, the files are sent by nginx using X-Accel-Redirect with this prefix
+FILE_SERVE_ACCEL_REDIRECT = env.str("FILE_SERVE_ACCEL_REDIRECT", None)
+
 # When webpack compiles, it replaces the stats file contents with a compiling placeholder.
 # If debug is False and the stats file is in the project root, this leads to a WebpackLoaderBadStatsError.
 # So we place the file besides the assets, so it will be copied over by collectstatic
@@ -201,6 +210,51 @@ if not ELASTICSEARCH_PREFIX.islower():
 ELASTICSEARCH_LANG = env.str("ELASTICSEARCH_LANG", "german")
 ELASTICSEARCH_QUERYSET_PAGINATION = env.int("ELASTICSEARCH_QUERYSET_PAGINATION", 50)
 
+# The cache must be shared by the web workers and the importers, so that the importers can invalidate the cached
+# search results. The file based cache does that on a single node; use e.g. redis or memcached for multiple nodes.
+# Django's default of 300 entries would make the file based cache delete a third of its files all the time
+if TESTING:
+    CACHES = {"default": env.cache_url("CACHE_URL", "locmemcache://")}
+else:
+    CACHES = {
+        "default": env.cache_url(
+            "CACHE_URL",
+            "filecache://"
+            + os.path.join(BASE_DIR, "cache", "django")
+            + "?max_entries=100000",
+        )
+    }
+
+# How many seconds search results are cached, 0 disables the cache. Imports invalidate the cache anyway.
+SEARCH_CACHE_TIMEOUT = env.int("SEARCH_CACHE_TIMEOUT", 10 * 60)
+# Outdated results are kept for that long and served when elasticsearch fails
+SEARCH_CACHE_STALE_TIMEOUT = env.int("SEARCH_CACHE_STALE_TIMEOUT", 24 * 60 * 60)
+# Serve outdated results right away and refresh them in the background
+SEARCH_CACHE_STALE_WHILE_REVALIDATE = env.bool(
+    "SEARCH_CACHE_STALE_WHILE_REVALIDATE", False
+)
+# Keep alive in seconds for the point in time behind the endless scrolling cursors, 0 to page without one
+SEARCH_POINT_IN_TIME = env.int("SEARCH_POINT_IN_TIME", 0)
+# The highlighted fields. Only the first highlight of a result is shown, so one fragment is enough
+SEARCH_HIGHLIGHT_FIELDS = env.list(
+    "SEARCH_HIGHLIGHT_FIELDS",
+    default=["name", "reference_number", "description", "parsed_text"],
+)
+SEARCH_HIGHLIGHT_FRAGMENTS = env.int("SEARCH_HIGHLIGHT_FRAGMENTS", 1)
+# Needs the term vectors of parsed_text, so the file text index must have been built with the current mapping
+SEARCH_HIGHLIGHT_FVH = env.bool("SEARCH_HIGHLIGHT_FVH", True)
+# The parsed texts are searched in their own index, and this many of the best matching files are joined with the
+# other results. Must stay below the maximum number of clauses of elasticsearch (1024)
+SEARCH_FILE_TEXT_LIMIT = env.int("SEARCH_FILE_TEXT_LIMIT", 500)
+# Above this number, the search shows "Over ..." instead of counting all hits
+SEARCH_TRACK_TOTAL_HITS = env.int("SEARCH_TRACK_TOTAL_HITS", 1000)
+# The fuzzy query only runs when the exact query found less hits than this
+SEARCH_FUZZY_THRESHOLD = env.int("SEARCH_FUZZY_THRESHOLD", 10)
+# Searches taking longer than this many milliseconds are written to search-slow.log, 0 disables the log
+SEARCH_SLOW_QUERY_THRESHOLD = env.int("SEARCH_SLOW_QUERY_THRESHOLD", 1000)
+# The notifications send their searches to elasticsearch in multi searches of this many searches
+SEARCH_MULTI_SEARCH_SIZE = env.int("SEARCH_MULTI_SEARCH_SIZE", 50)
+
 # Valid values for GEOEXTRACT_ENGINE: Nominatim, Opencage, Mapbox
 GEOEXTRACT_ENGINE = env.str("GEOEXTRACT_ENGINE", "Nominatim").lower()
 if GEOEXTRACT_ENGINE not in ["nominatim", "mapbox", "opencage"]:
@@ -211,6 +265,18 @@ if GEOEXTRACT_ENGINE == "opencage":
 
 NOMINATIM_URL = env.str("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
 
+# Requests per second for each geocoder. The public Nominatim allows only one request per second
+GEOCODING_RATE_LIMITS = {
+    "nominatim": env.float("GEOCODING_RATE_LIMIT_NOMINATIM", 1),
+    "opencage": env.float("GEOCODING_RATE_LIMIT_OPENCAGE", 1),
+    "mapbox": env.float("GEOCODING_RATE_LIMIT_MAPBOX", 10),
+}
+# How long found and not found addresses are cached
+GEOCODING_CACHE_DAYS = env.int("GEOCODING_CACHE_DAYS", 180)
+GEOCODING_CACHE_NEGATIVE_DAYS = env.int("GEOCODING_CACHE_NEGATIVE_DAYS", 14)
+# Coordinates are rounded to this many degrees for caching reverse geocoding, 0.0005° are about 50m
+REVERSE_GEOCODING_GRID = env.float("REVERSE_GEOCODING_GRID", 0.0005)
+
 # Settings for Geo-Extraction
 GEOEXTRACT_SEARCH_COUNTRY = env.str("GEOEXTRACT_SEARCH_COUNTRY", "Deutschland")
 GEOEXTRACT_LANGUAGE = env.str("GEOEXTRACT_LANGUAGE", LANGUAGE_CODE.split("-")[0])
@@ -230,7 +296,29 @@ CITY_AFFIXES = env.list(
 DISTRICT_REGEX = env.str("DISTRICT_REGEX", r"(^| )kreis|kreis( |$)")
 
 TEXT_CHUNK_SIZE = env.int("TEXT_CHUNK_SIZE", 1024 * 1024)
+TEXT_CHUNK_OVERLAP = env.int("TEXT_CHUNK_OVERLAP", 1000)
+
+# Where the prebuilt address pipeline for the location extraction is persisted
+GEOEXTRACT_CACHE_DIRECTORY = env.str(
+    "GEOEXTRACT_CACHE_DIRECTORY", Path(__file__).parent.parent.parent.joinpath("cache")
+)
 
+# Failed file downloads are retried after FILE_DOWNLOAD_RETRY_DELAY seconds, doubling with every failure
+FILE_DOWNLOAD_RETRY_DELAY = env.int("FILE_DOWNLOAD_RETRY_DELAY", 60 * 60)
+FILE_DOWNLOAD_MAX_RETRY_DELAY = env.int(
+    "FILE_DOWNLOAD_MAX_RETRY_DELAY", 30 * 24 * 60 * 60
+)
+# Files of meetings in the next days and of papers from the last days are downloaded first
+FILE_DOWNLOAD_PRIORITY_DAYS = env.int("FILE_DOWNLOAD_PRIORITY_DAYS", 14)
+
+# Valid values for OCR_BACKEND: azure, tesseract
+OCR_BACKEND = env.str("OCR_BACKEND", "azure").lower()
+if OCR_BACKEND not in ["azure", "tesseract"]:
+    raise ValueError("Unknown OCR backend: " + OCR_BACKEND)
+OCR_RESOLUTION = env.int("OCR_RESOLUTION", 300)
+# How many pages of a file are rasterized and recognized at the same time
+OCR_CONCURRENCY = env.int("OCR_CONCURRENCY", 4)
+OCR_TESSERACT_LANGUAGE = env.str("OCR_TESSERACT_LANGUAGE", "deu")
 OCR_AZURE_KEY = env.str("OCR_AZURE_KEY", None)
 OCR_AZURE_LANGUAGE = env.str("OCR_AZURE_LANGUAGE", "de")
 OCR_AZURE_API = env.str(
@@ -272,6 +360,10 @@ EMBED_PARSED_TEXT_FOR_SCREENREADERS = env.bool(
     "EMBED_PARSED_TEXT_FOR_SCREENREADERS", True
 )
 
+# Widths in pixels of the images of the first page of pdfs, which are shown instead of the pdf viewer on small screens
+FILE_THUMBNAIL_WIDTH = env.int("FILE_THUMBNAIL_WIDTH", 200)
+FILE_PREVIEW_WIDTH = env.int("FILE_PREVIEW_WIDTH", 800)
+
 SEARCH_PAGINATION_LENGTH = 20
 
 SENTRY_DSN = env.str("SENTRY_DSN", None)
@@ -366,6 +458,7 @@ LOGGING = {
     "formatters": {
         "extended": {"format": "%(asctime)s %(levelname)-8s %(name)-12s %(message)s"},
         "with_time": {"format": "%(asctime)s %(message)s"},
+        "message": {"format": "%(message)s"},
     },
     "handlers": {
         "console": {"class": "logging.StreamHandler", "formatter": "with_time"},
@@ -373,9 +466,16 @@ LOGGING = {
         "django-error": make_handler("django-error.log", "WARNING"),
         "importer": make_handler("importer.log"),
         "importer-error": make_handler("importer-error.log", "WARNING"),
+        # One json object per line, which `./manage.py search --replay` can read
+        "search-slow": {**make_handler("search-slow.log"), "formatter": "message"},
     },
     "filters": {"warnings-filters": {"()": WarningsFilter}},
     "loggers": {
+        "mainapp.slow_search": {
+            "handlers": ["search-slow"],
+            "level": "INFO",
+            "propagate": False,
+        },
         "mainapp": {
             "handlers": ["console", "django-error", "django"],
             "level": MAINAPP_LOG_LEVEL or "INFO",
@@ -440,6 +540,10 @@ WAGTAIL_SITE_NAME = SITE_NAME
 
 # Workaround to avoid filling up disk space
 PROXY_ONLY_TEMPLATE = env.str("PROXY_ONLY_TEMPLATE", None)
+# Keep the files that are viewed through the proxy in the cache bucket and revalidate them after that many seconds.
+# Off by default, because the cache isn't limited and eventually holds every file that was viewed once
+PROXY_ONLY_CACHE = env.bool("PROXY_ONLY_CACHE", False)
+PROXY_ONLY_CACHE_REVALIDATE = env.int("PROXY_ONLY_CACHE_REVALIDATE", 24 * 60 * 60)
 
 DEBUG_TOOLBAR_ACTIVE = False
 DEBUG_TESTING = env.bool("DEBUG_TESTING", False)